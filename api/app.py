@@ -1,6 +1,5 @@
 import os
 import json
-import subprocess
 import jwt
 import requests
 import pymssql
@@ -11,12 +10,20 @@ import threading
 import logging
 import re
 
-from flask import Flask, jsonify, request
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.compute import ComputeManagementClient
+from flask import Flask, jsonify, request, g
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from flask_caching import Cache
-from azure.keyvault.secrets import SecretClient
+from azure_clients import get_secret_client, get_compute_client
+from auth_cache import JwksKeyStore, VerifiedTokenCache
+from db_pool import ConnectionPool
+from remote_ssh import SshConnectionManager, SshKeyCache
+from remote_provisioning import provision_user, deprovision_user, activate_staged_user, summarize_steps
+from preprovisioning import PreProvisioner
+from scaling import PowerOperationExecutor, POWER_ON, POWER_OFF, DEALLOCATE, OPERATION_SUCCEEDED, OPERATION_FAILED, TRANSITIONAL_POWER_STATES, CONFIRMED_POWER_STATES, REVERTED_POWER_STATES, summarize_outcomes
+from reconciliation import PowerStateReconciler
+from forecast import DemandForecaster
+from checkout_jobs import CheckoutJobStore, PENDING, STARTING, PROVISIONING, SUCCEEDED, FAILED, FINAL_STATUSES
 from config import *
 
 # ===============================
@@ -25,7 +32,41 @@ from config import *
 app = Flask(__name__)
 app.config['VERSION'] = '0.155'
 
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+cache = Cache(app, config={
+    'CACHE_TYPE': CACHE_TYPE,
+    'CACHE_DIR': CACHE_DIR,
+    'CACHE_REDIS_URL': CACHE_REDIS_URL,
+    'CACHE_DEFAULT_TIMEOUT': 300
+})
+
+jwks_store = JwksKeyStore(
+    JWKS_URI,
+    ttl=JWKS_CACHE_TTL,
+    unknown_kid_ttl=JWKS_UNKNOWN_KID_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL
+)
+
+verified_token_cache = VerifiedTokenCache(max_size=VERIFIED_TOKEN_CACHE_SIZE)
+
+ssh_key_cache = SshKeyCache(
+    lambda: retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME),
+    key_dir=SSH_KEY_DIR,
+    refresh_interval=SSH_KEY_REFRESH_INTERVAL
+)
+
+ssh_manager = SshConnectionManager(
+    "avdadmin",
+    DOMAIN_NAME,
+    ssh_key_cache,
+    control_dir=SSH_CONTROL_DIR,
+    idle_timeout=SSH_IDLE_TIMEOUT,
+    connect_timeout=SSH_CONNECT_TIMEOUT
+)
+
+REMOTE_USER_GROUPS = ["tsusers", "appusers"]
+
+SCALE_DOWN_ACTIONS = {"poweroff": POWER_OFF, "deallocate": DEALLOCATE}
+SCALE_DOWN_POLICIES = ("health", "idle")
 
 # ===============================
 # Logging Configuration
@@ -39,66 +80,115 @@ logger = logging.getLogger(__name__)
 def retrieve_db_password_from_key_vault():
     global db_password
     try:
-        credential = DefaultAzureCredential()
-        secret_client = SecretClient(vault_url=VAULT_URL, credential=credential)
-        secret = secret_client.get_secret(DB_PASSWORD_NAME)
+        secret = get_secret_client(VAULT_URL).get_secret(DB_PASSWORD_NAME)
         db_password = secret.value
     except Exception as e:
         print("Error retrieving password from Key Vault: %s", e)
         db_password = None
 
-def get_db_connection():
+def create_db_connection():
     global db_password
     if db_password is None:
         retrieve_db_password_from_key_vault()
         if db_password is None:
-            print("Cannot connect to database without a password.")
-            return None
+            raise RuntimeError("Cannot connect to database without a password.")
     try:
-        conn = pymssql.connect(
+        return pymssql.connect(
             server=DB_SERVER,
             user=DB_USERNAME,
             password=db_password,
             database=DB_DATABASE
         )
-        return conn
-    except pymssql.Error as e:
+    except pymssql.Error:
+        # The password may have been rotated in Key Vault since we last read it
+        previous_password = db_password
+        retrieve_db_password_from_key_vault()
+        if db_password is None or db_password == previous_password:
+            raise
+        db_pool.invalidate()
+        return pymssql.connect(
+            server=DB_SERVER,
+            user=DB_USERNAME,
+            password=db_password,
+            database=DB_DATABASE
+        )
+
+def get_db_connection():
+    try:
+        return db_pool.acquire()
+    except Exception as e:
         print("Error connecting to database: %s", e)
         return None
 
 def refresh_db_password(interval=3600):
     while True:
         time.sleep(interval)
+        previous_password = db_password
         retrieve_db_password_from_key_vault()
+        if db_password is not None and db_password != previous_password:
+            db_pool.invalidate()
+
+db_pool = ConnectionPool(
+    create_db_connection,
+    max_size=DB_POOL_MAX_SIZE,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+    health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL
+)
+
+checkout_jobs = CheckoutJobStore(
+    cache,
+    ttl=CHECKOUT_JOB_TTL,
+    max_workers=CHECKOUT_JOB_CONCURRENCY
+)
+
+# Checkout jobs live in the cache, so with a per-process cache a poll that lands on another worker finds no job
+# and the broker agent retries into a second checkout
+if CACHE_TYPE in ('SimpleCache', 'NullCache'):
+    logger.warning(
+        "CACHE_TYPE '%s' is not shared between workers. Asynchronous checkout jobs are only visible to the worker "
+        "that created them; use FileSystemCache or RedisCache when running more than one worker.", CACHE_TYPE
+    )
+
+power_operations = PowerOperationExecutor(
+    max_workers=SCALING_CONCURRENCY,
+    operation_timeout=SCALING_OPERATION_TIMEOUT
+)
+
+power_state_reconciler = PowerStateReconciler(
+    transition_grace_minutes=POWER_STATE_TRANSITION_GRACE_MINUTES
+)
+
+demand_forecaster = DemandForecaster(
+    get_db_connection,
+    history_days=SCALING_FORECAST_HISTORY_DAYS,
+    bucket_minutes=SCALING_FORECAST_BUCKET_MINUTES,
+    lead_minutes=SCALING_FORECAST_LEAD_MINUTES,
+    quantile=SCALING_FORECAST_QUANTILE,
+    refresh_interval=SCALING_FORECAST_REFRESH_INTERVAL,
+    time_zone=SCALING_FORECAST_TIME_ZONE
+)
+
+pre_provisioner = PreProvisioner(
+    ssh_manager,
+    get_db_connection,
+    cache,
+    REMOTE_USER_GROUPS,
+    interval=PREPROVISIONING_INTERVAL,
+    concurrency=PREPROVISIONING_CONCURRENCY,
+    affinity_days=PREPROVISIONING_AFFINITY_DAYS
+)
 
 def retrieve_pem_key_from_key_vault(vault_url, key_name):
-    credential = DefaultAzureCredential()
-    secret_client = SecretClient(vault_url=vault_url, credential=credential)
-    secret = secret_client.get_secret(key_name)
-    pem_key = secret.value.replace('\\n', '\n').replace('\\', '')
-    pem_file_path = '/tmp/private_key.pem'
-    required_permissions = 0o600
-
-    if not os.path.exists(pem_file_path):
-        try:
-            with open(pem_file_path, 'w') as pem_file:
-                pem_file.write(pem_key)
-            os.chmod(pem_file_path, required_permissions)
-        except Exception as e:
-            print("Failed to write PEM key to file: %s", e)
-            raise
-    else:
-        current_permissions = oct(os.stat(pem_file_path).st_mode & 0o777)
-        if int(current_permissions, 8) != required_permissions:
-            try:
-                os.chmod(pem_file_path, required_permissions)
-            except Exception as e:
-                print("Failed to update permissions for %s: %s", pem_file_path, e)
-                raise
-
-    return pem_file_path
+    secret = get_secret_client(vault_url).get_secret(key_name)
+    return secret.value.replace('\\n', '\n').replace('\\', '')
 
 def get_access_token(tenant_id, client_id, client_secret):
+    cache_key = f"graph_access_token:{tenant_id}:{client_id}"
+    access_token = cache.get(cache_key)
+    if access_token:
+        return access_token
+
     url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
     headers = {
         "Content-Type": "application/x-www-form-urlencoded"
@@ -110,34 +200,232 @@ def get_access_token(tenant_id, client_id, client_secret):
         "grant_type": "client_credentials"
     }
     
-    response = requests.post(url, headers=headers, data=data)
+    response = requests.post(url, headers=headers, data=data, timeout=10)
     if response.status_code == 200:
-        return response.json().get("access_token")
+        token_response = response.json()
+        access_token = token_response.get("access_token")
+        expires_in = int(token_response.get("expires_in", 0))
+        if access_token and expires_in > GRAPH_TOKEN_REFRESH_MARGIN:
+            cache.set(cache_key, access_token, timeout=expires_in - GRAPH_TOKEN_REFRESH_MARGIN)
+        return access_token
     else:
         response.raise_for_status()
 
-def create_or_update_remote_user(hostname: str, username: str, password: str) -> bool:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
+def provision_remote_user(hostname: str, username: str, password: str, groups: list) -> dict:
+    outcome = provision_user(ssh_manager, hostname, username, password, groups)
+    if outcome["success"]:
+        logger.info("Provisioned user '%s' on VM '%s': %s", username, hostname, summarize_steps(outcome))
+    else:
+        logger.error("Failed to provision user '%s' on VM '%s': %s (steps: %s)", username, hostname, outcome.get("error"), outcome["steps"])
+    return outcome
+
+def activate_remote_user(hostname: str, username: str, password: str) -> dict:
+    outcome = activate_staged_user(ssh_manager, hostname, username, password)
+    if outcome["success"]:
+        logger.info("Activated pre-staged user '%s' on VM '%s': %s", username, hostname, summarize_steps(outcome))
+    else:
+        logger.warning("Pre-staged user '%s' on VM '%s' could not be activated, provisioning in full: %s", username, hostname, outcome.get("error"))
+    return outcome
+
+def claim_vm(username: str, avdhost: str):
+    preferred_vmid = pre_provisioner.staged_vm_for(username) if PREPROVISIONING_ENABLED else None
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor(as_dict=True) as cursor:
+            cursor.callproc('CheckoutVm', (username, avdhost, preferred_vmid, WAKE_ON_DEMAND_ENABLED))
+            rows = cursor.fetchall()
+            conn.commit()
+    finally:
+        conn.close()
+
+    if not rows or 'Message' in rows[0]:
+        return None
+    return rows[0]
+
+def is_vm_waking(vm: dict) -> bool:
+    # A VM woken on demand is checked out while it is still starting
+    return vm.get('PowerState') == 'Starting'
 
+def mark_woken_vm_reachable(vmid: int):
+    # Azure reports a VM running before it accepts SSH, so a woken VM is only marked 'On' once it has been reached
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed.")
     try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        check_create_user_command = f"sudo id -u {username} >/dev/null 2>&1 || sudo useradd {username} -m"
-        set_password_command = f"echo '{username}:{password}' | sudo chpasswd"
-        command = f"{check_create_user_command} && {set_password_command}"
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "EXEC UpdateVmAttributes @VMID = %s, @PowerState = %s, @NetworkStatus = %s",
+                (vmid, 'On', 'Reachable')
+            )
+            conn.commit()
+    finally:
+        conn.close()
 
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, command],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            return True
-        else:
-            print("Failed to create or update user '%s' on VM '%s'. Error: %s", username, host_fqdn, result.stderr)
-            return False
+def release_woken_vm(vmid: int):
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("EXEC ReturnVm @VMID = %s", (vmid,))
+            conn.commit()
+    finally:
+        conn.close()
+
+def record_wake_operation(outcome: dict):
+    # A started VM stays 'Starting' until it is reachable, see mark_woken_vm_reachable
+    if outcome["Status"] == OPERATION_FAILED:
+        # Give the VM back so the user's next attempt can claim another one
+        logger.error("Failed to wake VM '%s' for checkout, returning it: %s", outcome["VMName"], outcome.get("Error"))
+        record_power_operation(outcome)
+        release_woken_vm(outcome["VMID"])
+
+def start_woken_vm(vm: dict, wait_timeout=0):
+    # Started through the power operation executor so the result is recorded like a scaling one
+    compute_client = get_compute_client(VM_SUBSCRIPTION_ID, AZURE_COMPUTE_BACKEND)
+    action = {"VMID": vm["VMID"], "VMName": vm["Hostname"], "ActionType": POWER_ON}
+    completed, _ = power_operations.execute(
+        compute_client,
+        VM_RESOURCE_GROUP,
+        [action],
+        record_wake_operation,
+        lambda outcomes: None,
+        wait_timeout=wait_timeout
+    )
+    return completed[0] if completed else None
+
+def provision_checked_out_vm(hostname: str, username: str, password: str) -> dict:
+    provisioning = None
+    if PREPROVISIONING_ENABLED:
+        is_staged = pre_provisioner.is_staged(hostname, username)
+        pre_provisioner.mark_checked_out(hostname, username)
+        if is_staged:
+            # The account already exists and is locked, only the password needs to be set
+            provisioning = activate_remote_user(hostname, username, password)
+
+    if provisioning is None or not provisioning["success"]:
+        provisioning = provision_remote_user(hostname, username, password, REMOTE_USER_GROUPS)
+    return provisioning
+
+def run_checkout_job(job: dict, password: str) -> dict:
+    provisioning = provision_checked_out_vm(job["Hostname"], job["Username"], password)
+    if not provisioning["success"]:
+        return {
+            "Status": FAILED,
+            "Error": f"Failed to provision user '{job['Username']}' on VM '{job['Hostname']}'.",
+            "Provisioning": summarize_steps(provisioning)
+        }
+    return {
+        "Status": SUCCEEDED,
+        "password": password,
+        "Provisioning": summarize_steps(provisioning)
+    }
+
+def run_wake_checkout_job(job: dict, password: str, wake_requested: bool) -> dict:
+    deadline = time.monotonic() + WAKE_ON_DEMAND_BOOT_TIMEOUT
+    if wake_requested:
+        outcome = start_woken_vm(job, wait_timeout=WAKE_ON_DEMAND_BOOT_TIMEOUT)
+        if outcome is None or outcome["Status"] != OPERATION_SUCCEEDED:
+            error = outcome.get("Error") if outcome else f"Not running after {WAKE_ON_DEMAND_BOOT_TIMEOUT}s."
+            return {"Status": FAILED, "Error": f"Failed to wake VM '{job['Hostname']}': {error}"}
+
+    if not ssh_manager.wait_until_reachable(job["Hostname"], max(deadline - time.monotonic(), 0)):
+        return {
+            "Status": FAILED,
+            "Error": f"VM '{job['Hostname']}' was not reachable within {WAKE_ON_DEMAND_BOOT_TIMEOUT}s of waking."
+        }
+    mark_woken_vm_reachable(job["VMID"])
+
+    job["Status"] = PROVISIONING
+    checkout_jobs.save(job)
+    return run_checkout_job(job, password)
+
+def checkout_job_response(job: dict) -> dict:
+    return {key: value for key, value in job.items() if key != "Owner"}
+
+def record_power_operation(outcome: dict):
+    if outcome["Status"] == OPERATION_SUCCEEDED:
+        power_state = CONFIRMED_POWER_STATES[outcome["ActionType"]]
+    elif outcome["Status"] == OPERATION_FAILED:
+        power_state = REVERTED_POWER_STATES[outcome["ActionType"]]
+    else:
+        # Still running in Azure, leave the transitional state for the power-state reconciliation
+        return
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "EXEC CompletePowerOperation @VMID = %s, @ExpectedPowerState = %s, @PowerState = %s",
+                (outcome["VMID"], TRANSITIONAL_POWER_STATES[outcome["ActionType"]], power_state)
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+def record_scaling_activity(activity_id: int, action_taken: str, outcomes: list):
+    notes = [
+        {key: outcome.get(key) for key in ("VMName", "ActionType", "Status", "DurationMs", "Error")}
+        for outcome in outcomes
+    ]
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "EXEC CompleteScalingActivity @ActivityID = %s, @Outcome = %s, @Notes = %s",
+                (activity_id, f"{action_taken} {len(outcomes)} VMs: {summarize_outcomes(outcomes)}", json.dumps(notes))
+            )
+            conn.commit()
+    finally:
+        conn.close()
+
+def record_scaling_activities(actions: list, outcomes: list):
+    # Every pool has its own activity, and a pool either scales up or down in a run
+    activity_ids = {action['VMID']: action['ActivityID'] for action in actions}
+    outcomes_by_activity = {}
+    for outcome in outcomes:
+        outcomes_by_activity.setdefault(activity_ids[outcome['VMID']], []).append(outcome)
+
+    for activity_id, activity_outcomes in outcomes_by_activity.items():
+        action_taken = {POWER_ON: "Powered on", POWER_OFF: "Powered off", DEALLOCATE: "Deallocated"}[activity_outcomes[0]['ActionType']]
+        record_scaling_activity(activity_id, action_taken, activity_outcomes)
+
+def forecast_scaling_demand():
+    if SCALING_MODE != 'predictive':
+        return None
+    try:
+        return demand_forecaster.forecast()
     except Exception as e:
-        print("Error creating or updating user '%s' on VM '%s': %s", username, host_fqdn, e)
-        return False
+        logger.error("Demand forecast failed, scaling on current demand only: %s", e)
+        return None
+
+def normalize_vm_attribute(value):
+    # Callers send "null" or an empty string for attributes they do not want to change
+    if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'null')):
+        return None
+    return value
+
+def validate_scaling_rule_window(daysofweek, starttime, endtime, require_both=True):
+    # Empty values mean every day or all day
+    daysofweek = str(daysofweek) if daysofweek is not None else None
+    if daysofweek and (any(day not in '1234567' for day in daysofweek) or len(set(daysofweek)) != len(daysofweek)):
+        return "'daysofweek' must list ISO weekdays from 1 (Monday) to 7 (Sunday), such as '12345'."
+
+    for value in (starttime, endtime):
+        if value and not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d(:[0-5]\d)?', value):
+            return "'starttime' and 'endtime' must be times of day such as '07:00'."
+
+    if require_both and bool(starttime) != bool(endtime):
+        return "Please provide both 'starttime' and 'endtime', or neither."
+    if starttime and endtime and starttime[:5] == endtime[:5]:
+        return "'starttime' and 'endtime' must differ."
+    return None
 
 def generate_secure_password(length=25) -> str:
     characters = string.ascii_letters + string.digits + string.punctuation
@@ -148,7 +436,7 @@ def is_member_of_group(service_principal_id, group_ids):
     access_token = get_access_token(TENANT_ID, CLIENT_ID, MICROSOFT_PROVIDER_AUTHENTICATION_SECRET)
     if not access_token:
         print("Cannot acquire access token for Graph API.")
-        return False
+        return None
 
     headers = {
         'Authorization': f'Bearer {access_token}',
@@ -161,7 +449,7 @@ def is_member_of_group(service_principal_id, group_ids):
         "groupIds": group_ids
     }
 
-    response = requests.post(url, headers=headers, json=body)
+    response = requests.post(url, headers=headers, json=body, timeout=10)
 
     if response.status_code == 200:
         result = response.json()
@@ -171,33 +459,47 @@ def is_member_of_group(service_principal_id, group_ids):
             return False
     else:
         print("Graph API error: %s - %s", response.status_code, response.text)
-        return False
-
-def delete_remote_user(hostname: str, username: str) -> bool:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
+        return None
 
-    try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        delete_user_command = f"sudo userdel -r {username} 2>/dev/null || echo 'User {username} does not exist'"
+def delete_remote_user(hostname: str, username: str, timeout=None) -> dict:
+    outcome = deprovision_user(ssh_manager, hostname, username, timeout=timeout)
+    if outcome["success"]:
+        logger.info("Deleted user '%s' on VM '%s': %s", username, hostname, summarize_steps(outcome))
+    else:
+        logger.error("Failed to delete user '%s' on VM '%s': %s (steps: %s)", username, hostname, outcome.get("error"), outcome["steps"])
+    return outcome
+
+def delete_remote_users(hosts_and_users) -> dict:
+    results = {}
+    if not hosts_and_users:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(USER_CLEANUP_CONCURRENCY, len(hosts_and_users))) as executor:
+        futures = {
+            executor.submit(delete_remote_user, hostname, username, USER_CLEANUP_TIMEOUT): (hostname, username)
+            for hostname, username in hosts_and_users
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = {"success": False, "error": str(e), "steps": [], "duration_ms": 0}
 
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, delete_user_command],
-            capture_output=True,
-            text=True
-        )
+    return results
 
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"Failed to delete user '{username}' on VM '{hostname}'. Error: {result.stderr}")
-            return False
-    except Exception as e:
-        print(f"Error deleting user '{username}' on VM '{hostname}': {e}")
+def is_member_of_group_cached(user_oid, group_ids):
+    cache_key = f"group_membership:{user_oid}:{','.join(sorted(str(group_id) for group_id in group_ids))}"
+    is_member = cache.get(cache_key)
+    if is_member is not None:
+        return is_member
+
+    # Graph errors come back as None and are not cached so the next request retries
+    is_member = is_member_of_group(user_oid, group_ids)
+    if is_member is None:
         return False
 
-@cache.memoize(timeout=300)
-def is_member_of_group_cached(user_oid, group_ids):
-    return is_member_of_group(user_oid, group_ids)
+    cache.set(cache_key, is_member, timeout=GROUP_MEMBERSHIP_CACHE_TTL)
+    return is_member
      
 def token_required(required_permissions=None, required_group_ids=None):
     def decorator(f):
@@ -219,48 +521,37 @@ def token_required(required_permissions=None, required_group_ids=None):
                 return jsonify({'message': 'Token is missing!'}), 401
 
             try:
-                jwks_uri = f"https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys"
-                jwks_response = requests.get(jwks_uri)
-                if jwks_response.status_code != 200:
-                    return jsonify({'message': 'Failed to retrieve JWKS.'}), 500
-                jwks = jwks_response.json()
-                
-                unverified_header = jwt.get_unverified_header(token)
-                
-                rsa_key = {}
-                for key in jwks["keys"]:
-                    if key["kid"] == unverified_header["kid"]:
-                        rsa_key = {
-                            "kty": key["kty"],
-                            "kid": key["kid"],
-                            "use": key["use"],
-                            "n": key["n"],
-                            "e": key["e"]
-                        }
-                        break
-                
-                if not rsa_key:
-                    return jsonify({'message': 'Invalid token: RSA key not found.'}), 401
-                
-                valid_audiences = [
-                    CLIENT_ID,
-                    APP_URI,
-                ]
-                
-                expected_issuers = [
-                    f"https://login.microsoftonline.com/{TENANT_ID}/v2.0",
-                    f"https://login.microsoftonline.com/{TENANT_ID}/",
-                    f"https://sts.windows.net/{TENANT_ID}/"
-                ]
-                
-                payload = jwt.decode(
-                    token,
-                    key=jwt.algorithms.RSAAlgorithm.from_jwk(rsa_key),
-                    algorithms=['RS256'],
-                    audience=valid_audiences,
-                    issuer=expected_issuers
-                )
-                
+                payload = verified_token_cache.get(token)
+                if payload is None:
+                    unverified_header = jwt.get_unverified_header(token)
+
+                    signing_key = jwks_store.get_signing_key(unverified_header.get("kid"))
+                    if signing_key is None:
+                        if not jwks_store.has_keys():
+                            return jsonify({'message': 'Failed to retrieve JWKS.'}), 500
+                        return jsonify({'message': 'Invalid token: RSA key not found.'}), 401
+
+                    valid_audiences = [
+                        CLIENT_ID,
+                        APP_URI,
+                    ]
+
+                    expected_issuers = [
+                        f"https://login.microsoftonline.com/{TENANT_ID}/v2.0",
+                        f"https://login.microsoftonline.com/{TENANT_ID}/",
+                        f"https://sts.windows.net/{TENANT_ID}/"
+                    ]
+
+                    payload = jwt.decode(
+                        token,
+                        key=signing_key,
+                        algorithms=['RS256'],
+                        audience=valid_audiences,
+                        issuer=expected_issuers
+                    )
+
+                    verified_token_cache.put(token, payload)
+
                 user_oid = payload.get('oid')
                 if not user_oid:
                     return jsonify({'message': 'Token does not contain user ID (oid).'}), 403
@@ -279,13 +570,15 @@ def token_required(required_permissions=None, required_group_ids=None):
                         has_role_permission = True
                 
                 is_in_group = False
-                if required_group_ids:
-                    is_in_group = is_member_of_group(user_oid, required_group_ids)
+                if required_group_ids and not (has_scope_permission or has_role_permission):
+                    is_in_group = is_member_of_group_cached(user_oid, required_group_ids)
                 
                 if not (has_scope_permission or has_role_permission or is_in_group):
                     print("Access denied: insufficient scope or role permissions or group membership.")
                     return jsonify({'message': 'Access denied: insufficient scope or role permissions or group membership.'}), 403
 
+                g.user_oid = user_oid
+
             except jwt.ExpiredSignatureError:
                 print("Token has expired.")
                 return jsonify({'message': 'Token has expired.'}), 401
@@ -303,82 +596,6 @@ def token_required(required_permissions=None, required_group_ids=None):
         return decorated
     return decorator
  
-def remote_group_exists(hostname: str, group_name: str) -> bool:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
-
-    try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, f'getent group {group_name}'],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            return True
-        else:
-            print("Group '%s' does not exist on VM '%s'. Error: %s", group_name, host_fqdn, result.stderr)
-            return False
-    except Exception as e:
-        print("Error checking group '%s' on VM '%s': %s", group_name, host_fqdn, e)
-        return False
-
-def create_remote_group(hostname: str, group_name: str) -> bool:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
-
-    try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, f'sudo groupadd {group_name}'],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            return True
-        else:
-            print("Failed to create group '%s' on VM '%s'. Error: %s", group_name, host_fqdn, result.stderr)
-            return False
-    except Exception as e:
-        print("Error creating group '%s' on VM '%s': %s", group_name, host_fqdn, e)
-        return False
-
-def is_user_in_remote_group(hostname: str, username: str, group_name: str) -> bool:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
-
-    try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, f'id -nG {username}'], 
-            capture_output=True, 
-            text=True
-        )
-        if result.returncode == 0:
-            groups = result.stdout.strip().split()
-            if group_name in groups:
-                return True
-            else:
-                return False
-        else:
-            print("Error checking user '%s' on VM '%s': %s", username, host_fqdn, result.stderr)
-            return False
-    except Exception as e:
-        print("Error checking user '%s' in group '%s' on VM '%s': %s", username, group_name, host_fqdn, e)
-        return False
-
-def add_user_to_remote_group(hostname: str, username: str, group_name: str) -> None:
-    pem_file_path = retrieve_pem_key_from_key_vault(VAULT_URL, KEY_NAME)
-
-    try:
-        host_fqdn = f"avdadmin@{hostname}.{DOMAIN_NAME}"
-        result = subprocess.run(
-            ['ssh', '-i', pem_file_path, '-o', 'StrictHostKeyChecking=no', host_fqdn, f'sudo usermod -aG {group_name} {username}'], 
-            capture_output=True, 
-            text=True
-        )
-        if result.returncode != 0:
-            print("Failed to add user '%s' to group '%s' on VM '%s': %s", username, group_name, host_fqdn, result.stderr)
-    except Exception as e:
-        print("Error adding user '%s' to group '%s' on VM '%s': %s", username, group_name, host_fqdn, e)
-
 # ===============================
 # App Management APIs
 
@@ -386,6 +603,22 @@ def add_user_to_remote_group(hostname: str, username: str, group_name: str) -> N
 def get_version():
     return jsonify({"version": app.config['VERSION']}), 200
 
+@app.route('/api/metrics', methods=['GET'])
+@token_required(['access_as_user', 'FullAccess'])
+def get_metrics():
+    return jsonify({
+        "jwks": jwks_store.stats(),
+        "verified_tokens": verified_token_cache.stats(),
+        "db_pool": db_pool.stats(),
+        "ssh": ssh_manager.stats(),
+        "ssh_key": ssh_key_cache.stats(),
+        "preprovisioning": pre_provisioner.stats(),
+        "checkout_jobs": checkout_jobs.stats(),
+        "power_operations": power_operations.stats(),
+        "power_state_reconciliation": power_state_reconciler.stats(),
+        "demand_forecast": demand_forecaster.stats()
+    }), 200
+
 # ===============================
 # VM Management APIs
 
@@ -397,10 +630,12 @@ def get_all_vms():
         if not conn:
             return "Database connection failed.", 500
 
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute("EXEC GetVms")
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute("EXEC GetVms")
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
 
         if not rows:
             return "No VMs found.", 404
@@ -418,14 +653,16 @@ def get_available_vm():
         if not conn:
             return "Database connection failed.", 500
 
-        cursor = conn.cursor(as_dict=True)
-        query = """
-        SELECT TOP 1 * FROM dbo.VirtualMachines
-        WHERE PowerState = 'On' AND NetworkStatus = 'Reachable' AND VmStatus = 'Available'
-        """
-        cursor.execute(query)
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor(as_dict=True)
+            query = """
+            SELECT TOP 1 * FROM dbo.VirtualMachines
+            WHERE PowerState = 'On' AND NetworkStatus = 'Reachable' AND VmStatus = 'Available'
+            """
+            cursor.execute(query)
+            row = cursor.fetchone()
+        finally:
+            conn.close()
 
         if not row:
             return "No available VM found.", 404
@@ -459,46 +696,39 @@ def checkout_vm():
         username = re.sub(r'[^a-zA-Z0-9_]', '', username)
         user_password = generate_secure_password()
 
-        conn = get_db_connection()
-        try:
-            with conn.cursor(as_dict=True) as cursor:
-                cursor.callproc('CheckoutVm', (username, avdhost))
-                rows = cursor.fetchall()
-                conn.commit()
-        finally:
-            conn.close()
-
-        if not rows or 'Message' in rows[0]:
+        checked_out_vm = claim_vm(username, avdhost)
+        if checked_out_vm is None:
             return "No available VM found. Please try again.", 409
 
-        checked_out_vm = rows[0]
         vm_hostname = checked_out_vm.get('Hostname')
 
         if not vm_hostname:
             return "No hostname found for the checked-out VM.", 500
 
-        if not create_or_update_remote_user(vm_hostname, username, user_password):
-            return f"Failed to create or update user '{username}' on VM '{vm_hostname}'.", 500
-        
-        groups_to_add = ["tsusers", "appusers"]
-
-        if not remote_group_exists(vm_hostname, "tsusers"):
-            if not create_remote_group(vm_hostname, "tsusers"):
-                return f"Failed to create group 'tsusers' on VM '{vm_hostname}'.", 500
+        if checked_out_vm.get('WakeRequested'):
+            start_woken_vm(checked_out_vm)
 
-        if not remote_group_exists(vm_hostname, "appusers"):
-            if not create_remote_group(vm_hostname, "appusers"):
-                return f"Failed to create group 'appusers' on VM '{vm_hostname}'.", 500
+        # The VM stays checked out to the user while it boots, so retries get the same VM back
+        if is_vm_waking(checked_out_vm):
+            if checked_out_vm.get('WakeRequested') or not ssh_manager.wait_until_reachable(vm_hostname, WAKE_ON_DEMAND_RETRY_AFTER):
+                return jsonify({
+                    "Status": STARTING,
+                    "VMID": checked_out_vm.get("VMID"),
+                    "Hostname": vm_hostname,
+                    "RetryAfter": WAKE_ON_DEMAND_RETRY_AFTER
+                }), 202, {"Retry-After": str(WAKE_ON_DEMAND_RETRY_AFTER)}
+            mark_woken_vm_reachable(checked_out_vm["VMID"])
 
-        for group in groups_to_add:
-            if not is_user_in_remote_group(vm_hostname, username, group):
-                add_user_to_remote_group(vm_hostname, username, group)
+        provisioning = provision_checked_out_vm(vm_hostname, username, user_password)
+        if not provisioning["success"]:
+            return f"Failed to provision user '{username}' on VM '{vm_hostname}'.", 500
 
         response_data = {
             "VMID": checked_out_vm.get("VMID"),
             "Hostname": checked_out_vm.get("Hostname"),
             "IPAddress": checked_out_vm.get("IPAddress"),
-            "password": user_password
+            "password": user_password,
+            "Provisioning": summarize_steps(provisioning)
         }
 
         #print(f"================= Response data: {response_data}")    
@@ -511,15 +741,103 @@ def checkout_vm():
     except Exception as e:
         return f"Error: {str(e)}", 500
 
+@app.route('/api/vms/checkout/async', methods=['POST'])
+@token_required(['AvdHost', 'access_as_user', 'FullAccess'], required_group_ids=[AVD_HOST_GROUP_ID])
+def checkout_vm_async():
+    try:
+        req_body = request.get_json()
+
+        username = req_body.get('username')
+        avdhost = req_body.get('avdhost')
+
+        if not username or not avdhost:
+            return "Please provide 'username' and 'avdhost' in the request body.", 400
+
+        username = re.sub(r'[^a-zA-Z0-9_]', '', username)
+
+        # Retries with the same key get the running job instead of claiming and provisioning again
+        idempotency_key = f"{g.user_oid}:{request.headers.get('Idempotency-Key') or f'{username}:{avdhost}'}"
+        job_id, created = checkout_jobs.reserve(idempotency_key)
+
+        if not created:
+            job = checkout_jobs.get(job_id)
+            if job is None:
+                return jsonify({"JobId": job_id, "Status": PENDING}), 202
+            return jsonify(checkout_job_response(job)), 200 if job["Status"] in FINAL_STATUSES else 202
+
+        job = {
+            "JobId": job_id,
+            "Status": PENDING,
+            "Owner": g.user_oid,
+            "Username": username,
+            "AvdHost": avdhost,
+            "CreatedAt": time.time()
+        }
+        checkout_jobs.save(job)
+
+        try:
+            checked_out_vm = claim_vm(username, avdhost)
+        except Exception as e:
+            checkout_jobs.fail(job, idempotency_key, str(e))
+            raise
+
+        if checked_out_vm is None or not checked_out_vm.get('Hostname'):
+            checkout_jobs.fail(job, idempotency_key, "No available VM found.")
+            return "No available VM found. Please try again.", 409
+
+        waking = is_vm_waking(checked_out_vm)
+        job.update({
+            "Status": STARTING if waking else PROVISIONING,
+            "VMID": checked_out_vm.get("VMID"),
+            "Hostname": checked_out_vm.get("Hostname"),
+            "IPAddress": checked_out_vm.get("IPAddress")
+        })
+        checkout_jobs.save(job)
+
+        user_password = generate_secure_password()
+        headers = {"Location": f"/api/vms/checkout/jobs/{job_id}"}
+        # The job is updated by its worker once submitted, so respond with a copy taken before
+        response_job = checkout_job_response(job)
+        if waking:
+            wake_requested = bool(checked_out_vm.get('WakeRequested'))
+            checkout_jobs.submit(job, idempotency_key, lambda: run_wake_checkout_job(job, user_password, wake_requested))
+            headers["Retry-After"] = str(WAKE_ON_DEMAND_RETRY_AFTER)
+        else:
+            checkout_jobs.submit(job, idempotency_key, lambda: run_checkout_job(job, user_password))
+
+        return jsonify(response_job), 202, headers
+
+    except json.JSONDecodeError:
+        return "Invalid JSON data", 400
+
+    except Exception as e:
+        return f"Error: {str(e)}", 500
+
+@app.route('/api/vms/checkout/jobs/<job_id>', methods=['GET'])
+@token_required(['AvdHost', 'access_as_user', 'FullAccess'], required_group_ids=[AVD_HOST_GROUP_ID])
+def get_checkout_job(job_id):
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), CHECKOUT_JOB_MAX_WAIT)
+
+        job = checkout_jobs.wait(job_id, wait) if wait else checkout_jobs.get(job_id)
+        # Jobs carry the user's password, so only the caller that created them may read them
+        if job is None or job.get("Owner") != g.user_oid:
+            return jsonify({"message": "Checkout job not found."}), 404
+
+        return jsonify(checkout_job_response(job)), 200
+
+    except Exception as e:
+        return f"Error: {str(e)}", 500
+
 @app.route('/api/vms/<vmid>/update-attributes', methods=['POST'])
 @token_required(['ScheduledTask', 'access_as_user', 'FullAccess'])
 def update_vm_attributes(vmid):
     try:
         req_body = request.get_json()
 
-        powerstate = req_body.get('powerstate')
-        networkstatus = req_body.get('networkstatus')
-        vmstatus = req_body.get('vmstatus')
+        powerstate = normalize_vm_attribute(req_body.get('powerstate'))
+        networkstatus = normalize_vm_attribute(req_body.get('networkstatus'))
+        vmstatus = normalize_vm_attribute(req_body.get('vmstatus'))
 
         if not any([powerstate, networkstatus, vmstatus]):
             return jsonify({'error': "Please provide at least one attribute to update."}), 400
@@ -528,17 +846,18 @@ def update_vm_attributes(vmid):
         if not conn:
             return jsonify({'error': "Database connection failed."}), 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute(
-                "EXEC UpdateVmAttributes @VMID = %s, @PowerState = %s, @NetworkStatus = %s, @VmStatus = %s",
-                (vmid, powerstate, networkstatus, vmstatus)
-            )
-            row = cursor.fetchone()
-            conn.commit()
-            if not row:
-                return jsonify({'error': "VM not found or no attributes updated. Please try again."}), 404
-        
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute(
+                    "EXEC UpdateVmAttributes @VMID = %s, @PowerState = %s, @NetworkStatus = %s, @VmStatus = %s",
+                    (vmid, powerstate, networkstatus, vmstatus)
+                )
+                row = cursor.fetchone()
+                conn.commit()
+                if not row:
+                    return jsonify({'error': "VM not found or no attributes updated. Please try again."}), 404
+        finally:
+            conn.close()
 
         return jsonify(row), 200
 
@@ -548,6 +867,59 @@ def update_vm_attributes(vmid):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/vms/update-attributes', methods=['POST'])
+@token_required(['ScheduledTask', 'access_as_user', 'FullAccess'])
+def bulk_update_vm_attributes():
+    try:
+        req_body = request.get_json()
+        if not isinstance(req_body, list) or not req_body:
+            return jsonify({'error': "Please provide a list of VM attribute updates."}), 400
+
+        updates = []
+        for index, item in enumerate(req_body):
+            if not isinstance(item, dict):
+                return jsonify({'error': f"Update {index} is not an object."}), 400
+
+            try:
+                vmid = int(item.get('vmid'))
+            except (TypeError, ValueError):
+                return jsonify({'error': f"Update {index} does not have a valid vmid."}), 400
+
+            update = {
+                "VMID": vmid,
+                "PowerState": normalize_vm_attribute(item.get('powerstate')),
+                "NetworkStatus": normalize_vm_attribute(item.get('networkstatus')),
+                "VmStatus": normalize_vm_attribute(item.get('vmstatus'))
+            }
+            if not any([update["PowerState"], update["NetworkStatus"], update["VmStatus"]]):
+                return jsonify({'error': f"Update {index} for VMID {vmid} does not provide any attribute to update."}), 400
+
+            updates.append(update)
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'error': "Database connection failed."}), 500
+
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC BulkUpdateVmAttributes @Updates = %s", (json.dumps(updates),))
+                rows = cursor.fetchall()
+                conn.commit()
+        finally:
+            conn.close()
+
+        counts = {"Updated": 0, "Unchanged": 0, "NotFound": 0}
+        for row in rows:
+            counts[row['Result']] += 1
+
+        return jsonify({**counts, "Results": rows}), 200
+
+    except json.JSONDecodeError:
+        return jsonify({'error': "Invalid JSON data"}), 400
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/vms/<vmid>/delete', methods=['POST'])
 @token_required(['access_as_user', 'FullAccess'])
 def delete_vm(vmid):
@@ -556,12 +928,14 @@ def delete_vm(vmid):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC DeleteVm @VMID = %s", (vmid,))
-            row = cursor.fetchone()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC DeleteVm @VMID = %s", (vmid,))
+                row = cursor.fetchone()
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return f"VM with VMID {vmid} could not be deleted or was not found.", 404
@@ -585,6 +959,7 @@ def add_new_vm():
         username = req_body.get('username', None)
         avdhost = req_body.get('avdhost', None)
         description = req_body.get('description', None)
+        poolname = req_body.get('poolname') or None
 
         if not (hostname and ipaddress and powerstate and networkstatus and vmstatus):
             return "Please provide 'hostname', 'ipaddress', 'powerstate', 'networkstatus', and 'vmstatus' in the request body.", 400
@@ -593,16 +968,18 @@ def add_new_vm():
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("""
-                EXEC AddVm @Hostname = %s, @IPAddress = %s, @PowerState = %s, @NetworkStatus = %s, @VmStatus = %s,
-                            @Username = %s, @AvdHost = %s, @Description = %s
-            """, (hostname, ipaddress, powerstate, networkstatus, vmstatus, username, avdhost, description))
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("""
+                    EXEC AddVm @Hostname = %s, @IPAddress = %s, @PowerState = %s, @NetworkStatus = %s, @VmStatus = %s,
+                                @Username = %s, @AvdHost = %s, @Description = %s, @PoolName = %s
+                """, (hostname, ipaddress, powerstate, networkstatus, vmstatus, username, avdhost, description, poolname))
 
-            row = cursor.fetchone()
+                row = cursor.fetchone()
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return "Failed to add new VM. Please try again.", 500
@@ -623,10 +1000,12 @@ def get_vm_details(vmid):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetVmDetails @VMID = %s", (vmid,))
-            row = cursor.fetchone()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetVmDetails @VMID = %s", (vmid,))
+                row = cursor.fetchone()
+        finally:
+            conn.close()
 
         if not row:
             return f"VM with VMID {vmid} was not found.", 404
@@ -644,11 +1023,13 @@ def return_vm(vmid):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC ReturnVm @VMID = %s", (vmid,))
-            row = cursor.fetchone()
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC ReturnVm @VMID = %s", (vmid,))
+                row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return f"VM with VMID {vmid} was not found or is not currently checked out.", 404
@@ -666,12 +1047,14 @@ def release_vm(hostname):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC ReleaseVm @Hostname = %s", (hostname,))
-            row = cursor.fetchone()
-        
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC ReleaseVm @Hostname = %s", (hostname,))
+                row = cursor.fetchone()
+
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return f"Failed to release VM with Hostname {hostname}. Please try again.", 500
@@ -685,35 +1068,88 @@ def release_vm(hostname):
 @token_required(['ScheduledTask', 'access_as_user', 'FullAccess'])
 def return_released_vm_api():
     try:
+        req_body = request.get_json(silent=True) or {}
+        grace_period_minutes = int(req_body.get('graceperiodminutes', RELEASE_GRACE_PERIOD_MINUTES))
+
         conn = get_db_connection()
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC ReturnReleasedVms")
-            rows = cursor.fetchall()
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC ReturnReleasedVms @GracePeriodMinutes = %s", (grace_period_minutes,))
+                rows = cursor.fetchall()
+            conn.commit()
 
-        if not rows:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetPendingUserCleanups @MaxAttempts = %s", (USER_CLEANUP_MAX_ATTEMPTS,))
+                pending_cleanups = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+
+        if not rows and not pending_cleanups:
             return "No VMs to return at this time.", 200
 
+        cleanups = {}
         for row in rows:
             hostname = row.get("Hostname")
             username = row.get("Username")
-
             if hostname and username:
-                success = delete_remote_user(hostname, username)
-                if success:
-                    print(f"Successfully deleted user {username} from {hostname}")
-                else:
-                    print(f"Failed to delete user {username} from {hostname}")
+                cleanups[(hostname, username)] = row
+        retried_cleanups = [pending for pending in pending_cleanups if (pending["Hostname"], pending["Username"]) not in cleanups]
+        for pending in retried_cleanups:
+            cleanups[(pending["Hostname"], pending["Username"])] = pending
 
-        return jsonify(rows), 200
+        results = delete_remote_users(list(cleanups.keys()))
+
+        conn = get_db_connection()
+        if not conn:
+            return "Database connection failed.", 500
+
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                for (hostname, username), outcome in results.items():
+                    if outcome["success"]:
+                        cursor.execute("EXEC CompleteUserCleanup @Hostname = %s, @Username = %s", (hostname, username))
+                    else:
+                        cursor.execute("EXEC QueueUserCleanup @Hostname = %s, @Username = %s, @LastError = %s", (hostname, username, outcome.get("error")))
+                    cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+
+        for (hostname, username), record in cleanups.items():
+            outcome = results[(hostname, username)]
+            record["UserCleanup"] = {
+                "Username": username,
+                "Success": outcome["success"],
+                "Error": outcome.get("error"),
+                "DurationMs": outcome["duration_ms"]
+            }
+
+        return jsonify({
+            "ReturnedVMs": rows,
+            "RetriedCleanups": retried_cleanups
+        }), 200
 
     except Exception as e:
         return f"Error: {str(e)}", 500
 
+@app.route('/api/vms/reconcile', methods=['POST'])
+@token_required(['ScheduledTask', 'access_as_user', 'FullAccess'])
+def reconcile_vm_power_states():
+    try:
+        if not VM_SUBSCRIPTION_ID or not VM_RESOURCE_GROUP:
+            return "Configuration error: missing Azure subscription or resource group.", 500
+
+        compute_client = get_compute_client(VM_SUBSCRIPTION_ID, AZURE_COMPUTE_BACKEND)
+        result = power_state_reconciler.reconcile(compute_client, VM_RESOURCE_GROUP, get_db_connection)
+
+        return jsonify(result), 200
+
+    except Exception as e:
+        return f"Error: {str(e)}", 500
 
 @app.route('/api/vms/history', methods=['POST'])
 @token_required(['access_as_user', 'FullAccess'])
@@ -732,10 +1168,12 @@ def get_vm_history():
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetVmHistory @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
-            rows = cursor.fetchall()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetVmHistory @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
 
         return jsonify(rows), 200
 
@@ -765,11 +1203,12 @@ def get_scaling_activity_log():
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetScalingActivityLog @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
-            rows = cursor.fetchall()
-
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetScalingActivityLog @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
 
         if not rows:
             return jsonify({"message": "No scaling activities found for the specified criteria."}), 200
@@ -788,35 +1227,62 @@ def trigger_scaling_logic():
     try:
         if not VM_SUBSCRIPTION_ID or not VM_RESOURCE_GROUP:
             return "Configuration error: missing Azure subscription or resource group.", 500
+        if SCALE_DOWN_MODE not in SCALE_DOWN_ACTIONS or SCALE_DOWN_POLICY not in SCALE_DOWN_POLICIES:
+            return "Configuration error: unknown SCALE_DOWN_MODE or SCALE_DOWN_POLICY.", 500
 
-        credential = DefaultAzureCredential()
-        compute_client = ComputeManagementClient(credential=credential, subscription_id=VM_SUBSCRIPTION_ID)
+        compute_client = get_compute_client(VM_SUBSCRIPTION_ID, AZURE_COMPUTE_BACKEND)
+        forecast = forecast_scaling_demand()
 
         conn = get_db_connection()
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC TriggerScalingLogic")
-            rows = cursor.fetchall()
-        
-        conn.close()
-
-        powered_on_vms = []
-        powered_off_vms = []
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                forecasts = [
+                    {"PoolName": pool["PoolName"], "ForecastInUseVMs": pool["ForecastInUseVMs"]}
+                    for pool in forecast["Pools"]
+                ] if forecast else None
+                cursor.execute(
+                    "EXEC TriggerScalingLogic @Forecasts = %s, @ScaleDownAction = %s, @ScaleDownPolicy = %s, @VmHourlyCost = %s",
+                    (
+                        json.dumps(forecasts) if forecasts is not None else None,
+                        SCALE_DOWN_ACTIONS[SCALE_DOWN_MODE],
+                        SCALE_DOWN_POLICY,
+                        VM_HOURLY_COST
+                    )
+                )
+                rows = cursor.fetchall()
+                cursor.nextset()
+                decisions = cursor.fetchall()
+                conn.commit()
+        finally:
+            conn.close()
 
-        for row in rows:
-            vm_name = row['VMName']
-            if row['ActionType'] == 'PowerOn':
-                compute_client.virtual_machines.begin_start(VM_RESOURCE_GROUP, vm_name)
-                powered_on_vms.append(vm_name)
-            elif row['ActionType'] == 'PowerOff':
-                compute_client.virtual_machines.begin_power_off(VM_RESOURCE_GROUP, vm_name)
-                powered_off_vms.append(vm_name)
+        powered_on_vms = [row['VMName'] for row in rows if row['ActionType'] == POWER_ON]
+        powered_off_vms = [row['VMName'] for row in rows if row['ActionType'] in (POWER_OFF, DEALLOCATE)]
+
+        # Operations still running after the wait keep going in the background and are recorded when they finish
+        completed, pending = power_operations.execute(
+            compute_client,
+            VM_RESOURCE_GROUP,
+            rows,
+            record_power_operation,
+            lambda outcomes: record_scaling_activities(rows, outcomes),
+            wait_timeout=SCALING_WAIT_TIMEOUT
+        )
 
         response_payload = {
+            'Pools': decisions,
+            'CurrentRunningVMs': sum(decision['CurrentRunningVMs'] for decision in decisions),
+            'CurrentInUseVMs': sum(decision['CurrentInUseVMs'] for decision in decisions),
+            'Forecast': forecast,
             'PoweredOnVMs': powered_on_vms,
-            'PoweredOffVMs': powered_off_vms
+            'PoweredOffVMs': powered_off_vms,
+            'ScaleDownMode': SCALE_DOWN_MODE,
+            'ScaleDownPolicy': SCALE_DOWN_POLICY,
+            'Operations': completed,
+            'PendingVMs': [action['VMName'] for action in pending]
         }
 
         return jsonify(response_payload), 200
@@ -835,10 +1301,12 @@ def get_scaling_rules():
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetScalingRules")
-            rows = cursor.fetchall()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetScalingRules")
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
 
         if not rows:
             return "No scaling rules found.", 404
@@ -856,10 +1324,12 @@ def get_scaling_rule_details(ruleid):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetScalingRuleDetails @RuleID = %s", (ruleid,))
-            row = cursor.fetchone()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetScalingRuleDetails @RuleID = %s", (ruleid,))
+                row = cursor.fetchone()
+        finally:
+            conn.close()
 
         if not row:
             return f"Scaling rule with RuleID {ruleid} was not found.", 404
@@ -881,6 +1351,13 @@ def create_scaling_rule():
         scaleupincrement = req_body.get('scaleupincrement')
         scaledownratio = req_body.get('scaledownratio')
         scaledownincrement = req_body.get('scaledownincrement')
+        poolname = req_body.get('poolname') or None
+        daysofweek = req_body.get('daysofweek') or None
+        starttime = req_body.get('starttime') or None
+        endtime = req_body.get('endtime') or None
+        timezone = req_body.get('timezone') or None
+        priority = req_body.get('priority')
+        priority = None if priority == '' else priority
 
         if not all([minvms is not None, maxvms is not None, scaleupratio is not None, scaleupincrement is not None, scaledownratio is not None, scaledownincrement is not None]):
             return (
@@ -889,21 +1366,30 @@ def create_scaling_rule():
                 400,
             )
 
+        window_error = validate_scaling_rule_window(daysofweek, starttime, endtime)
+        if window_error:
+            return window_error, 400
+
         conn = get_db_connection()
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute(
-                """
-                EXEC CreateScalingRule @MinVMs = %s, @MaxVMs = %s, @ScaleUpRatio = %s, 
-                                    @ScaleUpIncrement = %s, @ScaleDownRatio = %s, @ScaleDownIncrement = %s
-                """,
-                (minvms, maxvms, scaleupratio, scaleupincrement, scaledownratio, scaledownincrement),
-            )
-            row = cursor.fetchone()
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute(
+                    """
+                    EXEC CreateScalingRule @MinVMs = %s, @MaxVMs = %s, @ScaleUpRatio = %s, 
+                                        @ScaleUpIncrement = %s, @ScaleDownRatio = %s, @ScaleDownIncrement = %s,
+                                        @PoolName = %s, @DaysOfWeek = %s, @StartTime = %s, @EndTime = %s,
+                                        @TimeZone = %s, @Priority = %s
+                    """,
+                    (minvms, maxvms, scaleupratio, scaleupincrement, scaledownratio, scaledownincrement,
+                     poolname, daysofweek, starttime, endtime, timezone, priority),
+                )
+                row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return "Failed to create the scaling rule. Please try again.", 500
@@ -930,24 +1416,42 @@ def update_scaling_rule(ruleid):
         scaleupincrement = req_body.get('scaleupincrement')
         scaledownratio = req_body.get('scaledownratio')
         scaledownincrement = req_body.get('scaledownincrement')
-
-        if not any([minvms is not None, maxvms is not None, scaleupratio is not None, scaleupincrement is not None, scaledownratio is not None, scaledownincrement is not None]):
+        # An empty pool, days or window clears it, so the rule applies to every pool, day or time
+        poolname = req_body.get('poolname')
+        daysofweek = req_body.get('daysofweek')
+        starttime = req_body.get('starttime')
+        endtime = req_body.get('endtime')
+        timezone = req_body.get('timezone') or None
+        priority = req_body.get('priority')
+        priority = None if priority == '' else priority
+
+        if not any([minvms is not None, maxvms is not None, scaleupratio is not None, scaleupincrement is not None, scaledownratio is not None, scaledownincrement is not None,
+                    poolname is not None, daysofweek is not None, starttime is not None, endtime is not None, timezone is not None, priority is not None]):
             return "Please provide at least one field to update.", 400
 
+        window_error = validate_scaling_rule_window(daysofweek, starttime, endtime, require_both=False)
+        if window_error:
+            return window_error, 400
+
         conn = get_db_connection()
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                EXEC UpdateScalingRule @RuleID = %s, @MinVMs = %s, @MaxVMs = %s, @ScaleUpRatio = %s, 
-                                    @ScaleUpIncrement = %s, @ScaleDownRatio = %s, @ScaleDownIncrement = %s
-                """,
-                (ruleid, minvms, maxvms, scaleupratio, scaleupincrement, scaledownratio, scaledownincrement),
-            )
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    EXEC UpdateScalingRule @RuleID = %s, @MinVMs = %s, @MaxVMs = %s, @ScaleUpRatio = %s, 
+                                        @ScaleUpIncrement = %s, @ScaleDownRatio = %s, @ScaleDownIncrement = %s,
+                                        @PoolName = %s, @DaysOfWeek = %s, @StartTime = %s, @EndTime = %s,
+                                        @TimeZone = %s, @Priority = %s
+                    """,
+                    (ruleid, minvms, maxvms, scaleupratio, scaleupincrement, scaledownratio, scaledownincrement,
+                     poolname, daysofweek, starttime, endtime, timezone, priority),
+                )
+            conn.commit()
+        finally:
+            conn.close()
 
         return f"Scaling rule with RuleID {ruleid} updated successfully.", 200
 
@@ -965,11 +1469,13 @@ def delete_scaling_rule(ruleid):
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC DeleteScalingRule @RuleID = %s", (ruleid,))
-            row = cursor.fetchone()
-        conn.commit()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC DeleteScalingRule @RuleID = %s", (ruleid,))
+                row = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
 
         if not row:
             return f"Scaling rule with RuleID {ruleid} could not be deleted or was not found.", 404
@@ -996,10 +1502,12 @@ def get_scaling_rules_history():
         if not conn:
             return "Database connection failed.", 500
 
-        with conn.cursor(as_dict=True) as cursor:
-            cursor.execute("EXEC GetVMScalingRulesHistory @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
-            rows = cursor.fetchall()
-        conn.close()
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute("EXEC GetVMScalingRulesHistory @StartDate = %s, @EndDate = %s, @Limit = %s", (startdate, enddate, limit))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
 
         if not rows:
             return jsonify({"message": "No scaling activities found for the specified criteria."}), 200
@@ -1018,5 +1526,12 @@ def get_scaling_rules_history():
 password_refresh_thread = threading.Thread(target=refresh_db_password, args=(3600,), daemon=True)
 password_refresh_thread.start()
 
+jwks_store.start_background_refresh()
+ssh_manager.start_idle_eviction()
+ssh_key_cache.start_background_refresh()
+
+if PREPROVISIONING_ENABLED:
+    pre_provisioner.start_background_priming()
+
 if __name__ == '__main__':
     app.run(debug=True)
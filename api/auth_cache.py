@@ -0,0 +1,197 @@
+import time
+import hashlib
+import threading
+import logging
+
+from collections import OrderedDict
+
+import jwt
+import requests
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# JWKS Key Store
+
+class JwksKeyStore:
+    def __init__(self, jwks_uri, ttl=3600, unknown_kid_ttl=300, min_refresh_interval=30, request_timeout=10, max_unknown_kids=1000):
+        self.jwks_uri = jwks_uri
+        self.ttl = ttl
+        self.unknown_kid_ttl = unknown_kid_ttl
+        self.max_unknown_kids = max_unknown_kids
+        self.min_refresh_interval = min_refresh_interval
+        self.request_timeout = request_timeout
+
+        self._keys = {}
+        self._unknown_kids = {}
+        self._last_fetch = 0
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _fetch(self):
+        self.fetches += 1
+        try:
+            response = requests.get(self.jwks_uri, timeout=self.request_timeout)
+            response.raise_for_status()
+            jwks = response.json()
+        except Exception as e:
+            self.fetch_errors += 1
+            logger.error("Failed to retrieve JWKS from %s: %s", self.jwks_uri, e)
+            return False
+
+        keys = {}
+        for key in jwks.get("keys", []):
+            kid = key.get("kid")
+            if not kid or key.get("kty") != "RSA":
+                continue
+            try:
+                keys[kid] = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+            except Exception as e:
+                logger.warning("Skipping JWKS key '%s' that could not be parsed: %s", kid, e)
+
+        if not keys:
+            self.fetch_errors += 1
+            logger.error("JWKS response from %s did not contain any usable RSA keys.", self.jwks_uri)
+            return False
+
+        self._keys = keys
+        self._last_fetch = time.monotonic()
+        self._unknown_kids = {kid: expiry for kid, expiry in self._unknown_kids.items() if kid not in keys}
+        return True
+
+    def has_keys(self):
+        return bool(self._keys)
+
+    def refresh(self):
+        with self._lock:
+            return self._fetch()
+
+    def get_signing_key(self, kid):
+        key = self._keys.get(kid)
+        if key is not None:
+            self.hits += 1
+            return key
+
+        now = time.monotonic()
+        negative_expiry = self._unknown_kids.get(kid)
+        if negative_expiry is not None and negative_expiry > now:
+            self.negative_hits += 1
+            return None
+
+        self.misses += 1
+        with self._lock:
+            # Another request may have refreshed the keys while we waited for the lock
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+
+            if not self._keys or now - self._last_fetch >= self.min_refresh_interval:
+                self._fetch()
+                key = self._keys.get(kid)
+
+            # Only remember the kid as unknown when we actually hold a key set to compare against
+            if key is None and self._keys:
+                self._remember_unknown_kid(kid)
+
+        return key
+
+    def _remember_unknown_kid(self, kid):
+        now = time.monotonic()
+        if len(self._unknown_kids) >= self.max_unknown_kids:
+            self._unknown_kids = {k: expiry for k, expiry in self._unknown_kids.items() if expiry > now}
+            if len(self._unknown_kids) >= self.max_unknown_kids:
+                self._unknown_kids.clear()
+        self._unknown_kids[kid] = now + self.unknown_kid_ttl
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl)
+            self.refresh()
+
+    def start_background_refresh(self):
+        if self._refresh_thread is None:
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresh_thread.start()
+
+    def stats(self):
+        return {
+            "keys": len(self._keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "negative_entries": len(self._unknown_kids),
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "seconds_since_fetch": round(time.monotonic() - self._last_fetch, 1) if self._last_fetch else None
+        }
+
+# ===============================
+# Verified Token Cache
+
+class VerifiedTokenCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, (int, float)) or self.max_size <= 0:
+            return
+
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (claims, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
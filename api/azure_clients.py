@@ -0,0 +1,49 @@
+import threading
+
+from azure.identity import DefaultAzureCredential
+from azure.keyvault.secrets import SecretClient
+from azure.mgmt.compute import ComputeManagementClient
+
+from fake_compute import FakeComputeClient
+
+# ===============================
+# Shared Azure Clients
+
+_lock = threading.RLock()
+_credential = None
+_secret_clients = {}
+_compute_clients = {}
+
+def get_credential():
+    global _credential
+    if _credential is None:
+        with _lock:
+            if _credential is None:
+                _credential = DefaultAzureCredential()
+    return _credential
+
+def get_secret_client(vault_url):
+    secret_client = _secret_clients.get(vault_url)
+    if secret_client is None:
+        with _lock:
+            secret_client = _secret_clients.get(vault_url)
+            if secret_client is None:
+                secret_client = _secret_clients[vault_url] = SecretClient(vault_url=vault_url, credential=get_credential())
+    return secret_client
+
+def get_compute_client(subscription_id, backend='azure'):
+    # One client per subscription keeps the HTTP connection pool and the credential's cached tokens warm
+    key = (backend, subscription_id)
+    compute_client = _compute_clients.get(key)
+    if compute_client is None:
+        with _lock:
+            compute_client = _compute_clients.get(key)
+            if compute_client is None:
+                if backend == 'fake':
+                    compute_client = FakeComputeClient()
+                elif backend == 'azure':
+                    compute_client = ComputeManagementClient(credential=get_credential(), subscription_id=subscription_id)
+                else:
+                    raise ValueError(f"Unknown compute backend '{backend}'.")
+                _compute_clients[key] = compute_client
+    return compute_client
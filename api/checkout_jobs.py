@@ -0,0 +1,132 @@
+import time
+import uuid
+import threading
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+STARTING = 'starting'
+PROVISIONING = 'provisioning'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+FINAL_STATUSES = (SUCCEEDED, FAILED)
+
+# ===============================
+# Checkout Job Store
+
+class CheckoutJobStore:
+    def __init__(self, cache, ttl=900, max_workers=10, poll_interval=0.5):
+        self._cache = cache
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='checkout-job')
+        self._events = {}
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.reused = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    @staticmethod
+    def _job_key(job_id):
+        return f"checkout_job:{job_id}"
+
+    @staticmethod
+    def _idempotency_key(key):
+        return f"checkout_job_key:{key}"
+
+    def reserve(self, idempotency_key):
+        # cache.add only succeeds for the first caller, so concurrent retries share one job
+        job_id = uuid.uuid4().hex
+        for _ in range(2):
+            if self._cache.add(self._idempotency_key(idempotency_key), job_id, timeout=self.ttl):
+                with self._lock:
+                    self.created += 1
+                return job_id, True
+
+            existing_job_id = self._cache.get(self._idempotency_key(idempotency_key))
+            if existing_job_id is not None:
+                with self._lock:
+                    self.reused += 1
+                return existing_job_id, False
+
+        raise RuntimeError("Failed to reserve a checkout job.")
+
+    def release(self, idempotency_key, job_id):
+        # Let a retry start a new job once this one has finished
+        if self._cache.get(self._idempotency_key(idempotency_key)) == job_id:
+            self._cache.delete(self._idempotency_key(idempotency_key))
+
+    def get(self, job_id):
+        return self._cache.get(self._job_key(job_id))
+
+    def save(self, job):
+        job["UpdatedAt"] = time.time()
+        self._cache.set(self._job_key(job["JobId"]), job, timeout=self.ttl)
+
+    def fail(self, job, idempotency_key, error):
+        job.update({"Status": FAILED, "Error": error})
+        self.save(job)
+        self.release(idempotency_key, job["JobId"])
+        with self._lock:
+            self.failed += 1
+
+    def submit(self, job, idempotency_key, work):
+        event = threading.Event()
+        with self._lock:
+            self._events[job["JobId"]] = event
+
+        def run():
+            try:
+                job.update(work())
+            except Exception as e:
+                logger.error("Checkout job '%s' failed: %s", job["JobId"], e)
+                job.update({"Status": FAILED, "Error": str(e)})
+
+            if job["Status"] == FAILED:
+                self.fail(job, idempotency_key, job.get("Error"))
+            else:
+                self.save(job)
+                # Only in-flight jobs are shared: a later checkout must claim and provision again, not get this
+                # job's VM and password back after the VM may have been returned
+                self.release(idempotency_key, job["JobId"])
+                with self._lock:
+                    self.succeeded += 1
+
+            with self._lock:
+                self._events.pop(job["JobId"], None)
+            event.set()
+
+        self._executor.submit(run)
+
+    def wait(self, job_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["Status"] in FINAL_STATUSES or remaining <= 0:
+                return job
+
+            # Jobs running in this process wake the waiter immediately, others are polled through the cache
+            with self._lock:
+                event = self._events.get(job_id)
+            if event is not None:
+                event.wait(min(remaining, self.poll_interval))
+            else:
+                time.sleep(min(remaining, self.poll_interval))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "running": len(self._events)
+            }
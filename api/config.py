@@ -4,6 +4,7 @@ TENANT_ID = os.environ.get("TENANT_ID")
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 VM_SUBSCRIPTION_ID = os.environ.get("VM_SUBSCRIPTION_ID")
 VM_RESOURCE_GROUP = os.environ.get("VM_RESOURCE_GROUP")
+AZURE_COMPUTE_BACKEND = os.environ.get("AZURE_COMPUTE_BACKEND", "azure")
 CLIENT_ID = os.environ.get("CLIENT_ID")
 MICROSOFT_PROVIDER_AUTHENTICATION_SECRET = os.environ.get("MICROSOFT_PROVIDER_AUTHENTICATION_SECRET")
 APP_URI = f"api://{CLIENT_ID}"
@@ -18,5 +19,52 @@ DB_SERVER = os.environ.get('DB_SERVER')
 DB_DATABASE = os.environ.get('DB_DATABASE')
 DB_USERNAME = os.environ.get('DB_USERNAME')
 DB_PASSWORD_NAME = os.environ.get('DB_PASSWORD_NAME')
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_MAX_LIFETIME = int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_CHECKOUT_TIMEOUT = int(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', 10))
+DB_POOL_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+SSH_CONTROL_DIR = os.environ.get('SSH_CONTROL_DIR', '/tmp/linuxbroker-ssh')
+SSH_IDLE_TIMEOUT = int(os.environ.get('SSH_IDLE_TIMEOUT', 300))
+SSH_CONNECT_TIMEOUT = int(os.environ.get('SSH_CONNECT_TIMEOUT', 10))
+SSH_KEY_DIR = os.environ.get('SSH_KEY_DIR') or None
+SSH_KEY_REFRESH_INTERVAL = int(os.environ.get('SSH_KEY_REFRESH_INTERVAL', 3600))
+RELEASE_GRACE_PERIOD_MINUTES = int(os.environ.get('RELEASE_GRACE_PERIOD_MINUTES', 30))
+USER_CLEANUP_CONCURRENCY = int(os.environ.get('USER_CLEANUP_CONCURRENCY', 10))
+USER_CLEANUP_TIMEOUT = int(os.environ.get('USER_CLEANUP_TIMEOUT', 60))
+USER_CLEANUP_MAX_ATTEMPTS = int(os.environ.get('USER_CLEANUP_MAX_ATTEMPTS', 10))
+SCALING_CONCURRENCY = int(os.environ.get('SCALING_CONCURRENCY', 10))
+SCALING_OPERATION_TIMEOUT = int(os.environ.get('SCALING_OPERATION_TIMEOUT', 900))
+SCALING_WAIT_TIMEOUT = int(os.environ.get('SCALING_WAIT_TIMEOUT', 60))
+POWER_STATE_TRANSITION_GRACE_MINUTES = int(os.environ.get('POWER_STATE_TRANSITION_GRACE_MINUTES', 15))
+SCALING_MODE = os.environ.get('SCALING_MODE', 'reactive').lower()
+SCALE_DOWN_MODE = os.environ.get('SCALE_DOWN_MODE', 'poweroff').lower()
+SCALE_DOWN_POLICY = os.environ.get('SCALE_DOWN_POLICY', 'health').lower()
+VM_HOURLY_COST = float(os.environ['VM_HOURLY_COST']) if os.environ.get('VM_HOURLY_COST') else None
+SCALING_FORECAST_LEAD_MINUTES = int(os.environ.get('SCALING_FORECAST_LEAD_MINUTES', 30))
+SCALING_FORECAST_HISTORY_DAYS = int(os.environ.get('SCALING_FORECAST_HISTORY_DAYS', 28))
+SCALING_FORECAST_BUCKET_MINUTES = int(os.environ.get('SCALING_FORECAST_BUCKET_MINUTES', 15))
+SCALING_FORECAST_QUANTILE = float(os.environ.get('SCALING_FORECAST_QUANTILE', 0.9))
+SCALING_FORECAST_REFRESH_INTERVAL = int(os.environ.get('SCALING_FORECAST_REFRESH_INTERVAL', 3600))
+SCALING_FORECAST_TIME_ZONE = os.environ.get('SCALING_FORECAST_TIME_ZONE', 'UTC')
+CHECKOUT_JOB_TTL = int(os.environ.get('CHECKOUT_JOB_TTL', 900))
+CHECKOUT_JOB_CONCURRENCY = int(os.environ.get('CHECKOUT_JOB_CONCURRENCY', 10))
+CHECKOUT_JOB_MAX_WAIT = int(os.environ.get('CHECKOUT_JOB_MAX_WAIT', 30))
+WAKE_ON_DEMAND_ENABLED = os.environ.get('WAKE_ON_DEMAND_ENABLED', 'false').lower() == 'true'
+WAKE_ON_DEMAND_RETRY_AFTER = int(os.environ.get('WAKE_ON_DEMAND_RETRY_AFTER', 15))
+WAKE_ON_DEMAND_BOOT_TIMEOUT = int(os.environ.get('WAKE_ON_DEMAND_BOOT_TIMEOUT', 300))
+PREPROVISIONING_ENABLED = os.environ.get('PREPROVISIONING_ENABLED', 'false').lower() == 'true'
+PREPROVISIONING_INTERVAL = int(os.environ.get('PREPROVISIONING_INTERVAL', 120))
+PREPROVISIONING_CONCURRENCY = int(os.environ.get('PREPROVISIONING_CONCURRENCY', 10))
+PREPROVISIONING_AFFINITY_DAYS = int(os.environ.get('PREPROVISIONING_AFFINITY_DAYS', 14))
+JWKS_URI = f"https://login.microsoftonline.com/{TENANT_ID}/discovery/v2.0/keys"
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 3600))
+JWKS_UNKNOWN_KID_TTL = int(os.environ.get('JWKS_UNKNOWN_KID_TTL', 300))
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+GROUP_MEMBERSHIP_CACHE_TTL = int(os.environ.get('GROUP_MEMBERSHIP_CACHE_TTL', 300))
+GRAPH_TOKEN_REFRESH_MARGIN = int(os.environ.get('GRAPH_TOKEN_REFRESH_MARGIN', 300))
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'SimpleCache')
+CACHE_DIR = os.environ.get('CACHE_DIR', '/tmp/linuxbroker-cache')
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get('VERIFIED_TOKEN_CACHE_SIZE', 1024))
 
 db_password = None
\ No newline at end of file
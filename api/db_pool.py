@@ -0,0 +1,194 @@
+import time
+import threading
+import logging
+
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Pooled Connection
+
+class PooledConnection:
+    def __init__(self, pool, conn, created_at, generation):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+        self._generation = generation
+        self._dirty = False
+        self._closed = False
+
+    def cursor(self, *args, **kwargs):
+        self._dirty = True
+        return self._conn.cursor(*args, **kwargs)
+
+    def commit(self):
+        self._conn.commit()
+        self._dirty = False
+
+    def rollback(self):
+        self._conn.rollback()
+        self._dirty = False
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool._release(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that return before calling close()
+        if not getattr(self, '_closed', True):
+            self._closed = True
+            self._pool._discard(self._conn)
+
+# ===============================
+# Connection Pool
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=10, max_lifetime=1800, checkout_timeout=10, health_check_interval=30):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._generation = 0
+        self._in_use = 0
+
+        self.created = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.health_check_failures = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out after {self.checkout_timeout}s waiting for a database connection.")
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+            self._in_use += 1
+
+        try:
+            conn = self._checkout_idle()
+            if conn is not None:
+                return conn
+
+            raw_conn = self._connect()
+            with self._lock:
+                self.created += 1
+                generation = self._generation
+            return PooledConnection(self, raw_conn, time.monotonic(), generation)
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+            raise
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                raw_conn, created_at, last_used, generation = self._idle.pop()
+                current_generation = self._generation
+
+            now = time.monotonic()
+            if generation != current_generation or now - created_at >= self.max_lifetime:
+                self._close_raw(raw_conn)
+                continue
+
+            if now - last_used >= self.health_check_interval and not self._is_healthy(raw_conn):
+                with self._lock:
+                    self.health_check_failures += 1
+                self._close_raw(raw_conn)
+                continue
+
+            return PooledConnection(self, raw_conn, created_at, generation)
+
+    def _is_healthy(self, raw_conn):
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning("Discarding unhealthy database connection: %s", e)
+            return False
+
+    def _release(self, conn):
+        raw_conn = conn._conn
+        reusable = conn._generation == self._generation and time.monotonic() - conn._created_at < self.max_lifetime
+
+        if reusable and conn._dirty:
+            try:
+                raw_conn.rollback()
+            except Exception as e:
+                logger.warning("Discarding database connection that failed to roll back: %s", e)
+                reusable = False
+
+        if reusable:
+            with self._lock:
+                self._idle.append((raw_conn, conn._created_at, time.monotonic(), conn._generation))
+                self._in_use -= 1
+            self._slots.release()
+        else:
+            self._discard(raw_conn)
+
+    def _discard(self, raw_conn):
+        self._close_raw(raw_conn)
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def _close_raw(self, raw_conn):
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.closed += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            stale = list(self._idle)
+            self._idle.clear()
+        for raw_conn, _, _, _ in stale:
+            self._close_raw(raw_conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "health_check_failures": self.health_check_failures,
+                "avg_wait_ms": round(self.total_wait_time * 1000 / self.checkouts, 2) if self.checkouts else 0,
+                "max_wait_ms": round(self.max_wait_time * 1000, 2)
+            }
@@ -0,0 +1,115 @@
+import time
+import threading
+
+from types import SimpleNamespace
+
+# ===============================
+# Fake Compute Client
+#
+# In-memory stand-in for ComputeManagementClient, selected with AZURE_COMPUTE_BACKEND=fake.
+# It only implements the virtual machine operations the broker uses and simulates their latency,
+# so the scaling and reconciliation paths can be run and benchmarked without an Azure subscription.
+
+POWER_STATE_CODES = {
+    'running': 'PowerState/running',
+    'starting': 'PowerState/starting',
+    'stopping': 'PowerState/stopping',
+    'stopped': 'PowerState/stopped',
+    'deallocating': 'PowerState/deallocating',
+    'deallocated': 'PowerState/deallocated'
+}
+
+class FakePoller:
+    def __init__(self, duration, on_done=None, error=None):
+        self._completes_at = time.monotonic() + duration
+        self._on_done = on_done
+        self._error = error
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def _finish(self):
+        with self._lock:
+            if not self._finished and time.monotonic() >= self._completes_at:
+                self._finished = True
+                if self._on_done and self._error is None:
+                    self._on_done()
+            return self._finished
+
+    def done(self):
+        return self._finish()
+
+    def wait(self, timeout=None):
+        remaining = self._completes_at - time.monotonic()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        if remaining > 0:
+            time.sleep(remaining)
+        self._finish()
+
+    def status(self):
+        if not self.done():
+            return 'InProgress'
+        return 'Failed' if self._error else 'Succeeded'
+
+    def result(self, timeout=None):
+        self.wait(timeout)
+        if self._error:
+            raise self._error
+        return None
+
+class FakeVirtualMachinesOperations:
+    def __init__(self, operation_seconds=30.0, request_seconds=0.2, failure_vms=None):
+        self.operation_seconds = operation_seconds
+        self.request_seconds = request_seconds
+        self.failure_vms = set(failure_vms or [])
+
+        self._power_states = {}
+        self._lock = threading.Lock()
+
+    def add_vm(self, resource_group, vm_name, power_state='deallocated'):
+        with self._lock:
+            self._power_states[(resource_group.lower(), vm_name)] = power_state
+
+    def _set_power_state(self, resource_group, vm_name, power_state):
+        with self._lock:
+            self._power_states[(resource_group.lower(), vm_name)] = power_state
+
+    def _begin(self, resource_group, vm_name, transitional_state, final_state):
+        # Simulates the initial PUT/POST round trip before Azure hands back the poller
+        time.sleep(self.request_seconds)
+        if vm_name in self.failure_vms:
+            return FakePoller(self.operation_seconds, error=RuntimeError(f"Simulated failure for VM '{vm_name}'."))
+
+        self._set_power_state(resource_group, vm_name, transitional_state)
+        return FakePoller(self.operation_seconds, on_done=lambda: self._set_power_state(resource_group, vm_name, final_state))
+
+    def begin_start(self, resource_group_name, vm_name, **kwargs):
+        return self._begin(resource_group_name, vm_name, 'starting', 'running')
+
+    def begin_power_off(self, resource_group_name, vm_name, **kwargs):
+        return self._begin(resource_group_name, vm_name, 'stopping', 'stopped')
+
+    def begin_deallocate(self, resource_group_name, vm_name, **kwargs):
+        return self._begin(resource_group_name, vm_name, 'deallocating', 'deallocated')
+
+    def _instance_view(self, power_state):
+        return SimpleNamespace(statuses=[
+            SimpleNamespace(code='ProvisioningState/succeeded'),
+            SimpleNamespace(code=POWER_STATE_CODES[power_state])
+        ])
+
+    def list_all(self, status_only=None, **kwargs):
+        time.sleep(self.request_seconds)
+        with self._lock:
+            vms = list(self._power_states.items())
+
+        for (resource_group, vm_name), power_state in vms:
+            yield SimpleNamespace(
+                id=f"/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/{resource_group}/providers/Microsoft.Compute/virtualMachines/{vm_name}",
+                name=vm_name,
+                instance_view=self._instance_view(power_state) if status_only == 'true' else None
+            )
+
+class FakeComputeClient:
+    def __init__(self, operation_seconds=30.0, request_seconds=0.2, failure_vms=None):
+        self.virtual_machines = FakeVirtualMachinesOperations(operation_seconds, request_seconds, failure_vms)
@@ -0,0 +1,164 @@
+import math
+import time
+import threading
+import logging
+
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Forecast methods, from most to least specific
+SAME_WEEKDAY = 'same_weekday'
+SAME_TIME_OF_DAY = 'same_time_of_day'
+NO_HISTORY = 'no_history'
+
+def quantile(values, q):
+    # Nearest-rank quantile, so the forecast is always a demand that was actually observed
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+# ===============================
+# Demand Forecaster
+
+class DemandForecaster:
+    def __init__(self, get_connection, history_days=28, bucket_minutes=15, lead_minutes=30, quantile=0.9, min_weeks=2, refresh_interval=3600, time_zone='UTC'):
+        self._get_connection = get_connection
+        self.history_days = history_days
+        self.bucket_minutes = bucket_minutes
+        self.lead_minutes = lead_minutes
+        self.quantile = quantile
+        self.min_weeks = min_weeks
+        self.refresh_interval = refresh_interval
+        self.time_zone = ZoneInfo(time_zone)
+
+        self._lock = threading.Lock()
+        self._by_weekday_slot = {}
+        self._by_slot = {}
+        self._pools = []
+        self._loaded_at = None
+
+        self.forecasts = 0
+        self.history_loads = 0
+        self.history_load_errors = 0
+        self.last_forecast = None
+
+    def _local(self, moment):
+        # Users keep to the local wall clock, so bucket by local time to keep curves aligned across DST changes
+        return moment.replace(tzinfo=timezone.utc).astimezone(self.time_zone).replace(tzinfo=None)
+
+    def _slot(self, moment):
+        return (moment.hour * 60 + moment.minute) // self.bucket_minutes
+
+    def _load_history(self):
+        conn = self._get_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed.")
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute(
+                    "EXEC GetScalingDemandHistory @Days = %s, @BucketMinutes = %s",
+                    (self.history_days, self.bucket_minutes)
+                )
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        # Learn one demand curve per weekday and one across all days for every pool, keyed by time-of-day slot
+        by_weekday_slot = {}
+        by_slot = {}
+        pools = []
+        for row in rows:
+            pool = row['PoolName']
+            if pool not in pools:
+                pools.append(pool)
+            in_use = max(row['CheckedOutVMs'] or 0, row['LoggedInUseVMs'] or 0)
+            bucket_start = self._local(row['BucketStart'])
+            slot = self._slot(bucket_start)
+            by_weekday_slot.setdefault((pool, bucket_start.weekday(), slot), []).append(in_use)
+            by_slot.setdefault((pool, slot), []).append(in_use)
+        return by_weekday_slot, by_slot, pools
+
+    def _refresh(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return self._by_weekday_slot, self._by_slot, self._pools
+
+        try:
+            by_weekday_slot, by_slot, pools = self._load_history()
+        except Exception:
+            with self._lock:
+                self.history_load_errors += 1
+                # Keep forecasting from the previous history rather than failing every scaling run
+                if self._loaded_at is not None:
+                    logger.exception("Failed to reload scaling demand history, using the previous one")
+                    return self._by_weekday_slot, self._by_slot, self._pools
+            raise
+
+        with self._lock:
+            self._by_weekday_slot = by_weekday_slot
+            self._by_slot = by_slot
+            self._pools = pools
+            self._loaded_at = time.monotonic()
+            self.history_loads += 1
+        return by_weekday_slot, by_slot, pools
+
+    def _forecast_pool(self, by_weekday_slot, by_slot, pool, now, window_end):
+        # Demand expected between now and when a VM started now is ready to use
+        forecast_in_use = 0
+        method = NO_HISTORY
+        samples = 0
+        moment = now
+        while moment <= window_end:
+            local_moment = self._local(moment)
+            slot = self._slot(local_moment)
+            values = by_weekday_slot.get((pool, local_moment.weekday(), slot), [])
+            slot_method = SAME_WEEKDAY
+            if len(values) < self.min_weeks:
+                values = by_slot.get((pool, slot), [])
+                slot_method = SAME_TIME_OF_DAY
+
+            if values:
+                estimate = quantile(values, self.quantile)
+                if method == NO_HISTORY or estimate > forecast_in_use:
+                    forecast_in_use = estimate
+                    method = slot_method
+                    samples = len(values)
+
+            moment += timedelta(minutes=self.bucket_minutes)
+
+        return {
+            "PoolName": pool,
+            "ForecastInUseVMs": math.ceil(forecast_in_use),
+            "Method": method,
+            "Samples": samples
+        }
+
+    def forecast(self, now=None):
+        # History buckets and the reported window are in UTC; slots are looked up in local time
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        by_weekday_slot, by_slot, pools = self._refresh()
+
+        window_end = now + timedelta(minutes=self.lead_minutes)
+        pool_forecasts = [self._forecast_pool(by_weekday_slot, by_slot, pool, now, window_end) for pool in pools]
+
+        result = {
+            "ForecastInUseVMs": sum(pool_forecast["ForecastInUseVMs"] for pool_forecast in pool_forecasts),
+            "Pools": pool_forecasts,
+            "WindowStart": now.isoformat(timespec='minutes'),
+            "WindowEnd": window_end.isoformat(timespec='minutes')
+        }
+
+        with self._lock:
+            self.forecasts += 1
+            self.last_forecast = result
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "forecasts": self.forecasts,
+                "history_loads": self.history_loads,
+                "history_load_errors": self.history_load_errors,
+                "last_forecast": self.last_forecast
+            }
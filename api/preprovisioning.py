@@ -0,0 +1,149 @@
+import time
+import threading
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from remote_provisioning import prime_host, is_user_staged
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Pre-Provisioner
+
+class PreProvisioner:
+    def __init__(self, ssh_manager, get_connection, cache, groups, interval=120, concurrency=10, affinity_days=14, timeout=60):
+        self.ssh_manager = ssh_manager
+        self._get_connection = get_connection
+        self._cache = cache
+        self.groups = list(groups)
+        self.interval = interval
+        self.concurrency = concurrency
+        self.affinity_days = affinity_days
+        self.timeout = timeout
+
+        # Primed state outlives a couple of missed cycles, then expires so checkout falls back to full provisioning
+        self.state_ttl = interval * 3
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.cycles = 0
+        self.cycle_errors = 0
+        self.hosts_primed = 0
+        self.prime_failures = 0
+        self.users_staged = 0
+        self.last_cycle_ms = None
+
+    @staticmethod
+    def _host_key(hostname):
+        return f"preprovisioned_host:{hostname}"
+
+    @staticmethod
+    def _user_key(username):
+        return f"preprovisioned_user:{username}"
+
+    def get_vms_to_prime(self):
+        conn = self._get_connection()
+        if conn is None:
+            raise RuntimeError("Failed to connect to database.")
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.callproc('GetVmsToPrime', (self.affinity_days,))
+                rows = cursor.fetchall()
+                conn.commit()
+        finally:
+            conn.close()
+        return rows
+
+    def is_still_available(self, vm):
+        conn = self._get_connection()
+        if conn is None:
+            raise RuntimeError("Failed to connect to database.")
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.callproc('GetVmDetails', (vm['VMID'],))
+                row = cursor.fetchone()
+        finally:
+            conn.close()
+        return bool(row) and row['VmStatus'] == 'Available' and row['PowerState'] == 'On'
+
+    def prime(self, vm):
+        hostname = vm['Hostname']
+        staged_username = vm.get('StagedUsername')
+
+        # The VM may have been checked out since the cycle listed it. The remote lock keeps priming from removing an
+        # account that is being activated, this keeps it off VMs that are now in use at all.
+        if not self.is_still_available(vm):
+            logger.info("Skipping priming of VM '%s', it is no longer available.", hostname)
+            return None
+
+        outcome = prime_host(self.ssh_manager, hostname, staged_username, self.groups, timeout=self.timeout)
+        if not outcome["success"]:
+            logger.warning("Failed to prime VM '%s': %s", hostname, outcome.get("error"))
+            self._cache.delete(self._host_key(hostname))
+            return outcome
+
+        staged = staged_username if staged_username and is_user_staged(outcome) else None
+        self._cache.set(self._host_key(hostname), {"VMID": vm['VMID'], "StagedUsername": staged}, timeout=self.state_ttl)
+        if staged:
+            self._cache.set(self._user_key(staged), {"VMID": vm['VMID'], "Hostname": hostname}, timeout=self.state_ttl)
+        return outcome
+
+    def run_once(self):
+        started = time.monotonic()
+        vms = self.get_vms_to_prime()
+
+        outcomes = []
+        if vms:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(vms))) as executor:
+                outcomes = [outcome for outcome in executor.map(self.prime, vms) if outcome is not None]
+
+        with self._lock:
+            self.cycles += 1
+            self.hosts_primed += sum(1 for outcome in outcomes if outcome["success"])
+            self.prime_failures += sum(1 for outcome in outcomes if not outcome["success"])
+            self.users_staged += sum(1 for outcome in outcomes if outcome["success"] and is_user_staged(outcome))
+            self.last_cycle_ms = int((time.monotonic() - started) * 1000)
+
+        return outcomes
+
+    def staged_vm_for(self, username):
+        entry = self._cache.get(self._user_key(username))
+        return entry["VMID"] if entry else None
+
+    def is_staged(self, hostname, username):
+        entry = self._cache.get(self._host_key(hostname))
+        return bool(entry) and entry.get("StagedUsername") == username
+
+    def mark_checked_out(self, hostname, username):
+        self._cache.delete(self._host_key(hostname))
+        entry = self._cache.get(self._user_key(username))
+        if entry and entry.get("Hostname") == hostname:
+            self._cache.delete(self._user_key(username))
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._lock:
+                    self.cycle_errors += 1
+                logger.error("Pre-provisioning cycle failed: %s", e)
+            time.sleep(self.interval)
+
+    def start_background_priming(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cycles": self.cycles,
+                "cycle_errors": self.cycle_errors,
+                "hosts_primed": self.hosts_primed,
+                "prime_failures": self.prime_failures,
+                "users_staged": self.users_staged,
+                "last_cycle_ms": self.last_cycle_ms
+            }
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Azure instance view power state codes and the PowerState the broker records for them
+AZURE_POWER_STATES = {
+    'PowerState/running': 'On',
+    'PowerState/starting': 'Starting',
+    'PowerState/stopping': 'Stopping',
+    'PowerState/deallocating': 'Stopping',
+    'PowerState/stopped': 'Off',
+    'PowerState/deallocated': 'Off'
+}
+
+def get_azure_power_states(compute_client, resource_group):
+    # statusOnly lists the run time status of every VM in the subscription in one paged call
+    power_states = {}
+    for vm in compute_client.virtual_machines.list_all(status_only='true'):
+        id_parts = (vm.id or '').split('/')
+        if len(id_parts) < 5 or id_parts[4].lower() != resource_group.lower():
+            continue
+
+        statuses = vm.instance_view.statuses if vm.instance_view and vm.instance_view.statuses else []
+        for status in statuses:
+            power_state = AZURE_POWER_STATES.get(status.code)
+            if power_state:
+                power_states[vm.name] = power_state
+                break
+    return power_states
+
+# ===============================
+# Power State Reconciler
+
+class PowerStateReconciler:
+    def __init__(self, transition_grace_minutes=15):
+        self.transition_grace_minutes = transition_grace_minutes
+
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.run_errors = 0
+        self.corrections = 0
+        self.last_run = None
+
+    def reconcile(self, compute_client, resource_group, get_connection):
+        started = time.monotonic()
+        try:
+            power_states = get_azure_power_states(compute_client, resource_group)
+            listed_ms = int((time.monotonic() - started) * 1000)
+
+            # An empty listing is far more likely a permission or configuration problem than an empty pool
+            if not power_states:
+                raise RuntimeError(f"No VMs with a power state were found in resource group '{resource_group}'.")
+
+            conn = get_connection()
+            if not conn:
+                raise RuntimeError("Database connection failed.")
+            try:
+                with conn.cursor(as_dict=True) as cursor:
+                    cursor.execute(
+                        "EXEC ReconcileVmPowerStates @PowerStates = %s, @TransitionGraceMinutes = %s",
+                        (json.dumps([{"Hostname": name, "PowerState": state} for name, state in power_states.items()]), self.transition_grace_minutes)
+                    )
+                    corrections = cursor.fetchall()
+                    cursor.nextset()
+                    missing_in_azure = cursor.fetchall()
+                    conn.commit()
+            finally:
+                conn.close()
+        except Exception:
+            with self._lock:
+                self.runs += 1
+                self.run_errors += 1
+            raise
+
+        drift = {}
+        for correction in corrections:
+            transition = f"{correction['PreviousPowerState']}->{correction['PowerState']}"
+            drift[transition] = drift.get(transition, 0) + 1
+
+        result = {
+            "AzureVMs": len(power_states),
+            "Corrections": corrections,
+            "Drift": drift,
+            "MissingInAzure": missing_in_azure,
+            "ListDurationMs": listed_ms,
+            "DurationMs": int((time.monotonic() - started) * 1000)
+        }
+
+        if corrections:
+            logger.warning("Corrected the power state of %d VMs: %s", len(corrections), drift)
+
+        with self._lock:
+            self.runs += 1
+            self.corrections += len(corrections)
+            self.last_run = {key: value for key, value in result.items() if key != "Corrections"}
+            self.last_run["Corrections"] = len(corrections)
+            self.last_run["MissingInAzure"] = len(missing_in_azure)
+
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "run_errors": self.run_errors,
+                "corrections": self.corrections,
+                "last_run": self.last_run
+            }
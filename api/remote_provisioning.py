@@ -0,0 +1,180 @@
+import time
+import shlex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Remote Scripts
+#
+# Each script runs as a single remote execution and prints one line per step:
+#   STEP <tab> name <tab> return code <tab> duration in ms <tab> output
+
+STEP_FUNCTION = r'''
+step() {
+    local name="$1"; shift
+    local start end output rc
+    start=$(date +%s%N)
+    output=$("$@" 2>&1)
+    rc=$?
+    end=$(date +%s%N)
+    printf 'STEP\t%s\t%d\t%d\t%s\n' "$name" "$rc" $(( (end - start) / 1000000 )) "$(printf '%s' "$output" | tr '\t\n' '  ')"
+    return $rc
+}
+'''
+
+PROVISION_USER_SCRIPT = STEP_FUNCTION + r'''
+USERNAME="$1"; shift
+IFS= read -r PASSWORD
+
+ensure_user() { id -u "$USERNAME" >/dev/null 2>&1 || useradd -m "$USERNAME"; }
+set_password() { printf '%s:%s\n' "$USERNAME" "$PASSWORD" | chpasswd; }
+ensure_group() { getent group "$1" >/dev/null 2>&1 || groupadd "$1"; }
+add_to_group() { id -nG "$USERNAME" | tr ' ' '\n' | grep -qx "$1" || usermod -aG "$1" "$USERNAME"; }
+
+step ensure_user ensure_user || exit 1
+step set_password set_password || exit 1
+for group in "$@"; do
+    step "ensure_group:$group" ensure_group "$group" || exit 1
+done
+for group in "$@"; do
+    step "add_to_group:$group" add_to_group "$group"
+done
+exit 0
+'''
+
+DEPROVISION_USER_SCRIPT = STEP_FUNCTION + r'''
+USERNAME="$1"
+
+user_exists() { id -u "$USERNAME" >/dev/null 2>&1; }
+terminate_processes() { pkill -KILL -u "$USERNAME"; [ $? -le 1 ]; }
+delete_user() { userdel -r "$USERNAME"; rc=$?; [ $rc -eq 0 ] || [ $rc -eq 12 ]; }
+
+if ! step user_exists user_exists; then
+    exit 0
+fi
+step terminate_processes terminate_processes
+step delete_user delete_user || exit 1
+exit 0
+'''
+
+# Accounts created ahead of checkout are locked and kept in this group until they are activated
+STAGED_USERS_GROUP = 'linuxbroker-staged'
+
+# Priming removes staged accounts, so it must never run while a staged account is being activated for a checkout.
+# Both scripts hold this lock on fd 9 for their whole run; the lock stays with the open file until the script exits.
+STAGED_USERS_LOCK = r'''
+lock_staged_users() { flock -w 30 9; }
+exec 9>/run/lock/linuxbroker-staged.lock || exit 1
+step lock_staged_users lock_staged_users || exit 1
+'''
+
+PRIME_HOST_SCRIPT = STEP_FUNCTION + r'''
+STAGED_USER="$1"; shift
+STAGED_GROUP="''' + STAGED_USERS_GROUP + r'''"
+
+ensure_group() { getent group "$1" >/dev/null 2>&1 || groupadd "$1"; }
+remove_stale_staged_users() {
+    local member
+    for member in $(getent group "$STAGED_GROUP" | cut -d: -f4 | tr ',' ' '); do
+        [ "$member" = "$STAGED_USER" ] && continue
+        pkill -KILL -u "$member"
+        userdel -r "$member" || [ $? -eq 12 ] || return 1
+    done
+}
+stage_user() {
+    if id -u "$STAGED_USER" >/dev/null 2>&1; then
+        # Never take over an account that was not staged by this script
+        id -nG "$STAGED_USER" | tr ' ' '\n' | grep -qx "$STAGED_GROUP" || return 2
+    else
+        useradd -m "$STAGED_USER" && passwd -l "$STAGED_USER" >/dev/null || return 1
+    fi
+    usermod -aG "$(IFS=,; echo "$STAGED_GROUP,$*")" "$STAGED_USER"
+}
+''' + STAGED_USERS_LOCK + r'''
+step "ensure_group:$STAGED_GROUP" ensure_group "$STAGED_GROUP" || exit 1
+for group in "$@"; do
+    step "ensure_group:$group" ensure_group "$group" || exit 1
+done
+step remove_stale_staged_users remove_stale_staged_users
+if [ -n "$STAGED_USER" ]; then
+    step stage_user stage_user "$@"
+fi
+exit 0
+'''
+
+ACTIVATE_STAGED_USER_SCRIPT = STEP_FUNCTION + r'''
+USERNAME="$1"
+STAGED_GROUP="''' + STAGED_USERS_GROUP + r'''"
+IFS= read -r PASSWORD
+
+is_staged() { id -nG "$USERNAME" 2>/dev/null | tr ' ' '\n' | grep -qx "$STAGED_GROUP"; }
+set_password() { printf '%s:%s\n' "$USERNAME" "$PASSWORD" | chpasswd; }
+unstage() { gpasswd -d "$USERNAME" "$STAGED_GROUP" >/dev/null; }
+''' + STAGED_USERS_LOCK + r'''
+step is_staged is_staged || exit 3
+step set_password set_password || exit 1
+step unstage unstage || exit 1
+exit 0
+'''
+
+# ===============================
+# Functions
+
+def parse_steps(output):
+    steps = []
+    for line in output.splitlines():
+        parts = line.split('\t', 4)
+        if len(parts) < 4 or parts[0] != 'STEP':
+            continue
+        steps.append({
+            "step": parts[1],
+            "returncode": int(parts[2]),
+            "duration_ms": int(parts[3]),
+            "output": parts[4].strip() if len(parts) > 4 else ""
+        })
+    return steps
+
+def run_remote_script(ssh_manager, hostname, script, args, input=None, timeout=None):
+    command = "sudo bash -c " + shlex.quote(script) + " " + " ".join(shlex.quote(arg) for arg in ['linuxbroker'] + list(args))
+
+    started = time.monotonic()
+    try:
+        result = ssh_manager.run(hostname, command, input=input, timeout=timeout)
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "steps": [],
+            "duration_ms": int((time.monotonic() - started) * 1000)
+        }
+
+    outcome = {
+        "success": result.returncode == 0,
+        "steps": parse_steps(result.stdout),
+        "duration_ms": int((time.monotonic() - started) * 1000)
+    }
+    if result.returncode != 0:
+        outcome["error"] = result.stderr.strip() or f"Remote script exited with code {result.returncode}"
+    return outcome
+
+def provision_user(ssh_manager, hostname, username, password, groups):
+    return run_remote_script(ssh_manager, hostname, PROVISION_USER_SCRIPT, [username] + list(groups), input=password + "\n")
+
+def deprovision_user(ssh_manager, hostname, username, timeout=None):
+    return run_remote_script(ssh_manager, hostname, DEPROVISION_USER_SCRIPT, [username], timeout=timeout)
+
+def prime_host(ssh_manager, hostname, staged_username, groups, timeout=None):
+    return run_remote_script(ssh_manager, hostname, PRIME_HOST_SCRIPT, [staged_username or ''] + list(groups), timeout=timeout)
+
+def activate_staged_user(ssh_manager, hostname, username, password):
+    return run_remote_script(ssh_manager, hostname, ACTIVATE_STAGED_USER_SCRIPT, [username], input=password + "\n")
+
+def is_user_staged(outcome):
+    return any(step["step"] == "stage_user" and step["returncode"] == 0 for step in outcome["steps"])
+
+def summarize_steps(outcome):
+    return {
+        "duration_ms": outcome["duration_ms"],
+        "steps": {step["step"]: step["duration_ms"] for step in outcome["steps"]}
+    }
@@ -0,0 +1,220 @@
+import os
+import time
+import threading
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# SSH Key Cache
+
+class SshKeyCache:
+    def __init__(self, load_key, key_dir=None, refresh_interval=3600, file_name='linuxbroker_private_key.pem'):
+        if key_dir is None:
+            # Prefer tmpfs so the key never touches persistent storage
+            key_dir = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else '/tmp'
+
+        self._load_key = load_key
+        self.key_path = os.path.join(key_dir, file_name)
+        self.refresh_interval = refresh_interval
+
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+        self.loads = 0
+        self.load_errors = 0
+
+    def _write(self, pem_key):
+        temp_path = f"{self.key_path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, 'w') as pem_file:
+                pem_file.write(pem_key)
+            os.replace(temp_path, self.key_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def refresh(self):
+        with self._lock:
+            try:
+                pem_key = self._load_key()
+                self._write(pem_key)
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            except Exception as e:
+                self.load_errors += 1
+                logger.error("Failed to load SSH private key: %s", e)
+                if self._loaded_at is None:
+                    raise
+
+    def get_path(self):
+        if self._loaded_at is None or not os.path.exists(self.key_path):
+            self.refresh()
+        return self.key_path
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Background SSH key refresh failed: %s", e)
+
+    def start_background_refresh(self):
+        if self._refresh_thread is None:
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresh_thread.start()
+
+    def stats(self):
+        return {
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "seconds_since_load": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None
+        }
+
+# ===============================
+# SSH Connection Manager
+
+class SshConnectionManager:
+    def __init__(self, username, domain_name, key_cache, control_dir='/tmp/linuxbroker-ssh', idle_timeout=300, connect_timeout=10, command_timeout=120):
+        self.username = username
+        self.domain_name = domain_name
+        self.key_cache = key_cache
+        self.control_dir = control_dir
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+
+        self._last_used = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+        self._eviction_thread = None
+
+        self.commands = 0
+        self.auth_retries = 0
+        self.sessions_opened = 0
+        self.sessions_evicted = 0
+
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+
+    def host_fqdn(self, hostname):
+        return f"{self.username}@{hostname}.{self.domain_name}"
+
+    def _base_args(self, key_path):
+        # %C is a hash of the connection parameters, which keeps the socket path short
+        return [
+            'ssh',
+            '-i', key_path,
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'BatchMode=yes',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={os.path.join(self.control_dir, "%C")}',
+            '-o', f'ControlPersist={max(self.idle_timeout, 1)}'
+        ]
+
+    def _get_host_lock(self, hostname):
+        with self._lock:
+            host_lock = self._host_locks.get(hostname)
+            if host_lock is None:
+                host_lock = self._host_locks[hostname] = threading.Lock()
+            return host_lock
+
+    def run(self, hostname, command, input=None, timeout=None):
+        result = self._run(hostname, command, input, timeout)
+        if result.returncode == 255 and 'Permission denied' in result.stderr:
+            # The key may have been rotated in Key Vault, reload it once and retry
+            logger.warning("SSH authentication to '%s' failed, reloading the private key.", hostname)
+            with self._lock:
+                self.auth_retries += 1
+            self.key_cache.refresh()
+            result = self._run(hostname, command, input, timeout)
+        return result
+
+    def _run(self, hostname, command, input=None, timeout=None):
+        args = self._base_args(self.key_cache.get_path()) + [self.host_fqdn(hostname), command]
+        timeout = timeout or self.command_timeout
+
+        with self._lock:
+            self.commands += 1
+            has_session = hostname in self._last_used
+
+        if has_session:
+            result = subprocess.run(args, input=input, capture_output=True, text=True, timeout=timeout)
+        else:
+            # Serialise the first command per host so only one master connection is opened
+            with self._get_host_lock(hostname):
+                result = subprocess.run(args, input=input, capture_output=True, text=True, timeout=timeout)
+                if result.returncode != 255:
+                    with self._lock:
+                        if hostname not in self._last_used:
+                            self.sessions_opened += 1
+
+        with self._lock:
+            if result.returncode == 255:
+                # ssh itself failed, do not assume a master connection is available
+                self._last_used.pop(hostname, None)
+            else:
+                self._last_used[hostname] = time.monotonic()
+
+        return result
+
+    def wait_until_reachable(self, hostname, timeout, interval=5):
+        # A VM that has just started accepts SSH connections a while after Azure reports it running
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.run(hostname, 'true', timeout=self.connect_timeout + 5).returncode == 0:
+                    return True
+            except subprocess.TimeoutExpired:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+
+    def close(self, hostname):
+        args = ['ssh', '-o', f'ControlPath={os.path.join(self.control_dir, "%C")}', '-O', 'exit', self.host_fqdn(hostname)]
+        try:
+            subprocess.run(args, capture_output=True, text=True, timeout=self.connect_timeout)
+        except Exception as e:
+            logger.warning("Failed to close SSH session to '%s': %s", hostname, e)
+
+        with self._lock:
+            self._last_used.pop(hostname, None)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle_hosts = [hostname for hostname, last_used in self._last_used.items() if last_used < cutoff]
+
+        for hostname in idle_hosts:
+            self.close(hostname)
+            with self._lock:
+                self.sessions_evicted += 1
+                self._host_locks.pop(hostname, None)
+
+    def _eviction_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout // 2, 1))
+            self.evict_idle()
+
+    def start_idle_eviction(self):
+        if self._eviction_thread is None:
+            self._eviction_thread = threading.Thread(target=self._eviction_loop, daemon=True)
+            self._eviction_thread.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._last_used),
+                "commands": self.commands,
+                "auth_retries": self.auth_retries,
+                "sessions_opened": self.sessions_opened,
+                "sessions_evicted": self.sessions_evicted
+            }
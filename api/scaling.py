@@ -0,0 +1,148 @@
+import time
+import threading
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+POWER_ON = 'PowerOn'
+POWER_OFF = 'PowerOff'
+# Stops the VM and releases its compute, so it is no longer billed while off
+DEALLOCATE = 'Deallocate'
+
+# Power state a VM holds while its operation is in flight, and the state Azure confirms when it succeeds or fails
+TRANSITIONAL_POWER_STATES = {POWER_ON: 'Starting', POWER_OFF: 'Stopping', DEALLOCATE: 'Stopping'}
+CONFIRMED_POWER_STATES = {POWER_ON: 'On', POWER_OFF: 'Off', DEALLOCATE: 'Off'}
+REVERTED_POWER_STATES = {POWER_ON: 'Off', POWER_OFF: 'On', DEALLOCATE: 'On'}
+
+OPERATION_SUCCEEDED = 'Succeeded'
+OPERATION_FAILED = 'Failed'
+OPERATION_TIMED_OUT = 'TimedOut'
+
+# ===============================
+# Power Operation Executor
+
+class PowerOperationExecutor:
+    def __init__(self, max_workers=10, operation_timeout=900):
+        self.operation_timeout = operation_timeout
+
+        # Workers outlive the request that submitted them, so slow operations still complete and get recorded
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='power-op')
+        self._lock = threading.Lock()
+
+        self.operations = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.in_flight = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+    def _begin(self, compute_client, resource_group, action):
+        if action['ActionType'] == POWER_ON:
+            return compute_client.virtual_machines.begin_start(resource_group, action['VMName'])
+        if action['ActionType'] == POWER_OFF:
+            return compute_client.virtual_machines.begin_power_off(resource_group, action['VMName'])
+        if action['ActionType'] == DEALLOCATE:
+            return compute_client.virtual_machines.begin_deallocate(resource_group, action['VMName'])
+        raise ValueError(f"Unknown power action '{action['ActionType']}'.")
+
+    def _run(self, compute_client, resource_group, action, on_operation_complete):
+        started = time.monotonic()
+        outcome = {
+            "VMID": action.get('VMID'),
+            "VMName": action['VMName'],
+            "ActionType": action['ActionType']
+        }
+
+        try:
+            poller = self._begin(compute_client, resource_group, action)
+            poller.wait(self.operation_timeout)
+            if poller.done():
+                # result() raises if the operation finished in a failed state
+                poller.result()
+                outcome["Status"] = OPERATION_SUCCEEDED
+            else:
+                outcome["Status"] = OPERATION_TIMED_OUT
+                outcome["Error"] = f"Operation did not complete within {self.operation_timeout}s."
+        except Exception as e:
+            outcome["Status"] = OPERATION_FAILED
+            outcome["Error"] = str(e)
+
+        duration = time.monotonic() - started
+        outcome["DurationMs"] = int(duration * 1000)
+
+        with self._lock:
+            self.in_flight -= 1
+            self.total_duration += duration
+            self.max_duration = max(self.max_duration, duration)
+            if outcome["Status"] == OPERATION_SUCCEEDED:
+                self.succeeded += 1
+            elif outcome["Status"] == OPERATION_TIMED_OUT:
+                self.timed_out += 1
+            else:
+                self.failed += 1
+
+        if outcome["Status"] != OPERATION_SUCCEEDED:
+            logger.warning("%s of VM '%s' %s: %s", action['ActionType'], action['VMName'], outcome["Status"].lower(), outcome.get("Error"))
+
+        try:
+            on_operation_complete(outcome)
+        except Exception as e:
+            logger.error("Failed to record %s of VM '%s': %s", action['ActionType'], action['VMName'], e)
+
+        return outcome
+
+    def execute(self, compute_client, resource_group, actions, on_operation_complete, on_batch_complete, wait_timeout=None):
+        if not actions:
+            return [], []
+
+        with self._lock:
+            self.operations += len(actions)
+            self.in_flight += len(actions)
+
+        futures = [
+            self._executor.submit(self._run, compute_client, resource_group, action, on_operation_complete)
+            for action in actions
+        ]
+
+        remaining = [len(futures)]
+        remaining_lock = threading.Lock()
+
+        def on_future_done(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                is_last = remaining[0] == 0
+            if is_last:
+                try:
+                    on_batch_complete([future.result() for future in futures])
+                except Exception as e:
+                    logger.error("Failed to record power operation results: %s", e)
+
+        for future in futures:
+            future.add_done_callback(on_future_done)
+
+        done, _ = wait(futures, timeout=wait_timeout)
+        completed = [future.result() for future in futures if future in done]
+        pending = [action for action, future in zip(actions, futures) if future not in done]
+        return completed, pending
+
+    def stats(self):
+        with self._lock:
+            finished = self.succeeded + self.failed + self.timed_out
+            return {
+                "operations": self.operations,
+                "in_flight": self.in_flight,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "avg_duration_ms": round(self.total_duration * 1000 / finished, 2) if finished else 0,
+                "max_duration_ms": round(self.max_duration * 1000, 2)
+            }
+
+def summarize_outcomes(outcomes):
+    counts = {OPERATION_SUCCEEDED: 0, OPERATION_FAILED: 0, OPERATION_TIMED_OUT: 0}
+    for outcome in outcomes:
+        counts[outcome["Status"]] += 1
+    return f"{counts[OPERATION_SUCCEEDED]} of {len(outcomes)} power operations succeeded, {counts[OPERATION_FAILED]} failed, {counts[OPERATION_TIMED_OUT]} timed out"
@@ -11,7 +11,15 @@ $localUsername = $env:USERNAME -replace '[^a-zA-Z0-9_]', ''
 
 # Define the API endpoints
 $apiBaseUrl = "https://your_linuxbroker_api_base_url/api"
-$checkoutVmUrl = "$apiBaseUrl/vms/checkout"
+$checkoutVmUrl = "$apiBaseUrl/vms/checkout/async"
+$checkoutJobUrl = "$apiBaseUrl/vms/checkout/jobs"
+
+# Reused for every attempt so a retried checkout returns the same job instead of claiming another VM
+$idempotencyKey = [guid]::NewGuid().ToString()
+
+# Long-poll settings for the checkout job
+$jobWaitSeconds = 25
+$maxJobPolls = 12
 
 # Define the maximum number of update attempts
 $maxAttempts = 3
@@ -97,15 +105,28 @@ while ($attemptCount -lt $maxAttempts) {
         $checkoutResponse = Invoke-RestMethod -Uri $checkoutVmUrl -Method POST `
             -ContentType "application/json" `
             -Body ($checkoutPayload | ConvertTo-Json) `
-            -Headers $authHeader
-        
-        if ($checkoutResponse.VMID) {
+            -Headers ($authHeader + @{ "Idempotency-Key" = $idempotencyKey })
+
+        # Wait for the VM to start, if it was off, and for the user to be provisioned on it
+        $pollCount = 0
+        while ($checkoutResponse.Status -in @("pending", "starting", "provisioning") -and $pollCount -lt $maxJobPolls) {
+            $pollCount++
+            Write-Log "Waiting for checkout job $($checkoutResponse.JobId) ($($checkoutResponse.Status))..." "INFO"
+            $checkoutResponse = Invoke-RestMethod -Uri "$checkoutJobUrl/$($checkoutResponse.JobId)?wait=$jobWaitSeconds" -Method GET `
+                -Headers $authHeader `
+                -TimeoutSec ($jobWaitSeconds + 15)
+        }
+
+        if ($checkoutResponse.Status -eq "succeeded" -and $checkoutResponse.VMID) {
             $hasExistingCheckedInVM = $true
             Write-Log "Successfully checked out or retrieved an existing VM (VMID: $($checkoutResponse.VMID), Hostname: $($checkoutResponse.Hostname))." "INFO"
             break
         }
+        elseif ($checkoutResponse.Status -eq "failed") {
+            Write-Log "Checkout job $($checkoutResponse.JobId) failed: $($checkoutResponse.Error)" "WARNING"
+        }
         else {
-            Write-Log "Failed to retrieve VM information from API response." "WARNING"
+            Write-Log "Checkout job $($checkoutResponse.JobId) did not complete in time." "WARNING"
         }
     }
     catch {
@@ -0,0 +1,69 @@
+import sys
+import time
+import random
+import argparse
+import statistics
+
+from local_db import add_connection_arguments, connect, recreate_database, seed_virtual_machines, percentile
+
+def checkout(conn, username, avdhost):
+    started = time.perf_counter()
+    cursor = conn.cursor(as_dict=True)
+    cursor.callproc('CheckoutVm', (username, avdhost))
+    rows = cursor.fetchall()
+    conn.commit()
+    cursor.close()
+    return time.perf_counter() - started, rows
+
+def measure(args, include_indexes):
+    recreate_database(args, include_indexes=include_indexes)
+    checked_out = seed_virtual_machines(args, args.vms)
+
+    conn = connect(args)
+    existing_latencies = []
+    for username, avdhost in random.sample(checked_out, min(args.checkouts, len(checked_out))):
+        elapsed, rows = checkout(conn, username, avdhost)
+        existing_latencies.append(elapsed)
+
+    new_latencies = []
+    failures = 0
+    for i in range(args.checkouts):
+        elapsed, rows = checkout(conn, f"benchuser{i}", "benchavdhost")
+        new_latencies.append(elapsed)
+        if not rows or 'Message' in rows[0]:
+            failures += 1
+    conn.close()
+
+    return {
+        "existing": existing_latencies,
+        "new": new_latencies,
+        "failures": failures
+    }
+
+def report(label, latencies):
+    ms = [latency * 1000 for latency in latencies]
+    print(f"  {label:<28} mean {statistics.mean(ms):7.2f} ms   p50 {percentile(ms, 50):7.2f} ms   p99 {percentile(ms, 99):7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure CheckoutVm latency with and without the checkout indexes on a local SQL Server.")
+    add_connection_arguments(parser)
+    parser.add_argument("--vms", type=int, default=5000, help="Number of VMs to seed.")
+    parser.add_argument("--checkouts", type=int, default=200, help="Number of checkouts to time per lookup path.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not args.password:
+        print("Please provide --password or set BENCHMARK_DB_PASSWORD.")
+        sys.exit(1)
+
+    for include_indexes in (False, True):
+        random.seed(args.seed)
+        results = measure(args, include_indexes)
+        print(f"{'With' if include_indexes else 'Without'} checkout indexes ({args.vms} VMs):")
+        report("existing VM (returning user)", results["existing"])
+        report("available VM (new user)", results["new"])
+        if results["failures"]:
+            print(f"  {results['failures']} checkouts found no available VM")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import sys
+import time
+import argparse
+import threading
+import statistics
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from local_db import add_connection_arguments, connect, recreate_database, seed_virtual_machines, percentile
+
+DEADLOCK_ERROR = 1205
+
+def build_callers(args):
+    # Every Nth caller repeats the previous username to simulate a client retrying its own checkout
+    callers = []
+    for i in range(args.callers):
+        if args.retry_every and i and i % args.retry_every == 0:
+            callers.append(callers[-1])
+        else:
+            callers.append((f"stressuser{i}", f"stressavdhost{i % 50}"))
+    return callers
+
+def checkout_db(args, username, avdhost):
+    conn = connect(args)
+    try:
+        cursor = conn.cursor(as_dict=True)
+        started = time.perf_counter()
+        cursor.callproc('CheckoutVm', (username, avdhost))
+        rows = cursor.fetchall()
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        cursor.close()
+    finally:
+        conn.close()
+
+    if not rows:
+        return elapsed, None, "empty"
+    if 'Message' in rows[0]:
+        if rows[0].get('ErrorNumber') == DEADLOCK_ERROR:
+            return elapsed, None, "deadlock"
+        return elapsed, None, "error" if rows[0].get('ErrorNumber') else "no_vm"
+    return elapsed, rows[0]['VMID'], None
+
+def checkout_api(args, username, avdhost):
+    started = time.perf_counter()
+    response = requests.post(
+        args.api_url.rstrip('/') + '/api/vms/checkout',
+        json={"username": username, "avdhost": avdhost},
+        headers={"Authorization": f"Bearer {args.token}"},
+        timeout=args.timeout
+    )
+    elapsed = time.perf_counter() - started
+
+    if response.status_code == 200:
+        return elapsed, response.json().get('VMID'), None
+    if response.status_code == 409:
+        return elapsed, None, "no_vm"
+    if 'deadlock' in response.text.lower():
+        return elapsed, None, "deadlock"
+    return elapsed, None, "error"
+
+def run_storm(args, callers):
+    checkout = checkout_api if args.api_url else checkout_db
+    start_barrier = threading.Barrier(len(callers))
+
+    def call(caller):
+        username, avdhost = caller
+        start_barrier.wait()
+        try:
+            return caller, checkout(args, username, avdhost)
+        except Exception as e:
+            message = str(e).lower()
+            return caller, (0.0, None, "deadlock" if 'deadlock' in message or str(DEADLOCK_ERROR) in message else "error")
+
+    with ThreadPoolExecutor(max_workers=len(callers)) as executor:
+        return list(executor.map(call, callers))
+
+def report(results):
+    latencies = [elapsed * 1000 for _, (elapsed, _, _) in results if elapsed]
+    outcomes = Counter(error or "claimed" for _, (_, _, error) in results)
+
+    # A VM handed to more than one user is a duplicate allocation
+    users_per_vm = defaultdict(set)
+    # A user handed more than one VM means a retried checkout claimed a second VM
+    vms_per_user = defaultdict(set)
+    for caller, (_, vmid, _) in results:
+        if vmid is not None:
+            users_per_vm[vmid].add(caller)
+            vms_per_user[caller].add(vmid)
+
+    duplicate_vms = {vmid: users for vmid, users in users_per_vm.items() if len(users) > 1}
+    double_claims = {caller: vms for caller, vms in vms_per_user.items() if len(vms) > 1}
+
+    print(f"Requests: {len(results)}")
+    print(f"  claimed {outcomes['claimed']}   no VM {outcomes['no_vm']}   deadlocks {outcomes['deadlock']}   errors {outcomes['error'] + outcomes['empty']}")
+    if latencies:
+        print(f"  latency mean {statistics.mean(latencies):.2f} ms   p50 {percentile(latencies, 50):.2f} ms   p99 {percentile(latencies, 99):.2f} ms   max {max(latencies):.2f} ms")
+    print(f"  duplicate VM allocations: {len(duplicate_vms)}")
+    print(f"  users with more than one VM: {len(double_claims)}")
+    for vmid, users in list(duplicate_vms.items())[:10]:
+        print(f"    VMID {vmid} -> {sorted(users)}")
+
+    return not duplicate_vms and not double_claims and not outcomes['deadlock']
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire concurrent checkouts at CheckoutVm and report latency, duplicate allocations and deadlocks.")
+    add_connection_arguments(parser)
+    parser.add_argument("--vms", type=int, default=5000, help="Number of VMs to seed (every 10th is available).")
+    parser.add_argument("--callers", type=int, default=300, help="Number of simultaneous checkouts.")
+    parser.add_argument("--retry-every", type=int, default=10, help="Every Nth caller repeats the previous user's checkout (0 to disable).")
+    parser.add_argument("--api-url", help="Call POST /api/vms/checkout on a running Broker API instead of the stored procedure.")
+    parser.add_argument("--token", help="Bearer token for --api-url.")
+    parser.add_argument("--timeout", type=int, default=120, help="HTTP timeout in seconds for --api-url.")
+    parser.add_argument("--skip-setup", action="store_true", help="Do not recreate and seed the local database.")
+    args = parser.parse_args()
+
+    if (not args.api_url or not args.skip_setup) and not args.password:
+        print("Please provide --password or set BENCHMARK_DB_PASSWORD.")
+        sys.exit(1)
+    if args.api_url and not args.token:
+        print("Please provide --token when using --api-url.")
+        sys.exit(1)
+
+    if not args.skip_setup:
+        recreate_database(args)
+        seed_virtual_machines(args, args.vms)
+
+    results = run_storm(args, build_callers(args))
+    if not report(results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
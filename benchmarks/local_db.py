@@ -0,0 +1,87 @@
+import os
+import re
+import glob
+
+import pymssql
+
+SQL_QUERIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql_queries')
+DATABASE_NAME = 'linuxbroker'
+
+def add_connection_arguments(parser):
+    parser.add_argument("--server", default=os.environ.get("BENCHMARK_DB_SERVER", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("BENCHMARK_DB_PORT", 1433)))
+    parser.add_argument("--user", default=os.environ.get("BENCHMARK_DB_USER", "sa"))
+    parser.add_argument("--password", default=os.environ.get("BENCHMARK_DB_PASSWORD"))
+
+def connect(args, database=DATABASE_NAME, autocommit=False):
+    conn = pymssql.connect(server=args.server, port=args.port, user=args.user, password=args.password, database=database)
+    conn.autocommit(autocommit)
+    return conn
+
+def split_batches(sql):
+    return [batch.strip() for batch in re.split(r'^\s*GO\s*;?\s*$', sql, flags=re.MULTILINE | re.IGNORECASE) if batch.strip()]
+
+def schema_scripts(include_indexes=True):
+    scripts = sorted(glob.glob(os.path.join(SQL_QUERIES_DIR, '*.sql')))
+    if not include_indexes:
+        scripts = [script for script in scripts if '_create_index-' not in os.path.basename(script)]
+    return scripts
+
+def run_script(conn, path):
+    with open(path) as sql_file:
+        sql = sql_file.read()
+    cursor = conn.cursor()
+    for batch in split_batches(sql):
+        cursor.execute(batch)
+    cursor.close()
+
+def recreate_database(args, include_indexes=True):
+    conn = connect(args, database='master', autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        IF DB_ID('{DATABASE_NAME}') IS NOT NULL
+        BEGIN
+            ALTER DATABASE [{DATABASE_NAME}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;
+            DROP DATABASE [{DATABASE_NAME}];
+        END
+    """)
+    cursor.execute(f"CREATE DATABASE [{DATABASE_NAME}]")
+    conn.close()
+
+    conn = connect(args, autocommit=True)
+    for script in schema_scripts(include_indexes):
+        run_script(conn, script)
+    conn.close()
+
+def seed_virtual_machines(args, vm_count, available_every=10, checked_out_every=2):
+    # Every Nth VM is available, every Mth is checked out to a user, the rest are powered off
+    conn = connect(args, autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("""
+        WITH Numbers AS (
+            SELECT TOP (%d) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS N
+            FROM sys.all_objects a CROSS JOIN sys.all_objects b
+        )
+        INSERT INTO dbo.VirtualMachines (Hostname, IPAddress, PowerState, NetworkStatus, VmStatus, Username, AvdHost)
+        SELECT
+            CONCAT('linuxvm', N),
+            CONCAT('10.', N / 65536 %% 256, '.', N / 256 %% 256, '.', N %% 256),
+            CASE WHEN N %% %d = 0 OR N %% %d = 0 THEN 'On' ELSE 'Off' END,
+            'Reachable',
+            CASE WHEN N %% %d = 0 THEN 'Available' WHEN N %% %d = 0 THEN 'CheckedOut' ELSE 'Available' END,
+            CASE WHEN N %% %d <> 0 AND N %% %d = 0 THEN CONCAT('user', N) END,
+            CASE WHEN N %% %d <> 0 AND N %% %d = 0 THEN CONCAT('avdhost', N %% 50) END
+        FROM Numbers
+    """ % (vm_count, available_every, checked_out_every, available_every, checked_out_every,
+           available_every, checked_out_every, available_every, checked_out_every))
+    cursor.execute("SELECT Username, AvdHost FROM dbo.VirtualMachines WHERE VmStatus = 'CheckedOut'")
+    checked_out = cursor.fetchall()
+    conn.close()
+    return checked_out
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from fake_compute import FakeComputeClient
+from scaling import PowerOperationExecutor, POWER_ON
+
+RESOURCE_GROUP = 'benchmark-rg'
+
+def build_actions(count):
+    return [{"VMID": i, "VMName": f"linuxvm{i}", "ActionType": POWER_ON} for i in range(count)]
+
+def serial_scale_up(compute_client, actions):
+    # One VM at a time, waiting on each poller before starting the next
+    started = time.perf_counter()
+    for action in actions:
+        compute_client.virtual_machines.begin_start(RESOURCE_GROUP, action['VMName']).result()
+    return time.perf_counter() - started
+
+def concurrent_scale_up(compute_client, actions, workers):
+    executor = PowerOperationExecutor(max_workers=workers)
+    started = time.perf_counter()
+    completed, pending = executor.execute(compute_client, RESOURCE_GROUP, actions, lambda outcome: None, lambda outcomes: None)
+    elapsed = time.perf_counter() - started
+    failed = [outcome for outcome in completed if outcome["Status"] != "Succeeded"]
+    return elapsed, len(failed) + len(pending)
+
+def client_construction(runs):
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.compute import ComputeManagementClient
+
+    from azure_clients import get_compute_client
+
+    # Construction only: token acquisition needs a real identity and is not measured here
+    started = time.perf_counter()
+    for _ in range(runs):
+        ComputeManagementClient(credential=DefaultAzureCredential(), subscription_id="00000000-0000-0000-0000-000000000000")
+    per_call = (time.perf_counter() - started) / runs
+
+    started = time.perf_counter()
+    for _ in range(runs):
+        get_compute_client("00000000-0000-0000-0000-000000000000")
+    shared = (time.perf_counter() - started) / runs
+
+    return per_call, shared
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and concurrent scaling power operations against the fake compute backend.")
+    parser.add_argument("--vms", type=int, default=20, help="Number of VMs to power on.")
+    parser.add_argument("--operation-seconds", type=float, default=2.0, help="Simulated duration of each power operation.")
+    parser.add_argument("--request-seconds", type=float, default=0.2, help="Simulated latency of the call that starts each operation.")
+    parser.add_argument("--workers", type=int, nargs='+', default=[5, 10, 20], help="Worker pool sizes to measure.")
+    parser.add_argument("--client-runs", type=int, default=20, help="Iterations for the client construction comparison (0 to skip).")
+    args = parser.parse_args()
+
+    actions = build_actions(args.vms)
+    compute_client = FakeComputeClient(operation_seconds=args.operation_seconds, request_seconds=args.request_seconds)
+
+    print(f"Powering on {args.vms} VMs ({args.operation_seconds}s per operation, {args.request_seconds}s per request):")
+    serial = serial_scale_up(compute_client, actions)
+    print(f"  {'serial':<16} {serial:8.2f} s")
+    for workers in args.workers:
+        elapsed, failures = concurrent_scale_up(compute_client, actions, workers)
+        print(f"  {f'{workers} workers':<16} {elapsed:8.2f} s   {serial / elapsed:5.1f}x" + (f"   {failures} failed" if failures else ""))
+
+    if args.client_runs:
+        per_call, shared = client_construction(args.client_runs)
+        print("Compute client per scaling run:")
+        print(f"  {'new client':<16} {per_call * 1000:8.2f} ms")
+        print(f"  {'shared client':<16} {shared * 1000:8.4f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_SCRIPT = os.path.join(REPO_ROOT, 'linux_host', 'session_release_buffer', 'Ubuntu', 'release-session.sh')
+DEFAULT_XRDP_WHO = os.path.join(REPO_ROOT, 'linux_host', 'session_release_buffer', 'xrdp-who-xnc.sh')
+
+# Runs as a process named Xvnc that holds a client connection until told to disconnect
+FAKE_SESSION_CODE = """
+import sys, socket, time
+client = socket.create_connection(('127.0.0.1', int(sys.argv[1])))
+sys.stdin.readline()
+client.close()
+time.sleep(3600)
+"""
+
+class BrokerStub:
+    # Stands in for IMDS and the Broker API release endpoint and records when each release arrives
+    def __init__(self):
+        self.token_requests = 0
+        self.releases = []
+        self._release_event = threading.Event()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body):
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                stub.token_requests += 1
+                self._reply({"access_token": "benchmark", "expires_on": str(int(time.time()) + 3600)})
+
+            def do_POST(self):
+                hostname = self.path.rstrip('/').split('/')[-2]
+                stub.releases.append(time.perf_counter())
+                stub._release_event.set()
+                self._reply({"Hostname": hostname})
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def wait_for_release(self, since, timeout):
+        # Releases sent before the disconnect (such as the polling loop's "no session record" releases) are not counted
+        deadline = time.perf_counter() + timeout
+        while True:
+            released = [released_at for released_at in self.releases if released_at >= since]
+            remaining = deadline - time.perf_counter()
+            if released or remaining <= 0:
+                return released[0] if released else None
+            self._release_event.wait(remaining)
+            self._release_event.clear()
+
+class SessionListener:
+    # Plays the xrdp side of each session: accepts connections and closes them when the client does
+    def __init__(self):
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(128)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            connection, _ = self._socket.accept()
+            threading.Thread(target=self._hold, args=(connection,), daemon=True).start()
+
+    @staticmethod
+    def _hold(connection):
+        with connection:
+            while connection.recv(1024):
+                pass
+
+class FakeSessions:
+    def __init__(self, work_dir, port, count):
+        xvnc = os.path.join(work_dir, 'Xvnc')
+        if not os.path.exists(xvnc):
+            os.symlink(sys.executable, xvnc)
+        self._processes = [
+            subprocess.Popen([xvnc, '-c', FAKE_SESSION_CODE, str(port)], stdin=subprocess.PIPE, text=True)
+            for _ in range(count)
+        ]
+
+    def disconnect(self):
+        for process in self._processes:
+            try:
+                process.stdin.write('\n')
+                process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def close(self):
+        for process in self._processes:
+            process.kill()
+            process.wait()
+
+def start_watcher(args, work_dir, stub, mode):
+    env = dict(os.environ,
+        LOG_FILE=os.path.join(work_dir, 'release-session.log'),
+        LOCATION_PATH=work_dir,
+        PREVIOUS_USERS_FILE=os.path.join(work_dir, 'previous_users.txt'),
+        TOKEN_CACHE_FILE=os.path.join(work_dir, 'token'),
+        RELEASE_LOCK_FILE=os.path.join(work_dir, 'release.lockfile'),
+        XRDP_LOG_FILES=os.path.join(work_dir, 'xrdp.log'),
+        IMDS_ENDPOINT=f"{stub.url}/metadata/identity/oauth2/token",
+        API_BASE_URL=f"{stub.url}/api",
+        WATCH_INTERVAL=str(args.watch_interval),
+        DISCONNECT_DEBOUNCE=str(args.debounce),
+        POLL_INTERVAL=str(args.poll_interval)
+    )
+    command = ['bash', args.script] + (['--watch'] if mode == 'watch' else [])
+    return subprocess.Popen(command, env=env, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def stop_watcher(process):
+    # wait4 reports the CPU used by the watcher and every ps/ss/awk it ran and waited for
+    process.send_signal(signal.SIGKILL)
+    _, _, usage = os.wait4(process.pid, 0)
+    process.returncode = -signal.SIGKILL
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return usage.ru_utime + usage.ru_stime
+
+def measure_idle_cpu(args, work_dir, stub, listener, mode):
+    sessions = FakeSessions(work_dir, listener.port, args.sessions)
+    watcher = start_watcher(args, work_dir, stub, mode)
+    try:
+        time.sleep(args.idle_seconds)
+    finally:
+        cpu_seconds = stop_watcher(watcher)
+        sessions.close()
+    return cpu_seconds
+
+def measure_detection_latency(args, work_dir, stub, listener, mode):
+    latencies = []
+    interval = args.watch_interval if mode == 'watch' else args.poll_interval
+    watcher = start_watcher(args, work_dir, stub, mode)
+    try:
+        for _ in range(args.trials):
+            sessions = FakeSessions(work_dir, listener.port, args.sessions)
+            # Give the watcher a full cycle to see the sessions as active
+            time.sleep(interval + 2)
+
+            disconnected_at = time.perf_counter()
+            sessions.disconnect()
+            if args.events:
+                # xrdp logs every disconnect, which is what wakes the watcher early on a real host
+                with open(os.path.join(work_dir, 'xrdp.log'), 'a') as xrdp_log:
+                    xrdp_log.write("[INFO ] xrdp_mm_module_cleanup: client disconnected\n")
+
+            released_at = stub.wait_for_release(disconnected_at, interval * 2 + args.debounce + 30)
+            sessions.close()
+            latencies.append(released_at - disconnected_at if released_at else None)
+    finally:
+        stop_watcher(watcher)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure idle CPU and disconnect detection latency of release-session.sh in polling and watch mode.")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="release-session.sh to measure.")
+    parser.add_argument("--xrdp-who", default=DEFAULT_XRDP_WHO, help="xrdp-who script the watcher runs each cycle.")
+    parser.add_argument("--modes", nargs='+', choices=['poll', 'watch'], default=['poll', 'watch'], help="Modes to measure.")
+    parser.add_argument("--sessions", type=int, default=3, help="Number of simulated Xvnc sessions.")
+    parser.add_argument("--idle-seconds", type=int, default=120, help="How long to measure idle CPU for.")
+    parser.add_argument("--trials", type=int, default=3, help="Disconnects to time in each mode.")
+    parser.add_argument("--watch-interval", type=int, default=10, help="WATCH_INTERVAL for watch mode.")
+    parser.add_argument("--debounce", type=int, default=15, help="DISCONNECT_DEBOUNCE for watch mode.")
+    parser.add_argument("--poll-interval", type=int, default=60, help="POLL_INTERVAL for polling mode.")
+    parser.add_argument("--no-events", dest="events", action="store_false", help="Do not write an xrdp log line on disconnect.")
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        sys.exit("Run as root: the watcher reads every process's sockets through 'sudo ss' and writes its own log.")
+
+    stub = BrokerStub()
+    listener = SessionListener()
+    work_dir = tempfile.mkdtemp(prefix='session-watcher-')
+    shutil.copy(args.xrdp_who, os.path.join(work_dir, os.path.basename(DEFAULT_XRDP_WHO)))
+    open(os.path.join(work_dir, 'xrdp.log'), 'a').close()
+
+    try:
+        print(f"{args.sessions} sessions, watch every {args.watch_interval}s with {args.debounce}s debounce, poll every {args.poll_interval}s")
+        for mode in args.modes:
+            cpu_seconds = measure_idle_cpu(args, work_dir, stub, listener, mode)
+            latencies = measure_detection_latency(args, work_dir, stub, listener, mode)
+            measured = [latency for latency in latencies if latency is not None]
+
+            print(f"{mode}:")
+            print(f"  idle CPU            {cpu_seconds:8.3f} s over {args.idle_seconds}s ({cpu_seconds / args.idle_seconds * 100:.2f}% of one core, {cpu_seconds / args.idle_seconds * 3600:.1f} s/hour)")
+            if measured:
+                print(f"  detection latency   {min(measured):8.2f} s min, {sum(measured) / len(measured):.2f} s avg, {max(measured):.2f} s max" + (f", {len(latencies) - len(measured)} missed" if len(measured) < len(latencies) else ""))
+            else:
+                print("  detection latency   no release received")
+        print(f"IMDS token requests: {stub.token_requests}, release calls: {len(stub.releases)}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
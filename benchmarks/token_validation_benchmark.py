@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+
+import jwt
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+from auth_cache import VerifiedTokenCache
+
+AUDIENCE = "api://00000000-0000-0000-0000-000000000000"
+ISSUER = "https://sts.windows.net/00000000-0000-0000-0000-000000000000/"
+
+def build_tokens(private_key, count):
+    now = int(time.time())
+    tokens = []
+    for i in range(count):
+        claims = {
+            "aud": AUDIENCE,
+            "iss": ISSUER,
+            "oid": f"00000000-0000-0000-0000-{i:012d}",
+            "roles": ["AvdHost"],
+            "iat": now,
+            "nbf": now,
+            "exp": now + 3600
+        }
+        tokens.append(jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": "benchmark"}))
+    return tokens
+
+def validate(token, public_key):
+    return jwt.decode(token, key=public_key, algorithms=['RS256'], audience=[AUDIENCE], issuer=[ISSUER])
+
+def run_uncached(tokens, public_key, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        validate(tokens[i % len(tokens)], public_key)
+    return time.perf_counter() - start
+
+def run_cached(tokens, public_key, iterations, cache_size):
+    token_cache = VerifiedTokenCache(max_size=cache_size)
+    start = time.perf_counter()
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        payload = token_cache.get(token)
+        if payload is None:
+            payload = validate(token, public_key)
+            token_cache.put(token, payload)
+    return time.perf_counter() - start, token_cache.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare bearer token validations per second with and without the verified-token cache.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--callers", type=int, default=50, help="Number of distinct tokens (AVD hosts / Function Apps) in rotation.")
+    parser.add_argument("--cache-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key = private_key.public_key()
+    tokens = build_tokens(private_key, args.callers)
+
+    uncached_elapsed = run_uncached(tokens, public_key, args.iterations)
+    cached_elapsed, stats = run_cached(tokens, public_key, args.iterations, args.cache_size)
+
+    print(f"Iterations: {args.iterations}, distinct tokens: {args.callers}, cache size: {args.cache_size}")
+    print(f"Without cache: {args.iterations / uncached_elapsed:,.0f} validations/s ({uncached_elapsed * 1e6 / args.iterations:.1f} us/validation)")
+    print(f"With cache:    {args.iterations / cached_elapsed:,.0f} validations/s ({cached_elapsed * 1e6 / args.iterations:.1f} us/validation)")
+    print(f"Speed-up:      {uncached_elapsed / cached_elapsed:.1f}x")
+    print(f"Cache stats:   {stats}")
+
+if __name__ == '__main__':
+    main()
@@ -54,7 +54,13 @@ def register_route_scaling_management(app):
                     "scaleupratio": request.form['scaleupratio'],
                     "scaleupincrement": request.form['scaleupincrement'],
                     "scaledownratio": request.form['scaledownratio'],
-                    "scaledownincrement": request.form['scaledownincrement']
+                    "scaledownincrement": request.form['scaledownincrement'],
+                    "poolname": request.form.get('poolname', '').strip(),
+                    "daysofweek": ''.join(request.form.getlist('daysofweek')),
+                    "starttime": request.form.get('starttime', ''),
+                    "endtime": request.form.get('endtime', ''),
+                    "timezone": request.form.get('timezone', '').strip(),
+                    "priority": request.form.get('priority', '')
                 }
                 access_token = session.get("access_token")
                 if not access_token:
@@ -86,7 +92,13 @@ def register_route_scaling_management(app):
                     "scaleupratio": request.form['scaleupratio'],
                     "scaleupincrement": request.form['scaleupincrement'],
                     "scaledownratio": request.form['scaledownratio'],
-                    "scaledownincrement": request.form['scaledownincrement']
+                    "scaledownincrement": request.form['scaledownincrement'],
+                    "poolname": request.form.get('poolname', '').strip(),
+                    "daysofweek": ''.join(request.form.getlist('daysofweek')),
+                    "starttime": request.form.get('starttime', ''),
+                    "endtime": request.form.get('endtime', ''),
+                    "timezone": request.form.get('timezone', '').strip(),
+                    "priority": request.form.get('priority', '')
                 }
                 access_token = session.get("access_token")
                 if not access_token:
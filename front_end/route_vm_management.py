@@ -56,7 +56,8 @@ def register_route_vm_management(app):
                     "vmstatus": request.form['vmstatus'],
                     "username": request.form.get('username', ''),
                     "avdhost": request.form.get('avdhost', ''),
-                    "description": request.form.get('description', '')
+                    "description": request.form.get('description', ''),
+                    "poolname": request.form.get('poolname', '').strip()
                 }
                 access_token = session.get("access_token")
                 if not access_token:
@@ -143,6 +144,9 @@ def register_route_vm_management(app):
                 response = requests.post(f"{API_URL}/vms/checkout", headers=headers, json=data)
                 response.raise_for_status()
                 vm = response.json()
+                if response.status_code == 202:
+                    flash(f"VM {vm['Hostname']} is starting. Check out again in {vm['RetryAfter']} seconds to sign in.", "info")
+                    return redirect(url_for('view_vm_details', vmid=vm['VMID']))
                 flash("Successfully checked out VM!", "success")
                 return redirect(url_for('view_vm_details', vmid=vm['VMID']))
             except requests.exceptions.RequestException as e:
@@ -5,23 +5,37 @@
 # Set PATH variable
 export PATH="/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
 
-LOG_FILE="/var/log/release-session.log"
+LOG_FILE="${LOG_FILE:-/var/log/release-session.log}"
 LOCK_FILE="/tmp/release-session.lockfile"
-LOCATION_PATH="/usr/local/bin"
+LOCATION_PATH="${LOCATION_PATH:-/usr/local/bin}"
 SCRIPT_PATH_TO_CHECK_XRDP_USERS_INFO="$LOCATION_PATH/xrdp-who-xorg.sh"
 CURRENT_USERS_DETAILS="$LOCATION_PATH/xrdp-loggedin-users.txt"
-PREVIOUS_USERS_FILE="/tmp/previous_users.txt"
+PREVIOUS_USERS_FILE="${PREVIOUS_USERS_FILE:-/tmp/previous_users.txt}"
+POLL_INTERVAL="${POLL_INTERVAL:-60}"
 hostname=$(hostname)
 
+# Release API call settings
+TOKEN_CACHE_FILE="${TOKEN_CACHE_FILE:-/run/release-session.token}"
+TOKEN_REFRESH_MARGIN=300         # Seconds before expiry at which the cached managed identity token is refreshed
+RELEASE_LOCK_FILE="${RELEASE_LOCK_FILE:-/tmp/release-session-release.lockfile}"
+RELEASE_MAX_ATTEMPTS=5
+RELEASE_RETRY_DELAY=5            # Seconds before the first retry, doubled after each failed attempt
+
+# Session watcher (--watch) settings
+WATCH_INTERVAL="${WATCH_INTERVAL:-10}"            # Seconds between session checks when no xrdp log activity wakes the watcher
+DISCONNECT_DEBOUNCE="${DISCONNECT_DEBOUNCE:-15}"  # Seconds a user must stay disconnected before the VM is released, so quick reconnects keep it
+XRDP_LOG_FILES="${XRDP_LOG_FILES:-/var/log/xrdp.log /var/log/xrdp-sesman.log}"
+
 # Default run mode
 RUN_MODE="manual"
+WATCH_MODE=false
 
-# Check for '--cron' argument
+# Check for '--cron' and '--watch' arguments
 for arg in "$@"; do
-    if [ "$arg" == "--cron" ]; then
-        RUN_MODE="cron"
-        break
-    fi
+    case "$arg" in
+        --cron) RUN_MODE="cron" ;;
+        --watch) WATCH_MODE=true ;;
+    esac
 done
 
 log() {
@@ -34,54 +48,102 @@ trap "log 'Script exiting.'" EXIT INT TERM
 
 get_access_token() {
     local resource="api://YOUR_LINUX_BROKER_API_CLIENT_ID"
-    local imds_endpoint="http://169.254.169.254/metadata/identity/oauth2/token"
+    local imds_endpoint="${IMDS_ENDPOINT:-http://169.254.169.254/metadata/identity/oauth2/token}"
     local api_version="2018-02-01"
     local uri="$imds_endpoint?api-version=$api_version&resource=$resource"
 
     local headers="Metadata:true"
-    local access_token=$(/usr/bin/curl -s --header "$headers" "$uri" | /usr/bin/jq -r '.access_token')
+    local now expires_on access_token
+    printf -v now '%(%s)T' -1
+
+    # Reuse the cached token until it is about to expire
+    if [ -r "$TOKEN_CACHE_FILE" ]; then
+        { read -r expires_on; read -r access_token; } < "$TOKEN_CACHE_FILE"
+        if [[ "$expires_on" =~ ^[0-9]+$ ]] && [ -n "$access_token" ] && (( expires_on - TOKEN_REFRESH_MARGIN > now )); then
+            echo "$access_token"
+            return 0
+        fi
+    fi
+
+    { read -r expires_on; read -r access_token; } < <(/usr/bin/curl -s --max-time 10 --header "$headers" "$uri" | /usr/bin/jq -r '.expires_on, .access_token' 2>/dev/null)
 
-    if [ "$access_token" == "null" ]; then
-        log "ERROR: Failed to obtain access token."
-        exit 1
+    if [ "$access_token" == "null" ] || [ -z "$access_token" ]; then
+        log "ERROR: Failed to obtain access token." >&2
+        return 1
     fi
 
+    # Only root can read the cached token
+    ( umask 077 && printf '%s\n%s\n' "$expires_on" "$access_token" > "$TOKEN_CACHE_FILE.$$" && mv -f "$TOKEN_CACHE_FILE.$$" "$TOKEN_CACHE_FILE" )
+
     echo "$access_token"
 }
 
-release_vm() {
-    local api_base_url="YOUR_LINUX_BROKER_API_URL"
+send_release_request() {
+    # Returns 0 once the VM is released, 1 if the call is worth retrying and 2 if it is not
+    local api_base_url="${API_BASE_URL:-YOUR_LINUX_BROKER_API_URL}"
     local release_vm_url="$api_base_url/vms/$hostname/release"
-    local access_token=$(get_access_token)
+    local access_token response http_status body
 
-    if [ -z "$access_token" ]; then
-        log "ERROR: Unable to obtain access token."
-        exit 1
-    fi
+    access_token=$(get_access_token) || return 1
 
-    local response=$(/usr/bin/curl -s -w "%{http_code}" -o response.json -X POST "$release_vm_url" \
+    response=$(/usr/bin/curl -s --max-time 30 -w "\n%{http_code}" -X POST "$release_vm_url" \
         -H "Authorization: Bearer $access_token" \
         -H "Content-Type: application/json")
 
-    local http_status=$(tail -n1 response.json)
-    local json_hostname=$(echo "$http_status" | /usr/bin/jq -r '.Hostname')
+    http_status="${response##*$'\n'}"
+    body="${response%$'\n'*}"
 
-    if [ "$json_hostname" == "$hostname" ]; then
+    if [ "$http_status" == "200" ] && [ "$(echo "$body" | /usr/bin/jq -r '.Hostname' 2>/dev/null)" == "$hostname" ]; then
         log "INFO: Successfully released VM with Hostname: $hostname"
-        cat response.json >> "$LOG_FILE"
-    else
-        log "ERROR: Failed to release VM with Hostname: $hostname (HTTP Status: $http_status)"
-        cat response.json >> "$LOG_FILE"
+        echo "$body" >> "$LOG_FILE"
+        return 0
     fi
 
-     local xorg_pid=$(ps h -C Xorg -o pid,user | awk -v user="$username" '$2 == user {print $1}')
-     log "Xorg PID for user $username: $xorg_pid"
-     if [ -n "$xorg_pid" ]; then
-         kill -9 $xorg_pid
-         log "Terminated Xorg process $xorg_pid for user $username."
+    log "ERROR: Failed to release VM with Hostname: $hostname (HTTP Status: $http_status)"
+    echo "$body" >> "$LOG_FILE"
+
+    case "$http_status" in
+        401)
+            # The cached token was rejected, fetch a new one for the next attempt
+            rm -f "$TOKEN_CACHE_FILE"
+            return 1
+            ;;
+        000|408|429|5*) return 1 ;;
+        *) return 2 ;;
+    esac
+}
+
+release_vm() {
+    local xorg_pid=$(ps h -C Xorg -o pid,user | awk -v user="$username" '$2 == user {print $1}')
+    log "Xorg PID for user $username: $xorg_pid"
+    if [ -n "$xorg_pid" ]; then
+        kill -9 $xorg_pid
+        log "Terminated Xorg process $xorg_pid for user $username."
     fi
 
-    rm -f response.json
+    # Call the API in the background with bounded retries, so a slow or unavailable API does not hold up session checks
+    (
+        exec 9> "$RELEASE_LOCK_FILE"
+        if ! flock -n 9; then
+            log "A release of VM $hostname is already in progress."
+            exit 0
+        fi
+
+        local attempt status delay=$RELEASE_RETRY_DELAY
+        for ((attempt = 1; attempt <= RELEASE_MAX_ATTEMPTS; attempt++)); do
+            send_release_request
+            status=$?
+            [ $status -ne 1 ] && exit $status
+
+            if (( attempt < RELEASE_MAX_ATTEMPTS )); then
+                log "Retrying release of VM $hostname in $delay seconds (attempt $attempt of $RELEASE_MAX_ATTEMPTS)."
+                sleep "$delay"
+                delay=$((delay * 2))
+            fi
+        done
+
+        log "ERROR: Giving up on releasing VM $hostname after $RELEASE_MAX_ATTEMPTS attempts."
+    ) &
 }
 
 logoff_user() {
@@ -107,12 +169,125 @@ logoff_user() {
     ) &
 }
 
+declare -A known_users=()
+declare -A disconnected_since=()
+declare -A released_users=()
+
+check_sessions() {
+    local sessions
+    if ! sessions=$(. "$SCRIPT_PATH_TO_CHECK_XRDP_USERS_INFO" 2>/dev/null); then
+        log "ERROR: Failed to execute $SCRIPT_PATH_TO_CHECK_XRDP_USERS_INFO"
+        return 1
+    fi
+
+    local now line pid user since
+    local -A seen_users=() active_users=()
+    printf -v now '%(%s)T' -1
+
+    while IFS= read -r line; do
+        read -r pid user _ <<< "$line"
+        [[ "$pid" =~ ^[0-9]+$ ]] || continue
+        seen_users[$user]=1
+        [[ "$line" == *"disconnected"* ]] || active_users[$user]=1
+    done <<< "$sessions"
+
+    for user in "${!active_users[@]}"; do
+        since=${disconnected_since[$user]}
+        if [ -n "$since" ]; then
+            log "User $user reconnected after $((now - since)) seconds. Keeping the VM."
+            unset "disconnected_since[$user]"
+        fi
+        unset "released_users[$user]"
+    done
+
+    # A user is disconnected when none of their sessions has a client, or when their session has gone away
+    for user in "${!seen_users[@]}" "${!known_users[@]}"; do
+        if [ -n "${active_users[$user]}" ] || [ -n "${released_users[$user]}" ] || [ -n "${disconnected_since[$user]}" ]; then
+            continue
+        fi
+        disconnected_since[$user]=$now
+        if [ -n "${seen_users[$user]}" ]; then
+            log "User $user is disconnected. Releasing VM in $DISCONNECT_DEBOUNCE seconds unless they reconnect."
+        else
+            log "User $user has no session record. Releasing VM in $DISCONNECT_DEBOUNCE seconds unless they reconnect."
+        fi
+    done
+
+    for user in "${!disconnected_since[@]}"; do
+        since=${disconnected_since[$user]}
+        if (( now - since >= DISCONNECT_DEBOUNCE )); then
+            log "User $user has been disconnected for $((now - since)) seconds. Calling release_vm and scheduling logoff."
+            username="$user"
+            release_vm
+            logoff_user "$user"
+            released_users[$user]=1
+            unset "disconnected_since[$user]"
+        fi
+    done
+
+    for user in "${!released_users[@]}"; do
+        [ -n "${seen_users[$user]}" ] || unset "released_users[$user]"
+    done
+
+    known_users=()
+    for user in "${!seen_users[@]}"; do
+        known_users[$user]=1
+    done
+}
+
+next_check_in() {
+    # Wake up in time to release a pending disconnect once its debounce has passed
+    local now user remaining
+    printf -v now '%(%s)T' -1
+    WAIT_SECONDS=$WATCH_INTERVAL
+    for user in "${!disconnected_since[@]}"; do
+        remaining=$(( ${disconnected_since[$user]} + DISCONNECT_DEBOUNCE - now ))
+        (( remaining < WAIT_SECONDS )) && WAIT_SECONDS=$remaining
+    done
+    (( WAIT_SECONDS < 1 )) && WAIT_SECONDS=1
+}
+
+watch_sessions() {
+    log "Watching XRDP sessions every $WATCH_INTERVAL seconds and on xrdp log activity."
+
+    # Any new xrdp log line (connect, disconnect, session end) triggers a check before the next scheduled one
+    exec 3< <(exec tail -n 0 -q -F $XRDP_LOG_FILES 2>/dev/null)
+    local events_pid=$!
+    local events_available=true event burst
+
+    trap "kill $events_pid 2>/dev/null; log 'Script exiting.'" EXIT
+    trap "exit 0" INT TERM
+
+    while true; do
+        check_sessions
+        next_check_in
+
+        if [ "$events_available" = true ]; then
+            if read -r -t "$WAIT_SECONDS" -u 3 event; then
+                # Let a burst of log lines settle so one disconnect leads to one check
+                for burst in {1..20}; do
+                    read -r -t 1 -u 3 event || break
+                done
+            elif (( $? <= 128 )); then
+                events_available=false
+                log "xrdp log watcher stopped. Checking sessions every $WATCH_INTERVAL seconds."
+            fi
+        else
+            sleep "$WAIT_SECONDS"
+        fi
+    done
+}
+
+if [ "$WATCH_MODE" = true ]; then
+    watch_sessions
+fi
+
 while true; do
     log "Checking XRDP session status."
 
     if ! . $SCRIPT_PATH_TO_CHECK_XRDP_USERS_INFO > $CURRENT_USERS_DETAILS; then
         log "ERROR: Failed to execute $SCRIPT_PATH_TO_CHECK_XRDP_USERS_INFO"
-        sleep 60
+        sleep "$POLL_INTERVAL"
         continue
     fi
 
@@ -122,10 +297,11 @@ while true; do
     current_users=()
 
     while IFS= read -r line; do
-        pid=$(echo $line | awk '{print $1}')
-        username=$(echo $line | awk '{print $2}')
-        start_time=$(echo $line | awk '{print $3}')
-        status=$(echo $line | awk '{print $NF}' | xargs)
+        read -r -a fields <<< "$line"
+        pid="${fields[0]}"
+        username="${fields[1]}"
+        start_time="${fields[2]}"
+        status="${fields[*]: -1}"
         current_users+=("$username")
 
         if ! [[ -z "$start_time" || "$start_time" == *"START_TIME"* ]]; then
@@ -159,7 +335,7 @@ while true; do
 
     printf "%s\n" "${current_users[@]}" > "$PREVIOUS_USERS_FILE"
 
-    log "Sleeping for 60 seconds before next check."
-    sleep 60
+    log "Sleeping for $POLL_INTERVAL seconds before next check."
+    sleep "$POLL_INTERVAL"
 done
 
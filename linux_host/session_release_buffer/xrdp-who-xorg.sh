@@ -3,13 +3,16 @@
 # Print info about xrdp Xorg sessions
 #
 
-RED=$(tput setaf 1; tput bold) #"\033[1;31m"
-GREEN=$(tput setaf 2; tput bold) #"\033[1;32m"
-YELLOW=$(tput setaf 3; tput bold)
-ENDCOLOR=$(tput sgr0) #"\033[0m"
-BLINK=$(tput blink)
-REVERSE=$(tput smso)
-UNDERLINE=$(tput smul)
+# Colors only when printing to a terminal
+if [ -t 1 ]; then
+    RED=$(tput setaf 1; tput bold) #"\033[1;31m"
+    GREEN=$(tput setaf 2; tput bold) #"\033[1;32m"
+    YELLOW=$(tput setaf 3; tput bold)
+    ENDCOLOR=$(tput sgr0) #"\033[0m"
+    BLINK=$(tput blink)
+    REVERSE=$(tput smso)
+    UNDERLINE=$(tput smul)
+fi
 
 # Format string for printf
 _printf="%7s %-20s %-19s %-12s\n"
@@ -17,12 +20,16 @@ _printf="%7s %-20s %-19s %-12s\n"
 # Print header
 printf "\n${_printf}" PID USERNAME START_TIME STATUS
 
-ps h -C Xorg -o user:20,pid,lstart,cmd | grep xrdp | while read username pid dt1 dt2 dt3 dt4 dt5 xorg_cmd; do
-    timestring="${dt1} ${dt2} ${dt3} ${dt4} ${dt5}";
-    start_time_s=$(date -d "${timestring}" +"%s");
+# One socket snapshot per run instead of one ss per Xorg process
+ss_snapshot=$(ss -ep 2>/dev/null | grep '/xrdp_display')
+
+printf -v now_s "%(%s)T" -1
+
+ps h -C Xorg -o user:20,pid,etimes,cmd | grep xrdp | while read username pid elapsed_s xorg_cmd; do
+    start_time_s=$((now_s - elapsed_s));
     printf -v start_time "%(%Y-%m-%d %H:%M)T" ${start_time_s}
-    [ ${start_time_s} -lt $(date -d "-30 days" +%s) ] && start_time="${YELLOW}${start_time}${ENDCOLOR}"
-    ss -ep 2>/dev/null | grep '/xrdp_display' | grep -q pid\=${pid}, && status="${GREEN}active${ENDCOLOR}" || status="${RED}disconnected${ENDCOLOR}";
+    [ ${elapsed_s} -gt $((30 * 24 * 3600)) ] && start_time="${YELLOW}${start_time}${ENDCOLOR}"
+    [[ "${ss_snapshot}" == *"pid=${pid},"* ]] && status="${GREEN}active${ENDCOLOR}" || status="${RED}disconnected${ENDCOLOR}";
     printf "${_printf}" ${pid} ${username} "${start_time}" "${status}";
 done
 echo ""
\ No newline at end of file
@@ -0,0 +1,119 @@
+import csv
+import math
+import os
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SESSION_COLUMNS = ['CheckedOutAt', 'ReleasedAt', 'ReturnedAt']
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+def add_connection_arguments(parser):
+    parser.add_argument("--server", default=os.environ.get("DB_SERVER"))
+    parser.add_argument("--database", default=os.environ.get("DB_DATABASE", "linuxbroker"))
+    parser.add_argument("--user", default=os.environ.get("DB_USERNAME"))
+    parser.add_argument("--password", default=os.environ.get("DB_PASSWORD"))
+
+def connect(args):
+    import pymssql
+
+    return pymssql.connect(server=args.server, user=args.user, password=args.password, database=args.database)
+
+def load_sessions_from_db(args, days, pool=None):
+    conn = connect(args)
+    try:
+        with conn.cursor(as_dict=True) as cursor:
+            cursor.execute("EXEC GetCheckoutSessions @Days = %s, @PoolName = %s", (days, pool))
+            sessions = [{column: row[column] for column in SESSION_COLUMNS} for row in cursor.fetchall()]
+            cursor.execute("EXEC GetScalingRules")
+            rules = cursor.fetchall()
+    finally:
+        conn.close()
+    return sessions, rules
+
+def load_sessions_from_csv(path):
+    sessions = []
+    with open(path, newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            sessions.append({
+                column: datetime.strptime(row[column][:19], TIMESTAMP_FORMAT) if row.get(column) else None
+                for column in SESSION_COLUMNS
+            })
+    return sessions
+
+def write_sessions_csv(path, sessions):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=SESSION_COLUMNS)
+        writer.writeheader()
+        for session in sessions:
+            writer.writerow({column: session[column].strftime(TIMESTAMP_FORMAT) if session[column] else '' for column in SESSION_COLUMNS})
+
+def synthetic_sessions(days, peak_users, release_grace_minutes=30, seed=42):
+    # Weekday office hours: logons ramp up from 07:00, sessions last a few hours, a handful of users work weekends
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    sessions = []
+    for day in range(days):
+        users = peak_users if day % 7 < 5 else max(1, peak_users // 10)
+        logons = rng.normal(9 * 60, 75, users).clip(6 * 60, 20 * 60)
+        durations = rng.lognormal(math.log(180), 0.6, users).clip(5, 12 * 60)
+        for logon, duration in zip(logons, durations):
+            checked_out_at = start + timedelta(days=day, minutes=float(logon))
+            released_at = checked_out_at + timedelta(minutes=float(duration))
+            sessions.append({
+                'CheckedOutAt': checked_out_at,
+                'ReleasedAt': released_at,
+                'ReturnedAt': released_at + timedelta(minutes=release_grace_minutes)
+            })
+    sessions.sort(key=lambda session: session['CheckedOutAt'])
+    return sessions
+
+# ===============================
+# Demand
+
+class Demand:
+    def __init__(self, start, step_minutes, arrivals, checked_out, held):
+        self.start = start
+        self.step_minutes = step_minutes
+        self.arrivals = arrivals
+        self.checked_out = checked_out
+        self.held = held
+
+    @property
+    def steps(self):
+        return len(self.arrivals)
+
+    @property
+    def days(self):
+        return self.steps * self.step_minutes / 1440
+
+def build_demand(sessions, step_minutes):
+    # Turn sessions into per-step counts: new checkouts, VMs checked out, and VMs held (checked out or released but not yet returned)
+    if not sessions:
+        raise ValueError("No checkout sessions to replay.")
+
+    start = min(session['CheckedOutAt'] for session in sessions)
+    end = max(max(value for value in session.values() if value) for session in sessions)
+
+    def to_minutes(values, default):
+        return np.array([(value - start).total_seconds() / 60 if value else default for value in values])
+
+    span = (end - start).total_seconds() / 60
+    steps = int(span // step_minutes) + 1
+
+    # Sessions still in progress run to the end of the history
+    checked_out_at = to_minutes([session['CheckedOutAt'] for session in sessions], 0)
+    released_at = np.maximum(to_minutes([session['ReleasedAt'] for session in sessions], span), checked_out_at)
+    returned_at = np.maximum(to_minutes([session['ReturnedAt'] for session in sessions], span), released_at)
+
+    # A session holds its VM for every step it overlaps, so even a short one needs a VM for a full step
+    first_step = (checked_out_at // step_minutes).astype(np.int64)
+    released_step = np.maximum(np.ceil(released_at / step_minutes).astype(np.int64), first_step + 1)
+    returned_step = np.maximum(np.ceil(returned_at / step_minutes).astype(np.int64), released_step)
+
+    arrivals = np.bincount(first_step, minlength=steps)[:steps]
+    checked_out = np.cumsum(np.bincount(first_step, minlength=steps + 1) - np.bincount(np.minimum(released_step, steps), minlength=steps + 1))[:steps]
+    held = np.cumsum(np.bincount(first_step, minlength=steps + 1) - np.bincount(np.minimum(returned_step, steps), minlength=steps + 1))[:steps]
+
+    return Demand(start, step_minutes, arrivals, checked_out, held)
@@ -0,0 +1,242 @@
+import sys
+import csv
+import math
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from history import (
+    add_connection_arguments, load_sessions_from_db, load_sessions_from_csv,
+    write_sessions_csv, synthetic_sessions, build_demand
+)
+
+RULE_COLUMNS = ['MinVMs', 'MaxVMs', 'ScaleUpRatio', 'ScaleUpIncrement', 'ScaleDownRatio', 'ScaleDownIncrement']
+
+# ===============================
+# Rule Sets
+
+class RuleSets:
+    def __init__(self, rows):
+        table = np.array(rows, dtype=np.float64).reshape(-1, len(RULE_COLUMNS))
+        self.min_vms = table[:, 0].astype(np.int64)
+        self.max_vms = table[:, 1].astype(np.int64)
+        self.scale_up_ratio = table[:, 2]
+        self.scale_up_increment = table[:, 3].astype(np.int64)
+        self.scale_down_ratio = table[:, 4]
+        self.scale_down_increment = table[:, 5].astype(np.int64)
+
+    def __len__(self):
+        return len(self.min_vms)
+
+    def row(self, index):
+        return {
+            'MinVMs': int(self.min_vms[index]),
+            'MaxVMs': int(self.max_vms[index]),
+            'ScaleUpRatio': float(self.scale_up_ratio[index]),
+            'ScaleUpIncrement': int(self.scale_up_increment[index]),
+            'ScaleDownRatio': float(self.scale_down_ratio[index]),
+            'ScaleDownIncrement': int(self.scale_down_increment[index])
+        }
+
+def rule_grid(min_vms, max_vms, scale_up_ratios, scale_up_increments, scale_down_ratios, scale_down_increments):
+    # Only combinations the VmScalingRules check constraints would accept
+    return [
+        combination for combination in itertools.product(min_vms, max_vms, scale_up_ratios, scale_up_increments, scale_down_ratios, scale_down_increments)
+        if combination[0] < combination[1] and combination[2] > combination[4]
+    ]
+
+# ===============================
+# Simulation
+
+def simulate(demand, rules, boot_minutes=5, interval_minutes=5, max_wait_minutes=0, pool_size=None):
+    # Replays the demand against every rule set at once: each array holds one value per rule set and each
+    # step applies TriggerScalingLogic to all of them with a handful of vector operations
+    step = demand.step_minutes
+    if interval_minutes % step:
+        raise ValueError("The scaling interval must be a multiple of the step.")
+    trigger_every = interval_minutes // step
+    boot_steps = max(1, math.ceil(boot_minutes / step))
+    wait_steps = int(max_wait_minutes // step)
+    count = len(rules)
+
+    pool = np.full(count, np.iinfo(np.int64).max if pool_size is None else pool_size, dtype=np.int64)
+    max_vms = np.minimum(rules.max_vms, pool)
+
+    # Every rule set starts with its minimum running and nothing starting
+    on = np.minimum(rules.min_vms, pool).astype(np.int64)
+    starting = np.zeros(count, dtype=np.int64)
+    booting = np.zeros((boot_steps, count), dtype=np.int64)
+
+    # Users are served first come, first served: everyone up to served_through (in arrival order) has a VM
+    cumulative_arrivals = np.cumsum(demand.arrivals)
+    served_through = np.zeros(count, dtype=np.int64)
+
+    wait_steps_total = np.zeros(count, dtype=np.int64)
+    peak_waiting = np.zeros(count, dtype=np.int64)
+    failed_checkouts = np.zeros(count, dtype=np.int64)
+    vm_steps = np.zeros(count, dtype=np.int64)
+    scale_ups = np.zeros(count, dtype=np.int64)
+    scale_downs = np.zeros(count, dtype=np.int64)
+
+    for t in range(demand.steps):
+        # VMs started boot_steps ago are ready
+        slot = t % boot_steps
+        on += booting[slot]
+        starting -= booting[slot]
+        booting[slot] = 0
+
+        # Users that want a VM beyond those that are on wait for one
+        waiting = np.maximum(demand.held[t] - on, 0)
+        served = demand.held[t] - waiting
+        np.maximum(served_through, cumulative_arrivals[t] - waiting, out=served_through)
+        wait_steps_total += waiting
+        np.maximum(peak_waiting, waiting, out=peak_waiting)
+
+        # Users who arrived wait_steps ago and still have no VM have given up on this attempt
+        cohort = t - wait_steps
+        if cohort >= 0 and demand.arrivals[cohort]:
+            previous = cumulative_arrivals[cohort - 1] if cohort else 0
+            failed_checkouts += np.maximum(cumulative_arrivals[cohort] - np.maximum(served_through, previous), 0)
+
+        if t % trigger_every == 0:
+            running = on + starting
+            in_use = np.maximum(demand.checked_out[t] - waiting, 0)
+
+            # With no VMs running there is no utilization, and only MinVMs can start the pool
+            valid = running > 0
+            ratio = np.divide(in_use * 100.0, running, out=np.zeros(count), where=valid)
+
+            # Scale up by the increment at the scale up ratio, and always up to MinVMs
+            ratio_power_on = np.where(valid & (ratio >= rules.scale_up_ratio), np.minimum(rules.scale_up_increment, max_vms - running), 0)
+            power_on = np.where(running < max_vms, np.maximum(np.maximum(ratio_power_on, rules.min_vms - running), 0), 0)
+            power_on = np.minimum(power_on, pool - running)
+
+            # Scale down by the increment at the scale down ratio, and always down to MaxVMs.
+            # Only VMs that are on and available are powered off.
+            ratio_power_off = np.where(valid & (ratio <= rules.scale_down_ratio), np.minimum(rules.scale_down_increment, running - rules.min_vms), 0)
+            power_off = np.where(power_on > 0, 0, np.maximum(np.maximum(ratio_power_off, running - max_vms), 0))
+            power_off = np.maximum(np.minimum(power_off, on - served), 0)
+
+            booting[slot] += power_on
+            starting += power_on
+            on -= power_off
+            scale_ups += power_on > 0
+            scale_downs += power_off > 0
+
+        vm_steps += on + starting
+
+    arrivals = max(int(cumulative_arrivals[-1]), 1)
+    return {
+        'VMHours': vm_steps * step / 60,
+        'QueueWaitHours': wait_steps_total * step / 60,
+        'MeanWaitMinutes': wait_steps_total * step / arrivals,
+        'PeakWaiting': peak_waiting,
+        'FailedCheckouts': failed_checkouts,
+        'FailedCheckoutRate': failed_checkouts / arrivals,
+        'ScaleUps': scale_ups,
+        'ScaleDowns': scale_downs
+    }
+
+# ===============================
+# Reporting
+
+def rank(results, max_failed_rate, max_mean_wait):
+    # Cheapest rule sets that keep failed checkouts and waits within the limits, then the rest by failures
+    acceptable = (results['FailedCheckoutRate'] <= max_failed_rate) & (results['MeanWaitMinutes'] <= max_mean_wait)
+    return np.lexsort((results['VMHours'], np.where(acceptable, 0, results['FailedCheckouts']), ~acceptable)), acceptable
+
+def print_results(rules, results, order, acceptable, top, current):
+    header = f"{'MinVMs':>6} {'MaxVMs':>6} {'UpRatio':>7} {'UpInc':>5} {'DownRatio':>9} {'DownInc':>7} {'VM-hours':>10} {'Wait h':>8} {'Wait min':>11} {'Peak wait':>9} {'Failed':>7} {'Failed %':>8}"
+    print(header)
+    shown = list(order[:top]) + [index for index in current if index not in order[:top]]
+    for index in shown:
+        rule = rules.row(index)
+        line = (
+            f"{rule['MinVMs']:>6} {rule['MaxVMs']:>6} {rule['ScaleUpRatio']:>7.1f} {rule['ScaleUpIncrement']:>5} "
+            f"{rule['ScaleDownRatio']:>9.1f} {rule['ScaleDownIncrement']:>7} {results['VMHours'][index]:>10.1f} "
+            f"{results['QueueWaitHours'][index]:>8.1f} {results['MeanWaitMinutes'][index]:>11.2f} {results['PeakWaiting'][index]:>9} "
+            f"{results['FailedCheckouts'][index]:>7} {results['FailedCheckoutRate'][index] * 100:>7.2f}%"
+        )
+        if index in current:
+            line += "  (current)"
+        elif not acceptable[index]:
+            line += "  (over limits)"
+        print(line)
+
+def write_results_csv(path, rules, results):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(RULE_COLUMNS + list(results))
+        for index in range(len(rules)):
+            rule = rules.row(index)
+            writer.writerow([rule[column] for column in RULE_COLUMNS] + [results[key][index] for key in results])
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical checkout demand against candidate scaling rules and report VM-hours, queue wait and failed checkouts.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-db", action="store_true", help="Load checkout sessions with GetCheckoutSessions.")
+    source.add_argument("--sessions-csv", help="Load checkout sessions from a CSV written by --export-csv.")
+    source.add_argument("--synthetic-days", type=int, help="Generate a synthetic office-hours workload over this many days.")
+    add_connection_arguments(parser)
+    parser.add_argument("--days", type=int, default=90, help="Days of history to load with --from-db.")
+    parser.add_argument("--pool", help="Only load sessions on VMs in this pool with --from-db.")
+    parser.add_argument("--export-csv", help="Save the loaded sessions to a CSV to replay without the database.")
+    parser.add_argument("--peak-users", type=int, default=40, help="Weekday users for --synthetic-days.")
+
+    parser.add_argument("--min-vms", type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument("--max-vms", type=int, nargs='+', default=[10, 20, 40, 60])
+    parser.add_argument("--scale-up-ratio", type=float, nargs='+', default=[50, 60, 70, 80, 90])
+    parser.add_argument("--scale-up-increment", type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument("--scale-down-ratio", type=float, nargs='+', default=[10, 20, 30, 40])
+    parser.add_argument("--scale-down-increment", type=int, nargs='+', default=[1, 2, 4])
+
+    parser.add_argument("--step-minutes", type=int, default=5, help="Simulation resolution.")
+    parser.add_argument("--interval-minutes", type=int, default=5, help="How often scaling runs (the ScalingVMs timer).")
+    parser.add_argument("--boot-minutes", type=float, default=5, help="Time from powering on a VM to it accepting a checkout.")
+    parser.add_argument("--max-wait-minutes", type=float, default=0, help="How long a user waits for a VM before the checkout fails.")
+    parser.add_argument("--pool-size", type=int, help="VMs in the pool, if fewer than MaxVMs.")
+
+    parser.add_argument("--max-failed-rate", type=float, default=0.01, help="Highest acceptable share of failed checkouts.")
+    parser.add_argument("--max-mean-wait", type=float, default=1.0, help="Highest acceptable mean wait per checkout in minutes.")
+    parser.add_argument("--top", type=int, default=20, help="Rule sets to print.")
+    parser.add_argument("--output-csv", help="Write the results for every rule set to a CSV.")
+    args = parser.parse_args()
+
+    current_rules = []
+    if args.from_db:
+        if not args.server:
+            sys.exit("Set DB_SERVER or pass --server to load sessions from the database.")
+        sessions, current_rules = load_sessions_from_db(args, args.days, args.pool)
+    elif args.sessions_csv:
+        sessions = load_sessions_from_csv(args.sessions_csv)
+    else:
+        sessions = synthetic_sessions(args.synthetic_days, args.peak_users)
+
+    if args.export_csv:
+        write_sessions_csv(args.export_csv, sessions)
+
+    demand = build_demand(sessions, args.step_minutes)
+
+    # The rules in production are always simulated so candidates can be compared against them
+    rows = rule_grid(args.min_vms, args.max_vms, args.scale_up_ratio, args.scale_up_increment, args.scale_down_ratio, args.scale_down_increment)
+    rows += [tuple(float(rule[column]) for column in RULE_COLUMNS) for rule in current_rules]
+    rules = RuleSets(rows)
+    current = list(range(len(rows) - len(current_rules), len(rows)))
+
+    print(f"Replaying {len(sessions)} checkouts over {demand.days:.1f} days (peak {int(demand.held.max())} VMs held) against {len(rules)} rule sets")
+    started = time.perf_counter()
+    results = simulate(demand, rules, args.boot_minutes, args.interval_minutes, args.max_wait_minutes, args.pool_size)
+    elapsed = time.perf_counter() - started
+    print(f"Simulated {demand.steps} steps of {args.step_minutes} minutes in {elapsed:.2f}s ({len(rules) * demand.steps / elapsed / 1e6:.2f}M rule-steps/s)")
+
+    order, acceptable = rank(results, args.max_failed_rate, args.max_mean_wait)
+    print(f"{int(acceptable.sum())} rule sets stay within {args.max_failed_rate * 100:.1f}% failed checkouts and {args.max_mean_wait} minutes mean wait")
+    print_results(rules, results, order, acceptable, args.top, current)
+
+    if args.output_csv:
+        write_results_csv(args.output_csv, rules, results)
+
+if __name__ == '__main__':
+    main()
@@ -8,12 +8,19 @@ CREATE TABLE VmScalingRules (
     ScaleUpIncrement INT NOT NULL,
     ScaleDownRatio DECIMAL(5,2) NOT NULL, -- Percentage (e.g., 30.00 for 30%)
     ScaleDownIncrement INT NOT NULL,
+    PoolName VARCHAR(64) NULL, -- Pool the rule applies to, NULL for every pool
+    DaysOfWeek VARCHAR(7) NULL CONSTRAINT CK_VmScalingRules_DaysOfWeek CHECK (DaysOfWeek NOT LIKE '%[^1-7]%' AND LEN(DaysOfWeek) > 0), -- ISO weekdays (e.g., '12345' for Monday to Friday), NULL for every day
+    StartTime TIME(0) NULL, -- Daily window in TimeZone, runs past midnight when EndTime is before StartTime
+    EndTime TIME(0) NULL,
+    TimeZone VARCHAR(64) NOT NULL CONSTRAINT DF_VmScalingRules_TimeZone DEFAULT 'UTC', -- Windows time zone name (e.g., 'W. Europe Standard Time')
+    Priority INT NOT NULL CONSTRAINT DF_VmScalingRules_Priority DEFAULT 0, -- Breaks ties between overlapping rules, highest first
     LastChecked DATETIME DEFAULT NULL,
     SysStartTime DATETIME2 GENERATED ALWAYS AS ROW START HIDDEN,
     SysEndTime DATETIME2 GENERATED ALWAYS AS ROW END HIDDEN,
     PERIOD FOR SYSTEM_TIME (SysStartTime, SysEndTime),
     CHECK (MinVMs < MaxVMs),  -- Ensures MinVMs is less than MaxVMs
-    CHECK (ScaleUpRatio > ScaleDownRatio)  -- Ensures ScaleUpRatio is greater than ScaleDownRatio
+    CHECK (ScaleUpRatio > ScaleDownRatio),  -- Ensures ScaleUpRatio is greater than ScaleDownRatio
+    CONSTRAINT CK_VmScalingRules_Window CHECK ((StartTime IS NULL AND EndTime IS NULL) OR (StartTime IS NOT NULL AND EndTime IS NOT NULL AND StartTime <> EndTime))
 )
 
 WITH (SYSTEM_VERSIONING = ON (HISTORY_TABLE = dbo.VmScalingRulesHistory));
@@ -3,12 +3,18 @@ use linuxbroker;
 CREATE TABLE VmScalingActivityLog (
     ActivityID INT IDENTITY(1,1) PRIMARY KEY,
     CheckTimestamp DATETIME NOT NULL DEFAULT(GETDATE()),
+    PoolName VARCHAR(64) NULL, -- Pool the decision was made for
+    RuleID INT NULL, -- Scaling rule that was active for the pool
     CurrentRunningVMs INT NOT NULL,
     CurrentInUseVMs INT NOT NULL,
     ActionTaken NVARCHAR(50) NOT NULL, -- "Scale Up", "Scale Down", "No Action"
     VMsPoweredOn INT NULL,
     VMsPoweredOff INT NULL,
     NewTotalVMs INT NOT NULL,
+    ForecastInUseVMs INT NULL, -- Forecast demand used by the predictive scaler, NULL for reactive decisions
+    ScaleDownAction VARCHAR(16) NULL, -- "PowerOff" or "Deallocate", for decisions that stopped VMs
+    ScaleDownPolicy VARCHAR(16) NULL, -- Policy that picked the VMs to stop: "health" or "idle"
+    EstimatedHourlySavings DECIMAL(10,2) NULL, -- Compute cost per hour saved by the VMs deallocated
     Outcome NVARCHAR(255) NULL,
     Notes TEXT NULL
 );
@@ -4,11 +4,12 @@ CREATE TABLE VirtualMachines (
     VMID INT IDENTITY(1,1) PRIMARY KEY,
     Hostname VARCHAR(255) NOT NULL,
     IPAddress VARCHAR(50),
-    PowerState VARCHAR(10) CHECK(PowerState IN ('On', 'Off')),
+    PowerState VARCHAR(10) CONSTRAINT CK_VirtualMachines_PowerState CHECK(PowerState IN ('On', 'Off', 'Starting', 'Stopping')),
     NetworkStatus VARCHAR(16) CHECK(NetworkStatus IN ('Reachable', 'Unreachable')),
     VmStatus VARCHAR(16) CHECK(VmStatus IN ('Available', 'CheckedOut', 'Maintenance', 'Released')),
     Username VARCHAR(255),
     AvdHost VARCHAR(255),
+    PoolName VARCHAR(64) NOT NULL CONSTRAINT DF_VirtualMachines_PoolName DEFAULT 'default', -- Pool the VM is scaled with
     CreateDate DATETIME DEFAULT(GETDATE()),
     LastUpdateDate DATETIME DEFAULT(GETDATE()),
     Description NVARCHAR(MAX), -- Changed from TEXT to NVARCHAR(MAX)
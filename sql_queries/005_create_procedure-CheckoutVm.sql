@@ -1,14 +1,38 @@
-CREATE PROCEDURE [dbo].[CheckoutVm]
-    @Username NVARCHAR(255),
-    @AvdHost NVARCHAR(255)
+CREATE OR ALTER PROCEDURE [dbo].[CheckoutVm]
+    -- VARCHAR to match the column types so the lookups can seek instead of converting every row
+    @Username VARCHAR(255),
+    @AvdHost VARCHAR(255),
+    -- VM holding an account pre-staged for this user, tried before any other available VM
+    @PreferredVMID INT = NULL,
+    -- When no VM is available, claim a VM that is off and mark it 'Starting' for the caller to start
+    @WakeOnDemand BIT = 0
 AS
 BEGIN
+    SET NOCOUNT ON;
+
     -- Start a transaction to ensure atomicity
     BEGIN TRANSACTION;
 
     DECLARE @VMID INT;
+    DECLARE @WakeRequested BIT = 0;
+    DECLARE @LockResource NVARCHAR(255) = CONCAT('CheckoutVm:', @Username, ':', @AvdHost);
+    DECLARE @ClaimedVMs TABLE (
+        VMID INT,
+        Hostname VARCHAR(255),
+        IPAddress VARCHAR(50),
+        Username VARCHAR(255),
+        AvdHost VARCHAR(255),
+        VmStatus VARCHAR(16),
+        PowerState VARCHAR(10),
+        NetworkStatus VARCHAR(16),
+        LastUpdateDate DATETIME
+    );
 
     BEGIN TRY
+        -- Serialize concurrent checkouts for the same user and AVD host only, so a retried
+        -- request returns the VM claimed by the first one instead of claiming a second VM
+        EXEC sp_getapplock @Resource = @LockResource, @LockMode = 'Exclusive', @LockOwner = 'Transaction';
+
         -- Check if the user already has a VM checked out or a 'Released' VM
         SELECT @VMID = VMID
         FROM dbo.VirtualMachines
@@ -26,8 +50,9 @@ BEGIN
             WHERE VMID = @VMID
               AND VmStatus = 'Released';
 
-            -- Return the VM information
-            SELECT VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, LastUpdateDate
+            -- Return the VM information. A VM woken for an earlier request may still be 'Starting'.
+            SELECT VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, PowerState, NetworkStatus, LastUpdateDate,
+                   @WakeRequested AS WakeRequested
             FROM dbo.VirtualMachines
             WHERE VMID = @VMID;
 
@@ -36,28 +61,79 @@ BEGIN
         END
         ELSE
         BEGIN
-            -- Retrieve the first available VM
-            SELECT TOP 1 @VMID = VMID
-            FROM dbo.VirtualMachines
-            WHERE PowerState = 'On' 
-              AND NetworkStatus = 'Reachable' 
-              AND VmStatus = 'Available'
-            ORDER BY VMID;
+            -- Claim the VM the user's account was pre-staged on if it is still available
+            IF @PreferredVMID IS NOT NULL
+            BEGIN
+                UPDATE dbo.VirtualMachines WITH (READPAST, ROWLOCK)
+                SET Username = @Username,
+                    AvdHost = @AvdHost,
+                    VmStatus = 'CheckedOut',
+                    LastUpdateDate = GETDATE()
+                OUTPUT INSERTED.VMID, INSERTED.Hostname, INSERTED.IPAddress, INSERTED.Username,
+                       INSERTED.AvdHost, INSERTED.VmStatus, INSERTED.PowerState, INSERTED.NetworkStatus, INSERTED.LastUpdateDate
+                INTO @ClaimedVMs
+                WHERE VMID = @PreferredVMID
+                  AND PowerState = 'On'
+                  AND NetworkStatus = 'Reachable'
+                  AND VmStatus = 'Available';
+            END
 
-            -- If an available VM was found, update it
-            IF @VMID IS NOT NULL
+            -- Otherwise claim the first available VM in one statement. UPDLOCK holds the row until commit and
+            -- READPAST skips rows already claimed by concurrent callers, so each caller gets a distinct
+            -- VM without waiting on or deadlocking with the others.
+            IF NOT EXISTS (SELECT 1 FROM @ClaimedVMs)
             BEGIN
-                UPDATE dbo.VirtualMachines
-                SET Username = @Username, 
-                    AvdHost = @AvdHost, 
-                    VmStatus = 'CheckedOut', 
+                WITH NextAvailableVm AS (
+                    SELECT TOP (1) VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, PowerState, NetworkStatus, LastUpdateDate
+                    FROM dbo.VirtualMachines WITH (UPDLOCK, READPAST, ROWLOCK)
+                    WHERE PowerState = 'On'
+                      AND NetworkStatus = 'Reachable'
+                      AND VmStatus = 'Available'
+                    ORDER BY VMID
+                )
+                UPDATE NextAvailableVm
+                SET Username = @Username,
+                    AvdHost = @AvdHost,
+                    VmStatus = 'CheckedOut',
                     LastUpdateDate = GETDATE()
-                WHERE VMID = @VMID;
+                OUTPUT INSERTED.VMID, INSERTED.Hostname, INSERTED.IPAddress, INSERTED.Username,
+                       INSERTED.AvdHost, INSERTED.VmStatus, INSERTED.PowerState, INSERTED.NetworkStatus, INSERTED.LastUpdateDate
+                INTO @ClaimedVMs;
+            END
 
+            -- With no VM available, wake one that is off. It is checked out to the user right away so the scaler
+            -- counts it as in use and no other checkout takes it. It stays 'Starting' until the API has reached it
+            -- over SSH and marks it 'On' and 'Reachable', so once returned it can be checked out again like any other.
+            IF NOT EXISTS (SELECT 1 FROM @ClaimedVMs) AND @WakeOnDemand = 1
+            BEGIN
+                WITH NextOffVm AS (
+                    SELECT TOP (1) VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, PowerState, NetworkStatus, LastUpdateDate
+                    FROM dbo.VirtualMachines WITH (UPDLOCK, READPAST, ROWLOCK)
+                    WHERE PowerState = 'Off'
+                      AND VmStatus = 'Available'
+                    ORDER BY CASE WHEN NetworkStatus = 'Unreachable' THEN 1 ELSE 0 END, VMID
+                )
+                UPDATE NextOffVm
+                SET Username = @Username,
+                    AvdHost = @AvdHost,
+                    VmStatus = 'CheckedOut',
+                    PowerState = 'Starting',
+                    LastUpdateDate = GETDATE()
+                OUTPUT INSERTED.VMID, INSERTED.Hostname, INSERTED.IPAddress, INSERTED.Username,
+                       INSERTED.AvdHost, INSERTED.VmStatus, INSERTED.PowerState, INSERTED.NetworkStatus, INSERTED.LastUpdateDate
+                INTO @ClaimedVMs;
+
+                IF EXISTS (SELECT 1 FROM @ClaimedVMs)
+                    SET @WakeRequested = 1;
+            END
+
+            -- If an available VM was claimed, return it
+            IF EXISTS (SELECT 1 FROM @ClaimedVMs)
+            BEGIN
                 -- Return the updated VM information
-                SELECT VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, LastUpdateDate
-                FROM dbo.VirtualMachines
-                WHERE VMID = @VMID;
+                SELECT VMID, Hostname, IPAddress, Username, AvdHost, VmStatus, PowerState, NetworkStatus, LastUpdateDate,
+                       @WakeRequested AS WakeRequested
+                FROM @ClaimedVMs;
 
                 -- Commit the transaction
                 COMMIT TRANSACTION;
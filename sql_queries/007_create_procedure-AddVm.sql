@@ -1,4 +1,4 @@
-CREATE PROCEDURE [dbo].[AddVm]
+CREATE OR ALTER PROCEDURE [dbo].[AddVm]
     @Hostname NVARCHAR(255),
     @IPAddress NVARCHAR(50),
     @PowerState VARCHAR(10),
@@ -6,11 +6,12 @@ CREATE PROCEDURE [dbo].[AddVm]
     @VmStatus VARCHAR(16),
     @Username NVARCHAR(255) = NULL,
     @AvdHost NVARCHAR(255) = NULL,
-    @Description TEXT = NULL
+    @Description TEXT = NULL,
+    @PoolName VARCHAR(64) = NULL
 AS
 BEGIN
-    INSERT INTO dbo.VirtualMachines (Hostname, IPAddress, PowerState, NetworkStatus, VmStatus, Username, AvdHost, CreateDate, LastUpdateDate, Description)
-    VALUES (@Hostname, @IPAddress, @PowerState, @NetworkStatus, @VmStatus, @Username, @AvdHost, GETDATE(), GETDATE(), @Description);
+    INSERT INTO dbo.VirtualMachines (Hostname, IPAddress, PowerState, NetworkStatus, VmStatus, Username, AvdHost, PoolName, CreateDate, LastUpdateDate, Description)
+    VALUES (@Hostname, @IPAddress, @PowerState, @NetworkStatus, @VmStatus, @Username, @AvdHost, ISNULL(@PoolName, 'default'), GETDATE(), GETDATE(), @Description);
 
     -- Return the ID of the newly created VM
     SELECT SCOPE_IDENTITY() AS NewVMID;
@@ -1,8 +1,8 @@
-CREATE PROCEDURE [dbo].[GetVmDetails]
+CREATE OR ALTER PROCEDURE [dbo].[GetVmDetails]
     @VMID INT
 AS
 BEGIN
-    SELECT VMID, Hostname, IPAddress, PowerState, NetworkStatus, VmStatus, Username, AvdHost, CreateDate, LastUpdateDate, Description
+    SELECT VMID, Hostname, IPAddress, PowerState, NetworkStatus, VmStatus, Username, AvdHost, PoolName, CreateDate, LastUpdateDate, Description
     FROM dbo.VirtualMachines
     WHERE VMID = @VMID;
 END
@@ -1,7 +1,17 @@
-CREATE PROCEDURE [dbo].[GetScalingRules]
+CREATE OR ALTER PROCEDURE [dbo].[GetScalingRules]
 AS
 BEGIN
-    SELECT RuleID, MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement, ScaleDownRatio, ScaleDownIncrement, LastChecked
-    FROM dbo.VmScalingRules;
+    -- Every rule, with the pools it is currently the active rule for
+    SELECT r.RuleID, r.MinVMs, r.MaxVMs, r.ScaleUpRatio, r.ScaleUpIncrement, r.ScaleDownRatio, r.ScaleDownIncrement,
+           r.PoolName, r.DaysOfWeek, CONVERT(VARCHAR(5), r.StartTime, 108) AS StartTime, CONVERT(VARCHAR(5), r.EndTime, 108) AS EndTime,
+           r.TimeZone, r.Priority, r.LastChecked, a.ActivePools
+    FROM dbo.VmScalingRules r
+    LEFT JOIN (
+        SELECT RuleID, STRING_AGG(PoolName, ', ') WITHIN GROUP (ORDER BY PoolName) AS ActivePools
+        FROM dbo.ActiveScalingRules
+        GROUP BY RuleID
+    ) a
+        ON a.RuleID = r.RuleID
+    ORDER BY r.RuleID;
 END
 GO
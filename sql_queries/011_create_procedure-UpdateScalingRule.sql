@@ -1,13 +1,23 @@
-CREATE PROCEDURE [dbo].[UpdateScalingRule]
+CREATE OR ALTER PROCEDURE [dbo].[UpdateScalingRule]
     @RuleID INT,
     @MinVMs INT = NULL,
     @MaxVMs INT = NULL,
     @ScaleUpRatio DECIMAL(5,2) = NULL,
     @ScaleUpIncrement INT = NULL,
     @ScaleDownRatio DECIMAL(5,2) = NULL,
-    @ScaleDownIncrement INT = NULL
+    @ScaleDownIncrement INT = NULL,
+    @PoolName VARCHAR(64) = NULL,    -- An empty string applies the rule to every pool
+    @DaysOfWeek VARCHAR(7) = NULL,   -- An empty string applies the rule on every day
+    @StartTime VARCHAR(8) = NULL,    -- Empty strings for both times make the rule apply all day
+    @EndTime VARCHAR(8) = NULL,
+    @TimeZone VARCHAR(64) = NULL,
+    @Priority INT = NULL
 AS
 BEGIN
+    -- Rules are evaluated in their time zone on every scaling run, so an unknown one would stop scaling
+    IF @TimeZone IS NOT NULL AND NOT EXISTS (SELECT 1 FROM sys.time_zone_info WHERE name = @TimeZone)
+        THROW 50000, 'Unknown time zone. Use a name from sys.time_zone_info.', 1;
+
     UPDATE dbo.VmScalingRules
     SET MinVMs = COALESCE(@MinVMs, MinVMs),
         MaxVMs = COALESCE(@MaxVMs, MaxVMs),
@@ -15,6 +25,12 @@ BEGIN
         ScaleUpIncrement = COALESCE(@ScaleUpIncrement, ScaleUpIncrement),
         ScaleDownRatio = COALESCE(@ScaleDownRatio, ScaleDownRatio),
         ScaleDownIncrement = COALESCE(@ScaleDownIncrement, ScaleDownIncrement),
+        PoolName = CASE WHEN @PoolName IS NULL THEN PoolName ELSE NULLIF(@PoolName, '') END,
+        DaysOfWeek = CASE WHEN @DaysOfWeek IS NULL THEN DaysOfWeek ELSE NULLIF(@DaysOfWeek, '') END,
+        StartTime = CASE WHEN @StartTime IS NULL THEN StartTime ELSE CAST(NULLIF(@StartTime, '') AS TIME(0)) END,
+        EndTime = CASE WHEN @EndTime IS NULL THEN EndTime ELSE CAST(NULLIF(@EndTime, '') AS TIME(0)) END,
+        TimeZone = COALESCE(@TimeZone, TimeZone),
+        Priority = COALESCE(@Priority, Priority),
         LastChecked = GETDATE()  -- Optionally, update the LastChecked timestamp
     WHERE RuleID = @RuleID;
 END
@@ -1,103 +1,247 @@
-CREATE PROCEDURE [dbo].[TriggerScalingLogic]
+CREATE OR ALTER PROCEDURE [dbo].[TriggerScalingLogic]
+    @Forecasts NVARCHAR(MAX) = NULL,            -- JSON array of {"PoolName": ..., "ForecastInUseVMs": ...}: demand expected before newly started VMs are ready, from the predictive scaler; NULL scales on current demand only
+    @ScaleDownAction VARCHAR(16) = 'PowerOff',  -- 'PowerOff' keeps stopped VMs allocated, 'Deallocate' also releases their compute
+    @ScaleDownPolicy VARCHAR(16) = 'health',    -- 'health' stops unreachable and recently failing VMs first, then the longest idle; 'idle' only the longest idle
+    @VmHourlyCost DECIMAL(10,4) = NULL,         -- Compute price of one VM per hour, to estimate the savings of deallocating
+    @ConnectivityFailureHours INT = 24          -- How far back a failed connectivity test counts against a VM
 AS
 BEGIN
-    -- Declare variables to hold the scaling rules
-    DECLARE @MinVMs INT, @MaxVMs INT, @ScaleUpRatio DECIMAL(5,2), 
-            @ScaleUpIncrement INT, @ScaleDownRatio DECIMAL(5,2), 
-            @ScaleDownIncrement INT;
+    SET NOCOUNT ON;
 
-    -- Fetch the scaling rules (assuming there's only one set of rules)
-    SELECT TOP 1 
-        @MinVMs = MinVMs, 
-        @MaxVMs = MaxVMs, 
-        @ScaleUpRatio = ScaleUpRatio, 
-        @ScaleUpIncrement = ScaleUpIncrement, 
-        @ScaleDownRatio = ScaleDownRatio, 
-        @ScaleDownIncrement = ScaleDownIncrement
-    FROM dbo.VmScalingRules;
+    IF @ScaleDownAction NOT IN ('PowerOff', 'Deallocate')
+        THROW 50000, 'ScaleDownAction must be PowerOff or Deallocate.', 1;
+    IF @ScaleDownPolicy NOT IN ('health', 'idle')
+        THROW 50000, 'ScaleDownPolicy must be health or idle.', 1;
 
-    -- Declare variables to hold current VM states
-    DECLARE @CurrentRunningVMs INT, @CurrentInUseVMs INT, 
-            @ActionTaken NVARCHAR(50), @VMsPoweredOn INT = 0, 
-            @VMsPoweredOff INT = 0, @NewTotalVMs INT;
+    -- One scaling decision per pool, made with the rule active for that pool right now
+    DECLARE @Decisions TABLE (
+        PoolName VARCHAR(64) PRIMARY KEY,
+        RuleID INT NOT NULL,
+        MinVMs INT NOT NULL,
+        MaxVMs INT NOT NULL,
+        ScaleUpRatio DECIMAL(5,2) NOT NULL,
+        ScaleUpIncrement INT NOT NULL,
+        ScaleDownRatio DECIMAL(5,2) NOT NULL,
+        ScaleDownIncrement INT NOT NULL,
+        CurrentRunningVMs INT NOT NULL,
+        CurrentInUseVMs INT NOT NULL,
+        CurrentUtilizationRatio DECIMAL(5,2) NULL,  -- NULL when no VMs are running
+        ForecastInUseVMs INT NULL,
+        ForecastTargetVMs INT NULL,
+        TargetVMs INT NOT NULL,                     -- Fewest running VMs the pool should have: MinVMs or the forecast target
+        VMsToPowerOn INT NOT NULL DEFAULT 0,
+        VMsToPowerOff INT NOT NULL DEFAULT 0,
+        VMsPoweredOn INT NOT NULL DEFAULT 0,
+        VMsPoweredOff INT NOT NULL DEFAULT 0,
+        EstimatedHourlySavings DECIMAL(10,2) NULL,
+        ActionTaken NVARCHAR(50) NULL
+    );
 
     -- Temporary tables to hold VM names
-    DECLARE @PoweredOnVMs TABLE (VMID INT, VMName VARCHAR(255));
-    DECLARE @PoweredOffVMs TABLE (VMID INT, VMName VARCHAR(255));
-
-    -- Fetch the current number of running VMs and VMs in use
-    SELECT 
-        @CurrentRunningVMs = COUNT(*),
-        @CurrentInUseVMs = SUM(CASE WHEN VmStatus = 'CheckedOut' THEN 1 ELSE 0 END)
-    FROM dbo.VirtualMachines
-    WHERE PowerState = 'On';
+    DECLARE @PoweredOnVMs TABLE (VMID INT, VMName VARCHAR(255), PoolName VARCHAR(64));
+    DECLARE @PoweredOffVMs TABLE (VMID INT, VMName VARCHAR(255), PoolName VARCHAR(64));
+    DECLARE @Activities TABLE (ActivityID INT, PoolName VARCHAR(64));
 
-    -- Calculate the current utilization ratio
-    DECLARE @CurrentUtilizationRatio DECIMAL(5,2) = 
-        (CAST(@CurrentInUseVMs AS DECIMAL) / CAST(@CurrentRunningVMs AS DECIMAL)) * 100;
-
-    -- Determine the scaling action based on the current utilization ratio
-    IF @CurrentUtilizationRatio >= @ScaleUpRatio AND @CurrentRunningVMs < @MaxVMs
-    BEGIN
-        -- Scale up: Add VMs
-        SET @VMsPoweredOn = CASE 
-                               WHEN @CurrentRunningVMs + @ScaleUpIncrement > @MaxVMs 
-                               THEN @MaxVMs - @CurrentRunningVMs 
-                               ELSE @ScaleUpIncrement 
-                             END;
-
-        -- Update VM statuses to 'On' for the number of VMs being powered on
-        UPDATE TOP (@VMsPoweredOn) dbo.VirtualMachines
-        SET PowerState = 'On', VmStatus = 'Available', LastUpdateDate = GETDATE()
-        OUTPUT INSERTED.VMID, INSERTED.Hostname INTO @PoweredOnVMs
-        WHERE PowerState = 'Off';
+    -- Fetch the current number of running VMs and VMs in use in every pool, with the rule active for it.
+    -- VMs that are still starting count as running so the next run does not power on more for the same demand.
+    WITH PoolState AS (
+        SELECT PoolName,
+               SUM(CASE WHEN PowerState IN ('On', 'Starting') THEN 1 ELSE 0 END) AS CurrentRunningVMs,
+               SUM(CASE WHEN PowerState IN ('On', 'Starting') AND VmStatus = 'CheckedOut' THEN 1 ELSE 0 END) AS CurrentInUseVMs
+        FROM dbo.VirtualMachines
+        GROUP BY PoolName
+    ),
+    Forecasts AS (
+        SELECT PoolName, ForecastInUseVMs
+        FROM OPENJSON(@Forecasts)
+        WITH (
+            PoolName VARCHAR(64) '$.PoolName',
+            ForecastInUseVMs INT '$.ForecastInUseVMs'
+        )
+        WHERE PoolName IS NOT NULL
+    )
+    INSERT INTO @Decisions (
+        PoolName, RuleID, MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement, ScaleDownRatio, ScaleDownIncrement,
+        CurrentRunningVMs, CurrentInUseVMs, CurrentUtilizationRatio, ForecastInUseVMs, ForecastTargetVMs, TargetVMs
+    )
+    SELECT s.PoolName, r.RuleID, r.MinVMs, r.MaxVMs, r.ScaleUpRatio, r.ScaleUpIncrement, r.ScaleDownRatio, r.ScaleDownIncrement,
+           s.CurrentRunningVMs, s.CurrentInUseVMs,
+           CASE WHEN s.CurrentRunningVMs > 0 THEN CAST(s.CurrentInUseVMs AS DECIMAL) / CAST(s.CurrentRunningVMs AS DECIMAL) * 100 END,
+           f.ForecastInUseVMs, target.ForecastTargetVMs, ISNULL(target.ForecastTargetVMs, r.MinVMs)
+    FROM PoolState s
+    INNER JOIN dbo.ActiveScalingRules r
+        ON r.PoolName = s.PoolName
+    LEFT JOIN Forecasts f
+        ON f.PoolName = s.PoolName
+    -- Running VMs needed for the forecast demand to stay below the scale up ratio, within MinVMs and MaxVMs
+    CROSS APPLY (
+        SELECT CAST(CEILING(CAST(f.ForecastInUseVMs AS DECIMAL(10,2)) * 100 / r.ScaleUpRatio) AS INT) AS UnboundedTargetVMs
+    ) forecast
+    CROSS APPLY (
+        SELECT CASE
+                   WHEN forecast.UnboundedTargetVMs > r.MaxVMs THEN r.MaxVMs
+                   WHEN forecast.UnboundedTargetVMs < r.MinVMs THEN r.MinVMs
+                   ELSE forecast.UnboundedTargetVMs
+               END AS ForecastTargetVMs
+    ) target;
 
-        SET @ActionTaken = 'Scale Up';
-    END
-    ELSE IF @CurrentUtilizationRatio <= @ScaleDownRatio AND @CurrentRunningVMs > @MinVMs
-    BEGIN
-        -- Scale down: Remove VMs
-        SET @VMsPoweredOff = CASE 
-                                WHEN @CurrentRunningVMs - @ScaleDownIncrement < @MinVMs 
-                                THEN @CurrentRunningVMs - @MinVMs 
-                                ELSE @ScaleDownIncrement 
-                              END;
+    -- Determine the scaling action for every pool. Scale up when utilization reaches the scale up ratio, or to
+    -- bring the pool up to its minimum or forecast target, such as when a business hours rule takes over.
+    -- Otherwise scale down when utilization is at or below the scale down ratio, or when the pool runs more than its maximum.
+    UPDATE d
+    SET VMsToPowerOn = up.VMsToPowerOn,
+        VMsToPowerOff = CASE WHEN up.VMsToPowerOn > 0 THEN 0 ELSE down.VMsToPowerOff END
+    FROM @Decisions d
+    CROSS APPLY (
+        SELECT CASE
+                   WHEN d.CurrentRunningVMs >= d.MaxVMs THEN 0
+                   ELSE GREATEST(
+                       0,
+                       d.TargetVMs - d.CurrentRunningVMs,
+                       CASE
+                           WHEN d.CurrentUtilizationRatio < d.ScaleUpRatio OR d.CurrentUtilizationRatio IS NULL THEN 0
+                           WHEN d.CurrentRunningVMs + d.ScaleUpIncrement > d.MaxVMs THEN d.MaxVMs - d.CurrentRunningVMs
+                           ELSE d.ScaleUpIncrement
+                       END
+                   )
+               END AS VMsToPowerOn
+    ) up
+    CROSS APPLY (
+        SELECT GREATEST(
+                   0,
+                   d.CurrentRunningVMs - d.MaxVMs,
+                   CASE
+                       WHEN d.CurrentUtilizationRatio > d.ScaleDownRatio OR d.CurrentUtilizationRatio IS NULL OR d.CurrentRunningVMs <= d.TargetVMs THEN 0
+                       WHEN d.CurrentRunningVMs - d.ScaleDownIncrement < d.TargetVMs THEN d.CurrentRunningVMs - d.TargetVMs
+                       ELSE d.ScaleDownIncrement
+                   END
+               ) AS VMsToPowerOff
+    ) down;
 
-        -- Update VM statuses to 'Off' for the number of VMs being powered off
-        UPDATE TOP (@VMsPoweredOff) dbo.VirtualMachines
-        SET PowerState = 'Off', VmStatus = 'Available', LastUpdateDate = GETDATE()
-        OUTPUT INSERTED.VMID, INSERTED.Hostname INTO @PoweredOffVMs
-        WHERE PowerState = 'On' AND VmStatus = 'Available';
+    -- Mark the VMs being powered on as 'Starting'. They become 'On' once Azure confirms the start.
+    WITH Candidates AS (
+        SELECT VMID, PoolName, ROW_NUMBER() OVER (PARTITION BY PoolName ORDER BY VMID) AS PoolRank
+        FROM dbo.VirtualMachines
+        WHERE PowerState = 'Off'
+    )
+    UPDATE vm
+    SET PowerState = 'Starting', VmStatus = 'Available', LastUpdateDate = GETDATE()
+    OUTPUT INSERTED.VMID, INSERTED.Hostname, INSERTED.PoolName INTO @PoweredOnVMs
+    FROM dbo.VirtualMachines vm
+    INNER JOIN Candidates c
+        ON c.VMID = vm.VMID
+    INNER JOIN @Decisions d
+        ON d.PoolName = c.PoolName
+    WHERE c.PoolRank <= d.VMsToPowerOn;
 
-        SET @ActionTaken = 'Scale Down';
-    END
-    ELSE
+    -- Mark the VMs being powered off as 'Stopping' so they are no longer checked out.
+    -- They become 'Off' once Azure confirms the power off or deallocation.
+    -- The scale down policy ranks the available VMs of every pool: with 'health', unreachable VMs come first, then VMs
+    -- never tested or that failed a connectivity test recently. Then the VMs idle the longest, since they were last
+    -- checked out or released (or added), and the oldest LastUpdateDate. Only scanned when a pool scales down.
+    IF EXISTS (SELECT 1 FROM @Decisions WHERE VMsToPowerOff > 0)
     BEGIN
-        -- No scaling action needed
-        SET @ActionTaken = 'No Action';
+        WITH RecentFailures AS (
+            SELECT DISTINCT VMID
+            FROM dbo.VirtualMachines FOR SYSTEM_TIME ALL
+            WHERE NetworkStatus = 'Unreachable'
+              AND SysEndTime > DATEADD(HOUR, -@ConnectivityFailureHours, SYSUTCDATETIME())
+        ),
+        LastUsed AS (
+            SELECT VMID, MAX(SysEndTime) AS LastUsedAt
+            FROM dbo.VirtualMachines FOR SYSTEM_TIME ALL
+            WHERE VmStatus IN ('CheckedOut', 'Released')
+            GROUP BY VMID
+        ),
+        Candidates AS (
+            SELECT vm.VMID, vm.PoolName,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY vm.PoolName
+                       ORDER BY
+                           CASE
+                               WHEN @ScaleDownPolicy <> 'health' THEN 0
+                               WHEN vm.NetworkStatus = 'Unreachable' THEN 0
+                               WHEN vm.NetworkStatus IS NULL OR f.VMID IS NOT NULL THEN 1
+                               ELSE 2
+                           END,
+                           COALESCE(u.LastUsedAt, CAST(vm.CreateDate AS DATETIME2)),
+                           vm.LastUpdateDate,
+                           vm.VMID
+                   ) AS PoolRank
+            FROM dbo.VirtualMachines vm
+            LEFT JOIN RecentFailures f
+                ON f.VMID = vm.VMID
+            LEFT JOIN LastUsed u
+                ON u.VMID = vm.VMID
+            WHERE vm.PowerState = 'On' AND vm.VmStatus = 'Available'
+        )
+        UPDATE vm
+        SET PowerState = 'Stopping', VmStatus = 'Available', LastUpdateDate = GETDATE()
+        OUTPUT INSERTED.VMID, INSERTED.Hostname, INSERTED.PoolName INTO @PoweredOffVMs
+        FROM dbo.VirtualMachines vm
+        INNER JOIN Candidates c
+            ON c.VMID = vm.VMID
+        INNER JOIN @Decisions d
+            ON d.PoolName = c.PoolName
+        WHERE c.PoolRank <= d.VMsToPowerOff;
     END
 
-    -- Calculate the new total number of running VMs
-    SET @NewTotalVMs = @CurrentRunningVMs + @VMsPoweredOn - @VMsPoweredOff;
+    UPDATE d
+    SET VMsPoweredOn = (SELECT COUNT(*) FROM @PoweredOnVMs p WHERE p.PoolName = d.PoolName),
+        VMsPoweredOff = (SELECT COUNT(*) FROM @PoweredOffVMs p WHERE p.PoolName = d.PoolName),
+        ActionTaken = CASE
+                          WHEN d.VMsToPowerOn > 0 THEN 'Scale Up'
+                          WHEN d.VMsToPowerOff > 0 THEN 'Scale Down'
+                          ELSE 'No Action'
+                      END
+    FROM @Decisions d;
 
-    -- Log the scaling activity
+    -- Stopped VMs are still billed for compute, only deallocated ones save it
+    UPDATE @Decisions
+    SET EstimatedHourlySavings = CASE WHEN @ScaleDownAction = 'Deallocate' THEN VMsPoweredOff * @VmHourlyCost ELSE 0 END
+    WHERE VMsPoweredOff > 0;
+
+    -- Log the scaling activity of every pool
     INSERT INTO dbo.VmScalingActivityLog (
-        CheckTimestamp, CurrentRunningVMs, CurrentInUseVMs, 
-        ActionTaken, VMsPoweredOn, VMsPoweredOff, NewTotalVMs, Outcome
+        CheckTimestamp, PoolName, RuleID, CurrentRunningVMs, CurrentInUseVMs,
+        ActionTaken, VMsPoweredOn, VMsPoweredOff, NewTotalVMs, ForecastInUseVMs,
+        ScaleDownAction, ScaleDownPolicy, EstimatedHourlySavings, Outcome
     )
-    VALUES (
-        GETDATE(), @CurrentRunningVMs, @CurrentInUseVMs, 
-        @ActionTaken, @VMsPoweredOn, @VMsPoweredOff, @NewTotalVMs,
+    OUTPUT INSERTED.ActivityID, INSERTED.PoolName INTO @Activities
+    SELECT
+        GETDATE(), PoolName, RuleID, CurrentRunningVMs, CurrentInUseVMs,
+        ActionTaken, VMsPoweredOn, VMsPoweredOff, CurrentRunningVMs + VMsPoweredOn - VMsPoweredOff, ForecastInUseVMs,
+        CASE WHEN VMsPoweredOff > 0 THEN @ScaleDownAction END,
+        CASE WHEN VMsPoweredOff > 0 THEN @ScaleDownPolicy END,
+        EstimatedHourlySavings,
         CASE 
-            WHEN @ActionTaken = 'Scale Up' THEN CONCAT('Scaled up by ', @VMsPoweredOn, ' VMs')
-            WHEN @ActionTaken = 'Scale Down' THEN CONCAT('Scaled down by ', @VMsPoweredOff, ' VMs')
+            WHEN ActionTaken = 'Scale Up' AND ForecastTargetVMs > CurrentRunningVMs
+            THEN CONCAT('Scaled up by ', VMsPoweredOn, ' VMs ahead of forecast demand of ', ForecastInUseVMs, ' VMs')
+            WHEN ActionTaken = 'Scale Up' AND MinVMs > CurrentRunningVMs
+            THEN CONCAT('Scaled up by ', VMsPoweredOn, ' VMs to the minimum of ', MinVMs, ' VMs')
+            WHEN ActionTaken = 'Scale Up' THEN CONCAT('Scaled up by ', VMsPoweredOn, ' VMs')
+            WHEN ActionTaken = 'Scale Down' AND CurrentRunningVMs > MaxVMs
+            THEN CONCAT('Scaled down by ', VMsPoweredOff, ' VMs to the maximum of ', MaxVMs, ' VMs')
+            WHEN ActionTaken = 'Scale Down' THEN CONCAT('Scaled down by ', VMsPoweredOff, ' VMs')
             ELSE 'No scaling action was necessary'
         END
-    );
+    FROM @Decisions;
 
-    -- Return the names of the VMs that were powered on or off
-    SELECT 'PoweredOn' AS ActionType, VMName FROM @PoweredOnVMs
+    -- Return the VMs to power on or off, with the activity of their pool to record their results against
+    SELECT a.ActivityID, 'PowerOn' AS ActionType, p.VMID, p.VMName
+    FROM @PoweredOnVMs p
+    INNER JOIN @Activities a ON a.PoolName = p.PoolName
     UNION ALL
-    SELECT 'PoweredOff' AS ActionType, VMName FROM @PoweredOffVMs;
+    SELECT a.ActivityID, @ScaleDownAction AS ActionType, p.VMID, p.VMName
+    FROM @PoweredOffVMs p
+    INNER JOIN @Activities a ON a.PoolName = p.PoolName;
+
+    -- Return the decision made for every pool
+    SELECT a.ActivityID, d.PoolName, d.RuleID, d.ActionTaken, d.CurrentRunningVMs, d.CurrentInUseVMs,
+           d.ForecastInUseVMs, d.ForecastTargetVMs, d.CurrentRunningVMs + d.VMsPoweredOn - d.VMsPoweredOff AS NewTotalVMs,
+           d.EstimatedHourlySavings
+    FROM @Decisions d
+    INNER JOIN @Activities a ON a.PoolName = d.PoolName
+    ORDER BY d.PoolName;
 END
 GO
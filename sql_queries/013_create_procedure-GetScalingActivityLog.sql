@@ -1,12 +1,13 @@
-CREATE PROCEDURE [dbo].[GetScalingActivityLog]
+CREATE OR ALTER PROCEDURE [dbo].[GetScalingActivityLog]
     @StartDate DATETIME = NULL,  -- Optional filter by start date
     @EndDate DATETIME = NULL,    -- Optional filter by end date
     @Limit INT = NULL            -- Optional limit on the number of records to retrieve
 AS
 BEGIN
     SELECT TOP (ISNULL(@Limit, 1000)) -- Default to 1000 records if no limit is provided
-        ActivityID, CheckTimestamp, CurrentRunningVMs, CurrentInUseVMs, 
-        ActionTaken, VMsPoweredOn, VMsPoweredOff, NewTotalVMs, Outcome, Notes
+        ActivityID, CheckTimestamp, PoolName, RuleID, CurrentRunningVMs, CurrentInUseVMs, 
+        ActionTaken, VMsPoweredOn, VMsPoweredOff, NewTotalVMs, ForecastInUseVMs,
+        ScaleDownAction, ScaleDownPolicy, EstimatedHourlySavings, Outcome, Notes
     FROM dbo.VmScalingActivityLog
     WHERE (@StartDate IS NULL OR CheckTimestamp >= @StartDate)
       AND (@EndDate IS NULL OR CheckTimestamp <= @EndDate)
@@ -1,4 +1,4 @@
-CREATE PROCEDURE [dbo].[GetVms]
+CREATE OR ALTER PROCEDURE [dbo].[GetVms]
 AS
 BEGIN
     SELECT 
@@ -10,6 +10,7 @@ BEGIN
         VmStatus,
         Username,
         AvdHost,
+        PoolName,
         CreateDate,
         LastUpdateDate,
         Description
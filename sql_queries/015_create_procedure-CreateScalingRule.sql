@@ -1,15 +1,27 @@
-CREATE PROCEDURE [dbo].[CreateScalingRule]
+CREATE OR ALTER PROCEDURE [dbo].[CreateScalingRule]
     @MinVMs INT,
     @MaxVMs INT,
     @ScaleUpRatio FLOAT,
     @ScaleUpIncrement INT,
     @ScaleDownRatio FLOAT,
-    @ScaleDownIncrement INT
+    @ScaleDownIncrement INT,
+    @PoolName VARCHAR(64) = NULL,    -- NULL applies the rule to every pool
+    @DaysOfWeek VARCHAR(7) = NULL,   -- ISO weekdays, e.g. '12345'; NULL for every day
+    @StartTime TIME(0) = NULL,       -- Daily window in @TimeZone; NULL for all day
+    @EndTime TIME(0) = NULL,
+    @TimeZone VARCHAR(64) = 'UTC',
+    @Priority INT = 0
 AS
 BEGIN
+    -- Rules are evaluated in their time zone on every scaling run, so an unknown one would stop scaling
+    IF NOT EXISTS (SELECT 1 FROM sys.time_zone_info WHERE name = ISNULL(@TimeZone, 'UTC'))
+        THROW 50000, 'Unknown time zone. Use a name from sys.time_zone_info.', 1;
+
     -- Insert the new scaling rule into the VMScalingRules table
-    INSERT INTO dbo.VmScalingRules (MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement, ScaleDownRatio, ScaleDownIncrement)
-    VALUES (@MinVMs, @MaxVMs, @ScaleUpRatio, @ScaleUpIncrement, @ScaleDownRatio, @ScaleDownIncrement);
+    INSERT INTO dbo.VmScalingRules (MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement, ScaleDownRatio, ScaleDownIncrement,
+                                    PoolName, DaysOfWeek, StartTime, EndTime, TimeZone, Priority)
+    VALUES (@MinVMs, @MaxVMs, @ScaleUpRatio, @ScaleUpIncrement, @ScaleDownRatio, @ScaleDownIncrement,
+            @PoolName, @DaysOfWeek, @StartTime, @EndTime, ISNULL(@TimeZone, 'UTC'), ISNULL(@Priority, 0));
 
     -- Return the ID of the newly created rule
     SELECT SCOPE_IDENTITY() AS NewRuleID;
@@ -1,10 +1,12 @@
-CREATE PROCEDURE GetVmScalingRulesHistory
+CREATE OR ALTER PROCEDURE GetVmScalingRulesHistory
     @StartDate DATETIME2 = NULL,
     @EndDate DATETIME2 = NULL,
     @Limit INT = 100
 AS
 BEGIN
-    SELECT * 
+    SELECT RuleID, MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement, ScaleDownRatio, ScaleDownIncrement,
+           PoolName, DaysOfWeek, CONVERT(VARCHAR(5), StartTime, 108) AS StartTime, CONVERT(VARCHAR(5), EndTime, 108) AS EndTime,
+           TimeZone, Priority, LastChecked, SysStartTime, SysEndTime
     FROM dbo.VmScalingRulesHistory 
     WHERE (@StartDate IS NULL OR SysStartTime >= @StartDate)
       AND (@EndDate IS NULL OR SysEndTime <= @EndDate)
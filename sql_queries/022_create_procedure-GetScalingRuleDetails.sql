@@ -1,19 +1,26 @@
-CREATE PROCEDURE [dbo].[GetScalingRuleDetails]
+CREATE OR ALTER PROCEDURE [dbo].[GetScalingRuleDetails]
     @RuleID INT
 AS
 BEGIN
     SELECT 
-        RuleID,
-        MinVMs,
-        MaxVMs,
-        ScaleUpRatio,
-        ScaleUpIncrement,
-        ScaleDownRatio,
-        ScaleDownIncrement,
-        LastChecked
+        r.RuleID,
+        r.MinVMs,
+        r.MaxVMs,
+        r.ScaleUpRatio,
+        r.ScaleUpIncrement,
+        r.ScaleDownRatio,
+        r.ScaleDownIncrement,
+        r.PoolName,
+        r.DaysOfWeek,
+        CONVERT(VARCHAR(5), r.StartTime, 108) AS StartTime,
+        CONVERT(VARCHAR(5), r.EndTime, 108) AS EndTime,
+        r.TimeZone,
+        r.Priority,
+        r.LastChecked,
+        (SELECT STRING_AGG(a.PoolName, ', ') WITHIN GROUP (ORDER BY a.PoolName) FROM dbo.ActiveScalingRules a WHERE a.RuleID = r.RuleID) AS ActivePools
     FROM 
-        dbo.VmScalingRules
+        dbo.VmScalingRules r
     WHERE 
-        RuleID = @RuleID
+        r.RuleID = @RuleID
 END;
 GO
@@ -0,0 +1,12 @@
+USE linuxbroker;
+
+CREATE TABLE PendingUserCleanups (
+    CleanupID INT IDENTITY(1,1) PRIMARY KEY,
+    Hostname VARCHAR(255) NOT NULL,
+    Username VARCHAR(255) NOT NULL,
+    Attempts INT NOT NULL DEFAULT(1),
+    LastError NVARCHAR(MAX) NULL,
+    CreateDate DATETIME DEFAULT(GETDATE()),
+    LastAttemptDate DATETIME DEFAULT(GETDATE()),
+    CONSTRAINT UQ_PendingUserCleanups_Hostname_Username UNIQUE (Hostname, Username)
+);
@@ -0,0 +1,26 @@
+CREATE PROCEDURE [dbo].[QueueUserCleanup]
+    @Hostname VARCHAR(255),
+    @Username VARCHAR(255),
+    @LastError NVARCHAR(MAX) = NULL
+AS
+BEGIN
+    -- Record a failed remote user cleanup so it can be retried on a later run
+    UPDATE dbo.PendingUserCleanups
+    SET Attempts = Attempts + 1,
+        LastError = @LastError,
+        LastAttemptDate = GETDATE()
+    WHERE Hostname = @Hostname
+      AND Username = @Username;
+
+    IF @@ROWCOUNT = 0
+    BEGIN
+        INSERT INTO dbo.PendingUserCleanups (Hostname, Username, Attempts, LastError, CreateDate, LastAttemptDate)
+        VALUES (@Hostname, @Username, 1, @LastError, GETDATE(), GETDATE());
+    END
+
+    SELECT CleanupID, Hostname, Username, Attempts, LastError, CreateDate, LastAttemptDate
+    FROM dbo.PendingUserCleanups
+    WHERE Hostname = @Hostname
+      AND Username = @Username;
+END
+GO
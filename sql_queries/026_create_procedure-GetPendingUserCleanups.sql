@@ -0,0 +1,18 @@
+CREATE PROCEDURE [dbo].[GetPendingUserCleanups]
+    @MaxAttempts INT = 10
+AS
+BEGIN
+    -- Drop cleanups for users who have since checked the same VM out again
+    DELETE puc
+    FROM dbo.PendingUserCleanups puc
+    INNER JOIN dbo.VirtualMachines vm
+        ON vm.Hostname = puc.Hostname
+       AND vm.Username = puc.Username
+       AND vm.VmStatus IN ('CheckedOut', 'Released');
+
+    SELECT CleanupID, Hostname, Username, Attempts, LastError, CreateDate, LastAttemptDate
+    FROM dbo.PendingUserCleanups
+    WHERE Attempts < @MaxAttempts
+    ORDER BY LastAttemptDate;
+END
+GO
@@ -0,0 +1,12 @@
+CREATE PROCEDURE [dbo].[CompleteUserCleanup]
+    @Hostname VARCHAR(255),
+    @Username VARCHAR(255)
+AS
+BEGIN
+    DELETE FROM dbo.PendingUserCleanups
+    WHERE Hostname = @Hostname
+      AND Username = @Username;
+
+    SELECT @@ROWCOUNT AS CompletedCleanups;
+END
+GO
@@ -0,0 +1,13 @@
+USE linuxbroker;
+
+-- Supports the ReturnReleasedVms lookup (VmStatus = 'Released' AND LastUpdateDate <= @Cutoff)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_VirtualMachines_VmStatus_LastUpdateDate'
+      AND object_id = OBJECT_ID('dbo.VirtualMachines')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_VirtualMachines_VmStatus_LastUpdateDate
+    ON dbo.VirtualMachines (VmStatus, LastUpdateDate);
+END
+GO
@@ -0,0 +1,33 @@
+USE linuxbroker;
+
+-- Filtered indexes require QUOTED_IDENTIFIER and the ANSI options to be ON for sessions that
+-- modify VirtualMachines. This is the default for sqlcmd, SSMS and pymssql connections.
+
+-- Supports the CheckoutVm "find my existing VM" lookup
+-- (Username = @Username AND AvdHost = @AvdHost AND VmStatus IN ('CheckedOut', 'Released'))
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_VirtualMachines_Username_AvdHost'
+      AND object_id = OBJECT_ID('dbo.VirtualMachines')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_VirtualMachines_Username_AvdHost
+    ON dbo.VirtualMachines (Username, AvdHost)
+    INCLUDE (VmStatus)
+    WHERE VmStatus IN ('CheckedOut', 'Released');
+END
+GO
+
+-- Supports the CheckoutVm "find an available VM" lookup
+-- (PowerState = 'On' AND NetworkStatus = 'Reachable' AND VmStatus = 'Available' ORDER BY VMID)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = 'IX_VirtualMachines_Available'
+      AND object_id = OBJECT_ID('dbo.VirtualMachines')
+)
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_VirtualMachines_Available
+    ON dbo.VirtualMachines (VMID)
+    WHERE PowerState = 'On' AND NetworkStatus = 'Reachable' AND VmStatus = 'Available';
+END
+GO
@@ -0,0 +1,39 @@
+CREATE OR ALTER PROCEDURE [dbo].[GetVmsToPrime]
+    @AffinityDays INT = 14
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- Most recent user of each VM within the affinity window
+    WITH RecentUsers AS (
+        SELECT VMID, Username, SysEndTime,
+               ROW_NUMBER() OVER (PARTITION BY VMID ORDER BY SysEndTime DESC) AS VmRank
+        FROM dbo.VirtualMachinesHistory
+        WHERE Username IS NOT NULL
+          AND SysEndTime >= DATEADD(DAY, -@AffinityDays, SYSUTCDATETIME())
+    ),
+    -- A user is staged on one VM only, the one they used most recently
+    LastUsers AS (
+        SELECT VMID, Username,
+               ROW_NUMBER() OVER (PARTITION BY Username ORDER BY SysEndTime DESC) AS UserRank
+        FROM RecentUsers
+        WHERE VmRank = 1
+    )
+    SELECT vm.VMID, vm.Hostname, lu.Username AS StagedUsername
+    FROM dbo.VirtualMachines vm
+    LEFT JOIN LastUsers lu
+        ON lu.VMID = vm.VMID
+       AND lu.UserRank = 1
+       -- Users who already hold a VM do not need an account staged elsewhere
+       AND NOT EXISTS (
+           SELECT 1
+           FROM dbo.VirtualMachines held
+           WHERE held.Username = lu.Username
+             AND held.VmStatus IN ('CheckedOut', 'Released')
+       )
+    WHERE vm.PowerState = 'On'
+      AND vm.NetworkStatus = 'Reachable'
+      AND vm.VmStatus = 'Available'
+    ORDER BY vm.VMID;
+END
+GO
@@ -0,0 +1,24 @@
+USE linuxbroker;
+
+-- Adds the transitional 'Starting' and 'Stopping' power states that VMs hold while an Azure power operation is in flight.
+-- Databases created before this change have an unnamed CHECK constraint on PowerState, so look it up by column.
+DECLARE @ConstraintName SYSNAME, @Sql NVARCHAR(MAX);
+
+SELECT @ConstraintName = cc.name
+FROM sys.check_constraints cc
+INNER JOIN sys.columns c
+    ON c.object_id = cc.parent_object_id
+   AND c.column_id = cc.parent_column_id
+WHERE cc.parent_object_id = OBJECT_ID('dbo.VirtualMachines')
+  AND c.name = 'PowerState';
+
+IF @ConstraintName IS NOT NULL
+BEGIN
+    SET @Sql = N'ALTER TABLE dbo.VirtualMachines DROP CONSTRAINT ' + QUOTENAME(@ConstraintName);
+    EXEC sp_executesql @Sql;
+END
+GO
+
+ALTER TABLE dbo.VirtualMachines
+ADD CONSTRAINT CK_VirtualMachines_PowerState CHECK (PowerState IN ('On', 'Off', 'Starting', 'Stopping'));
+GO
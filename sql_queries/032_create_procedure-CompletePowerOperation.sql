@@ -0,0 +1,18 @@
+CREATE OR ALTER PROCEDURE [dbo].[CompletePowerOperation]
+    @VMID INT,
+    @ExpectedPowerState VARCHAR(10), -- 'Starting' or 'Stopping'
+    @PowerState VARCHAR(10)          -- Power state confirmed by Azure
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- Only move VMs that are still waiting on this operation, in case they were changed by hand meanwhile
+    UPDATE dbo.VirtualMachines
+    SET PowerState = @PowerState,
+        LastUpdateDate = GETDATE()
+    WHERE VMID = @VMID
+      AND PowerState = @ExpectedPowerState;
+
+    SELECT @@ROWCOUNT AS UpdatedVMs;
+END
+GO
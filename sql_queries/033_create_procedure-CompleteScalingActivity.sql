@@ -0,0 +1,16 @@
+CREATE OR ALTER PROCEDURE [dbo].[CompleteScalingActivity]
+    @ActivityID INT,
+    @Outcome NVARCHAR(255),
+    @Notes NVARCHAR(MAX) = NULL -- Per-VM results of the power operations
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    UPDATE dbo.VmScalingActivityLog
+    SET Outcome = @Outcome,
+        Notes = @Notes
+    WHERE ActivityID = @ActivityID;
+
+    SELECT @@ROWCOUNT AS UpdatedActivities;
+END
+GO
@@ -0,0 +1,47 @@
+CREATE OR ALTER PROCEDURE [dbo].[ReconcileVmPowerStates]
+    @PowerStates NVARCHAR(MAX),         -- JSON array of {"Hostname": ..., "PowerState": ...} as reported by Azure
+    @TransitionGraceMinutes INT = 15    -- 'Starting'/'Stopping' VMs updated more recently than this are left to their power operation
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @ReportedPowerStates TABLE (
+        Hostname VARCHAR(255) PRIMARY KEY,
+        PowerState VARCHAR(10) NOT NULL
+    );
+
+    INSERT INTO @ReportedPowerStates (Hostname, PowerState)
+    SELECT Hostname, PowerState
+    FROM OPENJSON(@PowerStates)
+    WITH (
+        Hostname VARCHAR(255) '$.Hostname',
+        PowerState VARCHAR(10) '$.PowerState'
+    )
+    WHERE Hostname IS NOT NULL
+      AND PowerState IS NOT NULL;
+
+    -- Apply every correction in one statement and return what changed
+    UPDATE vm
+    SET PowerState = reported.PowerState,
+        LastUpdateDate = GETDATE()
+    OUTPUT INSERTED.VMID, INSERTED.Hostname, DELETED.PowerState AS PreviousPowerState,
+           INSERTED.PowerState, INSERTED.VmStatus
+    FROM dbo.VirtualMachines vm
+    INNER JOIN @ReportedPowerStates reported
+        ON reported.Hostname = vm.Hostname
+    WHERE (vm.PowerState IS NULL OR vm.PowerState <> reported.PowerState)
+      AND NOT (
+          vm.PowerState IN ('Starting', 'Stopping')
+          AND vm.LastUpdateDate > DATEADD(MINUTE, -@TransitionGraceMinutes, GETDATE())
+      );
+
+    -- VMs known to the broker that were not found in Azure
+    SELECT vm.VMID, vm.Hostname, vm.PowerState, vm.VmStatus
+    FROM dbo.VirtualMachines vm
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM @ReportedPowerStates reported
+        WHERE reported.Hostname = vm.Hostname
+    );
+END
+GO
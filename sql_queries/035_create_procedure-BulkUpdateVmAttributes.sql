@@ -0,0 +1,69 @@
+CREATE OR ALTER PROCEDURE [dbo].[BulkUpdateVmAttributes]
+    @Updates NVARCHAR(MAX)  -- JSON array of {"VMID": ..., "PowerState": ..., "NetworkStatus": ..., "VmStatus": ...}; null or omitted attributes are left unchanged
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @RequestedUpdates TABLE (
+        VMID INT PRIMARY KEY,
+        PowerState VARCHAR(10) NULL,
+        NetworkStatus VARCHAR(16) NULL,
+        VmStatus VARCHAR(16) NULL
+    );
+
+    DECLARE @UpdatedVMs TABLE (
+        VMID INT PRIMARY KEY
+    );
+
+    -- If a VM appears more than once, the last entry wins
+    INSERT INTO @RequestedUpdates (VMID, PowerState, NetworkStatus, VmStatus)
+    SELECT VMID, PowerState, NetworkStatus, VmStatus
+    FROM (
+        SELECT requested.VMID, requested.PowerState, requested.NetworkStatus, requested.VmStatus,
+               ROW_NUMBER() OVER (PARTITION BY requested.VMID ORDER BY CAST(items.[key] AS INT) DESC) AS RowNumber
+        FROM OPENJSON(@Updates) items
+        CROSS APPLY OPENJSON(items.value)
+        WITH (
+            VMID INT '$.VMID',
+            PowerState VARCHAR(10) '$.PowerState',
+            NetworkStatus VARCHAR(16) '$.NetworkStatus',
+            VmStatus VARCHAR(16) '$.VmStatus'
+        ) requested
+        WHERE requested.VMID IS NOT NULL
+    ) numbered
+    WHERE RowNumber = 1;
+
+    BEGIN TRANSACTION;
+
+    -- Only rows with an actual change are written, so the history table does not collect no-op versions
+    UPDATE vm
+    SET PowerState = COALESCE(requested.PowerState, vm.PowerState),
+        NetworkStatus = COALESCE(requested.NetworkStatus, vm.NetworkStatus),
+        VmStatus = COALESCE(requested.VmStatus, vm.VmStatus),
+        LastUpdateDate = GETDATE()
+    OUTPUT INSERTED.VMID INTO @UpdatedVMs (VMID)
+    FROM dbo.VirtualMachines vm
+    INNER JOIN @RequestedUpdates requested
+        ON requested.VMID = vm.VMID
+    WHERE (requested.PowerState IS NOT NULL AND (vm.PowerState IS NULL OR vm.PowerState <> requested.PowerState))
+       OR (requested.NetworkStatus IS NOT NULL AND (vm.NetworkStatus IS NULL OR vm.NetworkStatus <> requested.NetworkStatus))
+       OR (requested.VmStatus IS NOT NULL AND (vm.VmStatus IS NULL OR vm.VmStatus <> requested.VmStatus));
+
+    COMMIT TRANSACTION;
+
+    -- One result row per requested VM
+    SELECT requested.VMID, vm.Hostname, vm.IPAddress, vm.PowerState, vm.NetworkStatus, vm.VmStatus, vm.LastUpdateDate,
+           CASE
+               WHEN vm.VMID IS NULL THEN 'NotFound'
+               WHEN updated.VMID IS NOT NULL THEN 'Updated'
+               ELSE 'Unchanged'
+           END AS Result
+    FROM @RequestedUpdates requested
+    LEFT JOIN dbo.VirtualMachines vm
+        ON vm.VMID = requested.VMID
+    LEFT JOIN @UpdatedVMs updated
+        ON updated.VMID = requested.VMID
+    ORDER BY requested.VMID;
+END
+GO
@@ -0,0 +1,8 @@
+USE linuxbroker;
+
+-- Records the forecast demand each predictive scaling decision was based on.
+IF COL_LENGTH('dbo.VmScalingActivityLog', 'ForecastInUseVMs') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingActivityLog ADD ForecastInUseVMs INT NULL;
+END
+GO
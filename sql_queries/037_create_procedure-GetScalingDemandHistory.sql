@@ -0,0 +1,60 @@
+CREATE OR ALTER PROCEDURE [dbo].[GetScalingDemandHistory]
+    @Days INT = 28,           -- How many days of history to return
+    @BucketMinutes INT = 15   -- Width of each demand sample
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @BucketCount INT = @Days * 24 * 60 / @BucketMinutes;
+
+    -- Buckets are aligned to the bucket width in UTC, so a given time of day always starts a bucket
+    DECLARE @To DATETIME2 = DATEADD(MINUTE, (DATEDIFF(MINUTE, '2000-01-01', SYSUTCDATETIME()) / @BucketMinutes) * @BucketMinutes, CAST('2000-01-01' AS DATETIME2));
+    DECLARE @From DATETIME2 = DATEADD(MINUTE, -@BucketCount * @BucketMinutes, @To);
+
+    WITH Buckets AS (
+        SELECT TOP (@BucketCount)
+            DATEADD(MINUTE, (ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) - 1) * @BucketMinutes, @From) AS BucketStart
+        FROM sys.all_objects a
+        CROSS JOIN sys.all_objects b
+    ),
+    Pools AS (
+        SELECT DISTINCT PoolName
+        FROM dbo.VirtualMachines
+    ),
+    CheckedOutPeriods AS (
+        -- Every period a VM spent checked out, from the current rows and the temporal history
+        SELECT VMID, PoolName, SysStartTime, SysEndTime
+        FROM dbo.VirtualMachines FOR SYSTEM_TIME ALL
+        WHERE VmStatus = 'CheckedOut'
+          AND SysEndTime > @From
+    ),
+    CheckedOutDemand AS (
+        SELECT b.BucketStart, pool.PoolName, COUNT(DISTINCT p.VMID) AS CheckedOutVMs
+        FROM Buckets b
+        CROSS JOIN Pools pool
+        LEFT JOIN CheckedOutPeriods p
+            ON p.PoolName = pool.PoolName
+           AND p.SysStartTime < DATEADD(MINUTE, @BucketMinutes, b.BucketStart)
+           AND p.SysEndTime > b.BucketStart
+        GROUP BY b.BucketStart, pool.PoolName
+    ),
+    LoggedDemand AS (
+        -- In-use counts recorded by each scaling run, which also cover periods the history table has been cleaned up for.
+        -- Runs from before pools were introduced covered every VM, which were all in the default pool.
+        SELECT DATEADD(MINUTE, (DATEDIFF(MINUTE, @From, CheckTimestamp) / @BucketMinutes) * @BucketMinutes, @From) AS BucketStart,
+               ISNULL(PoolName, 'default') AS PoolName,
+               MAX(CurrentInUseVMs) AS LoggedInUseVMs
+        FROM dbo.VmScalingActivityLog
+        WHERE CheckTimestamp >= @From
+          AND CheckTimestamp < @To
+        GROUP BY DATEADD(MINUTE, (DATEDIFF(MINUTE, @From, CheckTimestamp) / @BucketMinutes) * @BucketMinutes, @From),
+                 ISNULL(PoolName, 'default')
+    )
+    SELECT c.BucketStart, c.PoolName, c.CheckedOutVMs, l.LoggedInUseVMs
+    FROM CheckedOutDemand c
+    LEFT JOIN LoggedDemand l
+        ON l.BucketStart = c.BucketStart
+       AND l.PoolName = c.PoolName
+    ORDER BY c.PoolName, c.BucketStart;
+END
+GO
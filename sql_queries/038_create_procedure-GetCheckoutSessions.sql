@@ -0,0 +1,43 @@
+CREATE OR ALTER PROCEDURE [dbo].[GetCheckoutSessions]
+    @Days INT = 90,                 -- How many days of history to return
+    @PoolName VARCHAR(64) = NULL    -- Only sessions on VMs in this pool, NULL for every pool
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @From DATETIME2 = DATEADD(DAY, -@Days, SYSUTCDATETIME());
+
+    WITH HeldPeriods AS (
+        -- Every period a VM was held by a user, either checked out or released and waiting to be returned
+        SELECT VMID, Username, VmStatus, SysStartTime, SysEndTime,
+               LAG(SysEndTime) OVER (PARTITION BY VMID ORDER BY SysStartTime) AS PreviousEndTime,
+               LAG(Username) OVER (PARTITION BY VMID ORDER BY SysStartTime) AS PreviousUsername
+        FROM dbo.VirtualMachines FOR SYSTEM_TIME ALL
+        WHERE VmStatus IN ('CheckedOut', 'Released')
+          AND Username IS NOT NULL
+          AND SysEndTime > @From
+          AND (@PoolName IS NULL OR PoolName = @PoolName)
+    ),
+    NumberedPeriods AS (
+        -- Consecutive periods of the same user on the same VM (status, power or network updates) belong to one session
+        SELECT *,
+               SUM(CASE WHEN PreviousEndTime = SysStartTime AND PreviousUsername = Username THEN 0 ELSE 1 END)
+                   OVER (PARTITION BY VMID ORDER BY SysStartTime ROWS UNBOUNDED PRECEDING) AS SessionNumber
+        FROM HeldPeriods
+    ),
+    Sessions AS (
+        SELECT VMID, Username,
+               MIN(SysStartTime) AS CheckedOutAt,
+               COALESCE(MAX(CASE WHEN VmStatus = 'CheckedOut' THEN SysEndTime END), MIN(SysStartTime)) AS ReleasedAt,
+               MAX(SysEndTime) AS ReturnedAt
+        FROM NumberedPeriods
+        GROUP BY VMID, Username, SessionNumber
+    )
+    -- Sessions still in progress have no release or return time yet
+    SELECT VMID, Username, CheckedOutAt,
+           CASE WHEN ReleasedAt < '9999-12-31' THEN ReleasedAt END AS ReleasedAt,
+           CASE WHEN ReturnedAt < '9999-12-31' THEN ReturnedAt END AS ReturnedAt
+    FROM Sessions
+    ORDER BY CheckedOutAt;
+END
+GO
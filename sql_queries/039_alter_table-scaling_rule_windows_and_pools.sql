@@ -0,0 +1,43 @@
+USE linuxbroker;
+
+-- Groups VMs into pools (such as an image or the AVD host group they serve) that are scaled independently.
+IF COL_LENGTH('dbo.VirtualMachines', 'PoolName') IS NULL
+BEGIN
+    ALTER TABLE dbo.VirtualMachines ADD PoolName VARCHAR(64) NOT NULL CONSTRAINT DF_VirtualMachines_PoolName DEFAULT 'default';
+END
+GO
+
+-- Scopes scaling rules to a pool and limits them to a weekly time window, so several rules can coexist.
+-- DaysOfWeek lists ISO weekdays (1 = Monday ... 7 = Sunday); a window that ends before it starts runs past midnight.
+IF COL_LENGTH('dbo.VmScalingRules', 'PoolName') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingRules ADD
+        PoolName VARCHAR(64) NULL,
+        DaysOfWeek VARCHAR(7) NULL,
+        StartTime TIME(0) NULL,
+        EndTime TIME(0) NULL,
+        TimeZone VARCHAR(64) NOT NULL CONSTRAINT DF_VmScalingRules_TimeZone DEFAULT 'UTC',
+        Priority INT NOT NULL CONSTRAINT DF_VmScalingRules_Priority DEFAULT 0;
+END
+GO
+
+IF OBJECT_ID('dbo.CK_VmScalingRules_DaysOfWeek') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingRules
+    ADD CONSTRAINT CK_VmScalingRules_DaysOfWeek CHECK (DaysOfWeek NOT LIKE '%[^1-7]%' AND LEN(DaysOfWeek) > 0);
+END
+GO
+
+IF OBJECT_ID('dbo.CK_VmScalingRules_Window') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingRules
+    ADD CONSTRAINT CK_VmScalingRules_Window CHECK ((StartTime IS NULL AND EndTime IS NULL) OR (StartTime IS NOT NULL AND EndTime IS NOT NULL AND StartTime <> EndTime));
+END
+GO
+
+-- Records which pool and rule each scaling decision was made for.
+IF COL_LENGTH('dbo.VmScalingActivityLog', 'PoolName') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingActivityLog ADD PoolName VARCHAR(64) NULL, RuleID INT NULL;
+END
+GO
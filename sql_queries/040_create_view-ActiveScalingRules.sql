@@ -0,0 +1,47 @@
+CREATE OR ALTER VIEW [dbo].[ActiveScalingRules]
+AS
+    -- The scaling rule in effect for every pool right now, evaluated for all pools in one pass
+    WITH Pools AS (
+        SELECT DISTINCT PoolName
+        FROM dbo.VirtualMachines
+    ),
+    RuleClock AS (
+        -- Local time of each rule, and the ISO weekday (1 = Monday) of today and yesterday. 1900-01-01 was a Monday.
+        SELECT r.*,
+               CAST(CAST(SYSUTCDATETIME() AT TIME ZONE 'UTC' AT TIME ZONE r.TimeZone AS DATETIME2(0)) AS TIME(0)) AS LocalTime,
+               DATEDIFF(DAY, '1900-01-01', CAST(SYSUTCDATETIME() AT TIME ZONE 'UTC' AT TIME ZONE r.TimeZone AS DATE)) % 7 + 1 AS LocalWeekday,
+               (DATEDIFF(DAY, '1900-01-01', CAST(SYSUTCDATETIME() AT TIME ZONE 'UTC' AT TIME ZONE r.TimeZone AS DATE)) + 6) % 7 + 1 AS LocalPreviousWeekday
+        FROM dbo.VmScalingRules r
+    ),
+    OpenRules AS (
+        -- Rules whose window is open. The part of an overnight window after midnight belongs to the day it started on.
+        SELECT *,
+               CASE
+                   WHEN StartTime IS NULL THEN LocalWeekday
+                   WHEN StartTime < EndTime AND LocalTime >= StartTime AND LocalTime < EndTime THEN LocalWeekday
+                   WHEN StartTime > EndTime AND LocalTime >= StartTime THEN LocalWeekday
+                   WHEN StartTime > EndTime AND LocalTime < EndTime THEN LocalPreviousWeekday
+               END AS WindowWeekday
+        FROM RuleClock
+    ),
+    RankedRules AS (
+        -- Pool-specific rules win over rules for every pool, windowed rules over all-day ones, then the highest priority
+        SELECT p.PoolName AS ScopePoolName, r.*,
+               ROW_NUMBER() OVER (
+                   PARTITION BY p.PoolName
+                   ORDER BY CASE WHEN r.PoolName IS NULL THEN 1 ELSE 0 END,
+                            CASE WHEN r.StartTime IS NULL AND r.DaysOfWeek IS NULL THEN 1 ELSE 0 END,
+                            r.Priority DESC,
+                            r.RuleID
+               ) AS RuleRank
+        FROM Pools p
+        INNER JOIN OpenRules r
+            ON (r.PoolName = p.PoolName OR r.PoolName IS NULL)
+           AND r.WindowWeekday IS NOT NULL
+           AND (r.DaysOfWeek IS NULL OR CHARINDEX(CAST(r.WindowWeekday AS CHAR(1)), r.DaysOfWeek) > 0)
+    )
+    SELECT ScopePoolName AS PoolName, RuleID, MinVMs, MaxVMs, ScaleUpRatio, ScaleUpIncrement,
+           ScaleDownRatio, ScaleDownIncrement, DaysOfWeek, StartTime, EndTime, TimeZone, Priority
+    FROM RankedRules
+    WHERE RuleRank = 1;
+GO
@@ -0,0 +1,20 @@
+USE linuxbroker;
+
+-- Records how every scale down stopped its VMs, the policy that picked them, and the estimated savings.
+IF COL_LENGTH('dbo.VmScalingActivityLog', 'ScaleDownAction') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingActivityLog ADD ScaleDownAction VARCHAR(16) NULL;
+END
+GO
+
+IF COL_LENGTH('dbo.VmScalingActivityLog', 'ScaleDownPolicy') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingActivityLog ADD ScaleDownPolicy VARCHAR(16) NULL;
+END
+GO
+
+IF COL_LENGTH('dbo.VmScalingActivityLog', 'EstimatedHourlySavings') IS NULL
+BEGIN
+    ALTER TABLE dbo.VmScalingActivityLog ADD EstimatedHourlySavings DECIMAL(10,2) NULL;
+END
+GO
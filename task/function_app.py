@@ -1,5 +1,7 @@
 import requests
 import logging
+import asyncio
+import time
 import os
 
 import azure.functions as func
@@ -12,6 +14,9 @@ app = func.FunctionApp()
 API_BASE_URL = os.getenv("API_URL")
 API_CLIENT_ID = os.getenv("API_CLIENT_ID")
 API_APP_URI = f"api://{API_CLIENT_ID}"
+PROBE_PORT = int(os.getenv("PROBE_PORT", 22))
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", 50))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 3))
 credential = ManagedIdentityCredential()
 
 def get_access_token():
@@ -32,6 +37,28 @@ def get_headers():
     }
     return headers
 
+async def probe_vm(semaphore, vm_id, ip_address, port, timeout):
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout)
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            return {"VMID": vm_id, "IPAddress": ip_address, "NetworkStatus": "Reachable", "LatencyMs": latency_ms}
+        except asyncio.TimeoutError:
+            return {"VMID": vm_id, "IPAddress": ip_address, "NetworkStatus": "Unreachable", "LatencyMs": None, "Error": f"Timed out after {timeout}s"}
+        except OSError as e:
+            return {"VMID": vm_id, "IPAddress": ip_address, "NetworkStatus": "Unreachable", "LatencyMs": None, "Error": str(e)}
+
+async def probe_vms(vms, port=PROBE_PORT, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    # Opens TCP connections to every VM at once, at most `concurrency` in flight, each bounded by `timeout`
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(probe_vm(semaphore, vm_id, ip_address, port, timeout) for vm_id, ip_address in vms))
+
 # ===============================
 # VM Management Tasks
 # ===============================
@@ -99,7 +126,7 @@ def test_vm_connectivity(mytimer: func.TimerRequest) -> None:
 
         vms = response.json()
 
-        # Iterate over each VM and test connectivity
+        targets = []
         for vm in vms:
             vm_id = vm.get('VMID')
             ip_address = vm.get('IPAddress')
@@ -108,46 +135,70 @@ def test_vm_connectivity(mytimer: func.TimerRequest) -> None:
                 logging.warning(f"No IP address found for VMID: {vm_id}")
                 continue
 
-            # Use os.system to test connectivity to port 22 using curl
-            try:
-                # Command to test port 22 with curl
-                command = f"curl -v telnet://{ip_address}:22 > /dev/null 2>&1"
-                
-                # Execute the command using os.system
-                response_code = os.system(command)
-
-                # Determine network status based on the result of the curl command
-                network_status = 'Reachable' if response_code == 0 else 'Unreachable'
-                logging.info(f"VMID: {vm_id}, IP Address: {ip_address}, Network Status: {network_status}")
-
-            except Exception as e:
-                logging.error(f"Error testing connectivity for VMID: {vm_id}: {str(e)}")
-                network_status = 'Unreachable'
-
-            # Prepare the data for updating VM attributes
-            update_data = {
-                "vmid": vm_id,
-                "powerstate": "null",  # No change to PowerState
-                "networkstatus": network_status,  # Update NetworkStatus
-                "vmstatus": "null"  # No change to VmStatus
-            }
-
-            # Construct the API URL for updating VM attributes
-            update_vm_url = f"{API_BASE_URL}/vms/{vm_id}/update-attributes"
-
-            # Make an HTTP POST request to the API to update the network status
-            response = requests.post(update_vm_url, headers=headers, json=update_data)
-
-            if response.status_code == 200:
-                logging.info(f"Updated network status for VMID: {vm_id} to {network_status}.")
-            else:
-                logging.error(f"Failed to update network status for VMID: {vm_id}. Status code: {response.status_code}")
+            targets.append((vm_id, ip_address))
+
+        # Test connectivity to port 22 on all VMs concurrently
+        started = time.perf_counter()
+        results = asyncio.run(probe_vms(targets))
+        reachable = [result for result in results if result["NetworkStatus"] == "Reachable"]
+        latencies = sorted(result["LatencyMs"] for result in reachable)
+        logging.info(
+            f"Probed {len(results)} VMs in {time.perf_counter() - started:.1f}s: {len(reachable)} reachable, "
+            f"{len(results) - len(reachable)} unreachable"
+            + (f", median latency {latencies[len(latencies) // 2]} ms, max {latencies[-1]} ms." if latencies else ".")
+        )
+
+        for result in results:
+            logging.info(f"VMID: {result['VMID']}, IP Address: {result['IPAddress']}, Network Status: {result['NetworkStatus']}, Latency: {result['LatencyMs']} ms" + (f", Error: {result['Error']}" if result.get('Error') else ""))
+
+        if not results:
+            logging.info('TestVMConnectivity function completed.')
+            return
+
+        # Update the network status of every VM in one call; only VMs whose status changed are written
+        update_data = [{"vmid": result["VMID"], "networkstatus": result["NetworkStatus"]} for result in results]
+        response = requests.post(f"{API_BASE_URL}/vms/update-attributes", headers=headers, json=update_data)
+
+        if response.status_code == 200:
+            summary = response.json()
+            logging.info(f"Network status updated for {summary['Updated']} VMs, unchanged for {summary['Unchanged']}, not found for {summary['NotFound']}.")
+        else:
+            logging.error(f"Failed to update network status. Status code: {response.status_code}, Response: {response.text}")
 
         logging.info('TestVMConnectivity function completed.')
 
     except Exception as e:
         logging.error(f"Error executing TestVMConnectivity function: {str(e)}")
 
+@app.function_name(name="ReconcileVMPowerStates")
+@app.timer_trigger(schedule="0 */10 * * * *",  # Every 10 minutes
+              arg_name="mytimer", run_on_startup=True)
+def reconcile_vm_power_states(mytimer: func.TimerRequest) -> None:
+    logging.info('Running scheduled power state reconciliation.')
+    if mytimer.past_due:
+        logging.info('The timer is past due!')
+
+    try:
+        if not API_BASE_URL:
+            logging.error("API_URL not set in environment variables.")
+            return
+
+        headers = get_headers()
+        if headers is None:
+            return
+
+        reconcile_url = f"{API_BASE_URL}/vms/reconcile"
+
+        response = requests.post(reconcile_url, headers=headers)
+
+        if response.status_code == 200:
+            result = response.json()
+            logging.info(f"Power state reconciliation completed. Azure VMs: {result.get('AzureVMs')}, corrections: {result.get('Drift')}, missing in Azure: {len(result.get('MissingInAzure', []))}.")
+        else:
+            logging.error(f"Failed to reconcile power states. Status code: {response.status_code}. Response: {response.text}")
+
+    except Exception as e:
+        logging.error(f"Error executing power state reconciliation: {str(e)}")
 
 # ===============================
 # Scaling Tasks